@@ -0,0 +1,201 @@
+"""
+HTTP service for BuildIt PL, sharing rag.pipeline and document_analysis with the Streamlit app.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+The Chroma store, both RAG chains and the analysis graph are loaded once at startup in the
+background; /readyz reports 503 until they are warm. At most API_MAX_INFLIGHT requests run
+at a time — anything beyond that gets 429 with Retry-After instead of queueing.
+
+  POST /ask      {"question": "...", "premium": null, "session_id": null, "stream": true}
+                 -> application/x-ndjson: {"token": "..."} lines, then {"done": true, ...metadata}
+  POST /analyze  multipart PDF upload -> analysis report JSON
+  GET  /healthz  liveness
+  GET  /readyz   readiness (store warm)
+  GET  /metrics  Prometheus text: span latency quantiles, token and cache counters (TRACING_ENABLED)
+"""
+import asyncio, json, logging, time
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool
+from ingestion.loader import load_vector_store
+from ingestion.snapshot import installed
+from rag.pipeline import ask_stream, build_rag_chain
+from rag.router import route_query
+from document_analysis.analyzer import analyze_pages_async, cached_report, get_analysis_graph, store_report
+from document_analysis.extractor import extract_pages_from_pdf
+from utils import tracing
+import config
+
+logger = logging.getLogger(__name__)
+
+_state = {"ready": False, "error": None, "chains": {}, "started": time.time(), "in_flight": 0,
+          "kb_snapshot": None}
+_inflight = None  # asyncio.Semaphore, created inside the running loop
+
+def _warm():
+    vector_store = load_vector_store()
+    _state["kb_snapshot"] = (installed() or {}).get("version")
+    _state["chains"] = {premium: build_rag_chain(premium, vector_store=vector_store)
+                        for premium in (False, True)}
+    get_analysis_graph()
+
+async def _warm_in_background():
+    t0 = time.perf_counter()
+    try:
+        await asyncio.to_thread(_warm)
+        _state["ready"] = True
+        logger.info("store warm in %.2fs", time.perf_counter() - t0)
+    except Exception as e:
+        _state["error"] = repr(e)
+        logger.exception("warm-up failed")
+
+@asynccontextmanager
+async def lifespan(app):
+    global _inflight
+    _inflight = asyncio.Semaphore(config.API_MAX_INFLIGHT)
+    warmup = asyncio.create_task(_warm_in_background())
+    yield
+    warmup.cancel()
+
+app = FastAPI(title="BuildIt PL", lifespan=lifespan)
+
+# ── Backpressure ──────────────────────────────────────────────────────────
+async def _acquire_slot():
+    if not _state["ready"]:
+        raise HTTPException(503, "Knowledge base is still loading", headers={"Retry-After": "5"})
+    if _inflight.locked():
+        raise HTTPException(429, "Too many requests in flight", headers={"Retry-After": "1"})
+    await _inflight.acquire()
+    _state["in_flight"] += 1
+
+def _release_slot():
+    _state["in_flight"] -= 1
+    _inflight.release()
+
+class _SlotStreamingResponse(StreamingResponse):
+    """Releases the request's slot however the response ends, even if the body is never iterated."""
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            _release_slot()
+
+# ── Upload limit ──────────────────────────────────────────────────────────
+MULTIPART_OVERHEAD = 64 * 1024  # boundaries and part headers around the PDF
+
+def _max_upload_bytes() -> int:
+    return int(config.API_MAX_UPLOAD_MB * 1024 * 1024)
+
+def _too_large() -> HTTPException:
+    return HTTPException(413, f"PDF larger than {config.API_MAX_UPLOAD_MB} MB")
+
+class _UploadLimit:
+    """
+    Refuses an oversized /analyze body while it is received: up front from Content-Length,
+    otherwise (chunked uploads) by counting the bytes before Starlette spools them to disk.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != "/analyze":
+            return await self.app(scope, receive, send)
+        limit = _max_upload_bytes() + MULTIPART_OVERHEAD
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            response = JSONResponse({"detail": _too_large().detail}, status_code=413)
+            return await response(scope, receive, send)
+        received = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _too_large()  # re-raised by body parsing, answered as a 413
+            return message
+
+        await self.app(scope, counting_receive, send)
+
+app.add_middleware(_UploadLimit)
+
+# ── Endpoints ─────────────────────────────────────────────────────────────
+class AskRequest(BaseModel):
+    question: str
+    premium: Optional[bool] = None  # None = let rag.router pick the model
+    session_id: Optional[str] = None
+    stream: bool = True
+
+@app.post("/ask")
+async def ask_endpoint(req: AskRequest):
+    if not req.question.strip():
+        raise HTTPException(422, "question must not be empty")
+    await _acquire_slot()
+    embedding = None
+    if req.premium is None:
+        try:
+            route = await asyncio.to_thread(route_query, req.question, None, req.session_id)
+        except BaseException:
+            _release_slot()
+            raise
+        premium, embedding = route.premium, route.embedding
+    else:
+        premium = req.premium
+    chain_tuple = _state["chains"][premium]
+    parts = ask_stream(chain_tuple, req.question, chain_tuple[2], session_id=req.session_id,
+                       embedding=embedding)
+
+    if not req.stream:
+        try:
+            items = await asyncio.to_thread(list, parts)
+        finally:
+            _release_slot()
+        *tokens, meta = items
+        return {"answer": "".join(tokens), **meta}
+
+    async def ndjson():
+        async for part in iterate_in_threadpool(parts):
+            line = {"done": True, **part} if isinstance(part, dict) else {"token": part}
+            yield json.dumps(line) + "\n"
+
+    return _SlotStreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.post("/analyze")
+async def analyze_endpoint(file: UploadFile = File(...)):
+    if not (file.filename or "").lower().endswith(".pdf"):
+        raise HTTPException(415, "Upload a PDF")
+    await _acquire_slot()
+    try:
+        data = await file.read(_max_upload_bytes() + 1)  # the file part alone, without multipart overhead
+        if len(data) > _max_upload_bytes():
+            raise _too_large()
+        key, report = cached_report(data, file.filename)
+        if report is not None:
+            return report
+        try:
+            pages = await asyncio.to_thread(extract_pages_from_pdf, data)
+        except Exception as e:
+            raise HTTPException(422, f"Could not read file: {e}")
+        return store_report(key, await analyze_pages_async(pages, file.filename))
+    finally:
+        _release_slot()
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok", "uptime_s": round(time.time() - _state["started"], 1)}
+
+@app.get("/readyz")
+async def readyz():
+    body = {"ready": _state["ready"], "store_warm": _state["ready"], "error": _state["error"],
+            "in_flight": _state["in_flight"],
+            "max_in_flight": config.API_MAX_INFLIGHT, "kb_snapshot": _state["kb_snapshot"]}
+    return JSONResponse(body, status_code=200 if _state["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(tracing.prometheus_text(), media_type="text/plain; version=0.0.4")
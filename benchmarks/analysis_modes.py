@@ -0,0 +1,65 @@
+"""
+Document analysis cost per mode: three parallel prompts ("graph") vs. one structured call.
+
+    python -m benchmarks.analysis_modes                      # offline fakes, SHORT_CONTRACT
+    python -m benchmarks.analysis_modes --pdf umowa.pdf --live --runs 3
+
+For each ANALYSIS_MODE the same document is analyzed --runs times; reported per analysis:
+LLM calls, input/output tokens, wall time and the number of risks and missing items found.
+Offline runs use benchmarks/fakes.py, whose token counts approximate 4 characters per token,
+so compare modes with each other, not with an invoice. --live calls the configured OpenAI model.
+"""
+import argparse, json, statistics, tempfile, time, os
+from langchain_core.callbacks import BaseCallbackHandler
+from benchmarks import fakes
+from benchmarks.suite import SHORT_CONTRACT
+import config
+
+MODES = ["graph", "structured"]
+
+class _Usage(BaseCallbackHandler):
+    def __init__(self):
+        self.calls, self.input_tokens, self.output_tokens = 0, 0, 0
+
+    def on_llm_end(self, response, **kwargs):
+        self.calls += 1
+        for generation in (g for gs in response.generations for g in gs):
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            self.input_tokens  += usage.get("input_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+
+def measure(mode: str, pages: list, runs: int) -> dict:
+    from document_analysis.analyzer import get_analysis_graph, _pages_state
+    graph = get_analysis_graph(mode)
+    usage, times, report = _Usage(), [], None
+    for _ in range(runs):
+        t = time.perf_counter()
+        report = graph.invoke(_pages_state(pages, "benchmark.pdf"), config={"callbacks": [usage]})["report"]
+        times.append((time.perf_counter() - t) * 1000)
+    return {"mode": mode, "llm_calls": usage.calls / runs,
+            "input_tokens": round(usage.input_tokens / runs), "output_tokens": round(usage.output_tokens / runs),
+            "wall_p50_ms": round(statistics.median(times), 1),
+            "risks": report["total_risks"], "missing_items": len(report["missing_items"])}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pdf", help="analyze this PDF instead of the built-in short contract")
+    parser.add_argument("--live", action="store_true", help="call the real model (needs OPENAI_API_KEY)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    args = parser.parse_args()
+
+    config.ANALYSIS_CACHE_DIR = os.path.join(tempfile.mkdtemp(prefix="buildit-modes-"), "analysis")
+    meta = {"live": args.live, "runs": args.runs}
+    if not args.live:
+        meta.update(fakes.install(llm_latency_s=args.llm_latency_ms / 1000))
+    if args.pdf:
+        from document_analysis.extractor import extract_pages_from_pdf
+        pages = extract_pages_from_pdf(args.pdf)
+    else:
+        pages = [{"page": 1, "text": SHORT_CONTRACT}]
+    from document_analysis.analyzer import _pages_state
+    # In the app a long document always takes map-reduce; here both modes see the same state
+    meta["long_document"] = bool(_pages_state(pages, "benchmark.pdf")["chunks"])
+    print(json.dumps({"meta": meta, "results": [measure(m, pages, args.runs) for m in args.modes]}, indent=2))
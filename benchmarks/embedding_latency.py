@@ -0,0 +1,58 @@
+"""
+Query-embedding latency: OpenAI API vs. local sentence-transformers on CPU.
+
+    python -m benchmarks.embedding_latency --runs 50
+
+Backends that cannot start here (no API key, sentence-transformers not installed) are
+reported as skipped. The embedding cache is bypassed so every call is a real embedding.
+"""
+import argparse, json, statistics, time
+import config
+
+QUERIES = [
+    "What permits do I need to build a 120m² house in Masovia?",
+    "Can I renovate without a permit if changes are internal only?",
+    "What is MPZP and why does it matter for my plot?",
+    "How long does a building permit take in Poland?",
+    "Czy potrzebuję pozwolenia na budowę garażu?",
+    "Art. 29 ust. 2 zgłoszenie robót budowlanych",
+]
+
+def _backend(name):
+    if name == "local":
+        from ingestion.local_embeddings import LocalEmbeddings
+        return LocalEmbeddings()
+    from langchain_openai import OpenAIEmbeddings
+    if not config.OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY not set")
+    return OpenAIEmbeddings(model=config.EMBEDDING_MODEL, openai_api_key=config.OPENAI_API_KEY)
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def bench(name, runs):
+    t0 = time.perf_counter()
+    try:
+        embeddings = _backend(name)
+        embeddings.embed_query("warm-up")
+    except Exception as e:
+        return {"backend": name, "skipped": repr(e)}
+    load_s = time.perf_counter() - t0
+    latencies = []
+    for i in range(runs):
+        t = time.perf_counter()
+        embeddings.embed_query(QUERIES[i % len(QUERIES)])
+        latencies.append((time.perf_counter() - t) * 1000)
+    return {"backend": name, "runs": runs, "load_s": round(load_s, 2),
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(_percentile(latencies, 0.95), 2),
+            "mean_ms": round(statistics.mean(latencies), 2),
+            "dim": len(embeddings.embed_query(QUERIES[0]))}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--backends", nargs="+", default=["openai", "local"])
+    args = parser.parse_args()
+    print(json.dumps([bench(name, args.runs) for name in args.backends], indent=2))
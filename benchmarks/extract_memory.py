@@ -0,0 +1,101 @@
+"""
+Peak memory of PDF extraction: the old read-everything path vs. extractor.iter_pages.
+
+    python -m benchmarks.extract_memory                      # synthetic 150- and 400-page scans
+    python -m benchmarks.extract_memory --pdf a.pdf b.pdf
+
+Every (file, mode) pair runs in a fresh interpreter and reports the growth of peak RSS
+(VmHWM) over the interpreter's footprint after imports, plus wall time. Synthetic
+documents mimic scanned annexes: one incompressible grayscale image and a text layer per page.
+
+Modes:
+  eager_text    old extract_text: read() all bytes, every page's text, join, slice
+  eager_pages   old extract_pages_from_pdf: read() all bytes, every page's text in a list
+  stream_pages  list(iter_pages(path)) up to EXTRACT_MAX_TOKENS, page cache off
+  stream_text   extract_text_from_pdf(file object): stops once MAX_CHARS is reached
+  cached_pages  list(iter_pages(path)) served from the page-text cache
+"""
+import argparse, json, os, resource, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ["eager_text", "eager_pages", "stream_pages", "stream_text", "cached_pages"]
+
+def make_scan_pdf(path: str, pages: int, px: int = 900):
+    import fitz
+    import numpy as np
+    rng = np.random.default_rng(0)
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        noise = rng.integers(0, 256, size=(px * 4 // 3, px), dtype=np.uint8)
+        pix = fitz.Pixmap(fitz.csGRAY, px, px * 4 // 3, noise.tobytes(), False)
+        page.insert_image(page.rect, pixmap=pix)
+        page.insert_text((72, 72), f"Aneks nr {n + 1}. " + "Wykonawca zobowiązuje się do " * 40)
+    doc.save(path)
+    doc.close()
+
+def _peak_mb() -> float:
+    # VmHWM starts fresh at exec; ru_maxrss would carry over this (parent) process's peak
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(l.split()[1]) for l in f if l.startswith("VmHWM")) / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def worker(mode: str, path: str) -> dict:
+    import fitz
+    import config
+    from benchmarks.fakes import offline_tokenizer
+    from document_analysis import extractor
+    offline_tokenizer()  # the page walk counts tokens; works without the tiktoken download
+    config.EXTRACT_PAGE_CACHE = mode == "cached_pages"
+    if mode == "cached_pages":
+        list(extractor.iter_pages(path))  # populate the cache first
+    base = _peak_mb()
+    t = time.perf_counter()
+    if mode in ("eager_text", "eager_pages"):
+        with open(path, "rb") as f:
+            data = f.read()
+        doc = fitz.open(stream=data, filetype="pdf")
+        texts = [page.get_text() for page in doc]
+        doc.close()
+        if mode == "eager_text":
+            raw = "\n".join(texts).strip()[:extractor.MAX_CHARS]
+        n_pages = len(texts)
+    elif mode == "stream_text":
+        with open(path, "rb") as f:
+            raw = extractor.extract_text_from_pdf(f)
+        n_pages = None
+    else:
+        n_pages = len(list(extractor.iter_pages(path)))
+    return {"mode": mode, "pages_read": n_pages, "wall_ms": round((time.perf_counter() - t) * 1000, 1),
+            "peak_rss_growth_mb": round(_peak_mb() - base, 1)}
+
+def run(path: str, mode: str, cache_dir: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    code = ("import json, sys, config; config.ANALYSIS_CACHE_DIR = sys.argv[3]; "
+            "from benchmarks.extract_memory import worker; print(json.dumps(worker(sys.argv[1], sys.argv[2])))")
+    proc = subprocess.run([sys.executable, "-c", code, mode, path, cache_dir],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode:
+        return {"mode": mode, "error": proc.stderr.strip().splitlines()[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pdf", nargs="*", help="PDFs to measure instead of synthetic scans")
+    parser.add_argument("--pages", nargs="+", type=int, default=[150, 400], help="synthetic page counts")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="buildit-extract-")
+    paths = args.pdf or []
+    if not paths:
+        for n in args.pages:
+            paths.append(os.path.join(work, f"scan_{n}p.pdf"))
+            make_scan_pdf(paths[-1], n)
+    results = []
+    for path in paths:
+        results.append({"file": os.path.basename(path), "size_mb": round(os.path.getsize(path) / 2**20, 1),
+                        "runs": [run(path, mode, os.path.join(work, "cache")) for mode in args.modes]})
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,132 @@
+"""
+Deterministic offline stand-ins for the OpenAI chat and embedding models, used by the
+benchmark suite. Latencies are configurable so the numbers resemble a real deployment
+while staying reproducible. install() patches the modules that construct the clients.
+"""
+import hashlib, json, re, time
+from typing import Any, Iterator, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Parses as a summary, as risks (analyzer._parse_risks), as a checklist and as a chat answer
+RESPONSE = """This is a construction contract between an investor and a contractor for a single-family house.
+
+RISK: Contractor may extend the completion date without penalty
+WHY: The investor has no remedy for delays caused by the contractor
+SEVERITY: HIGH
+PAGE: 1
+
+RISK: Payment due before acceptance of works
+WHY: Money is paid before defects can be found
+SEVERITY: MEDIUM
+
+COVERED: 1, 3, 4
+UNCLEAR: Warranty period is not stated in months
+1. Dispute resolution court is not named
+2. Contractor license number is missing"""
+
+# The same findings as a structured-output (response_format=json_schema) reply
+RESPONSE_JSON = json.dumps({
+    "summary": RESPONSE.split("\n", 1)[0],
+    "risks": [{"description": "Contractor may extend the completion date without penalty",
+               "explanation": "The investor has no remedy for delays caused by the contractor",
+               "severity": "HIGH"},
+              {"description": "Payment due before acceptance of works",
+               "explanation": "Money is paid before defects can be found", "severity": "MEDIUM"}],
+    "missing_items": ["Warranty period is not stated in months", "Dispute resolution court is not named",
+                      "Contractor license number is missing"],
+})
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+class FakeChatModel(BaseChatModel):
+    model_name: str = "gpt-4o-mini"
+    response: str = RESPONSE
+    latency_s: float = 0.0        # before the first token
+    token_latency_s: float = 0.0  # between streamed tokens
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _usage(self, messages: List[BaseMessage], response: str = None) -> dict:
+        prompt = sum(_approx_tokens(str(m.content)) for m in messages)
+        output = _approx_tokens(response or self.response)
+        return {"input_tokens": prompt, "output_tokens": output, "total_tokens": prompt + output}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs) -> ChatResult:
+        response = RESPONSE_JSON if kwargs.get("response_format") else self.response
+        time.sleep(self.latency_s + self.token_latency_s * len(response.split()))
+        message = AIMessage(content=response, usage_metadata=self._usage(messages, response))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_s)
+        for token in re.findall(r"\S+\s*", self.response):
+            time.sleep(self.token_latency_s)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages)))
+
+class FakeEmbeddings(Embeddings):
+    """Unit vectors seeded by the text hash: identical texts always embed identically."""
+    def __init__(self, size: int = 1536, latency_s: float = 0.0):
+        self.size, self.latency_s = size, latency_s
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(self.size)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_s)  # one API round trip per batch
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_s)
+        return self._vector(text)
+
+class _ApproxEncoding:
+    """~4 characters per token, like the real BPE on English text; decode() round-trips."""
+    name = "approx"
+    def encode(self, text: str, **kwargs) -> list:
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens: list) -> str:
+        return "".join(tokens)
+
+def offline_tokenizer() -> str:
+    """Use tiktoken if its encodings are cached locally, else a 4-characters-per-token approximation."""
+    import tiktoken
+    try:
+        tiktoken.get_encoding("o200k_base")
+        tiktoken.get_encoding("cl100k_base")
+        return "tiktoken"
+    except Exception:
+        encoding = _ApproxEncoding()
+        tiktoken.get_encoding = lambda name: encoding
+        tiktoken.encoding_for_model = lambda model: encoding
+        return "approx"
+
+def install(llm_latency_s: float = 0.0, token_latency_s: float = 0.0, embed_latency_s: float = 0.0) -> dict:
+    """Route every chat/embedding client the app builds to the fakes."""
+    import config
+    import ingestion.loader as loader
+    import rag.pipeline as pipeline
+    import document_analysis.analyzer as analyzer
+
+    def chat(model: str = "gpt-4o-mini", **kwargs):
+        return FakeChatModel(model_name=model, latency_s=llm_latency_s, token_latency_s=token_latency_s)
+
+    config.EMBEDDING_BACKEND = "openai"
+    pipeline.ChatOpenAI = chat
+    analyzer.ChatOpenAI = chat
+    analyzer._llm.cache_clear()
+    loader.OpenAIEmbeddings = lambda **kwargs: FakeEmbeddings(latency_s=embed_latency_s)
+    loader._embeddings = None
+    return {"tokenizer": offline_tokenizer()}
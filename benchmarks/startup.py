@@ -0,0 +1,67 @@
+"""
+Cold-start profile: import time per module and time to first render of the Streamlit app.
+
+    python -m benchmarks.startup                 # entry points + the 15 slowest packages
+    python -m benchmarks.startup --top 30 --no-app
+
+Each entry module is imported in a fresh interpreter with `python -X importtime`, so the
+numbers are cold (no modules already loaded). "First render" runs streamlit_app.py once
+through streamlit.testing.AppTest in a fresh interpreter and reports its wall time.
+"""
+import argparse, json, os, re, subprocess, sys, time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_MODULES = [
+    "config",
+    "utils.session_manager",
+    "utils.cost_tracker",
+    "rag.pipeline",
+    "ingestion.loader",
+    "document_analysis.analyzer",
+    "document_analysis.report_generator",
+    "api",
+]
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+def import_profile(module: str) -> dict:
+    """Cumulative import time (ms) of `module` and of every top-level package it pulls in."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode:
+        return {"module": module, "error": proc.stderr.strip().splitlines()[-1]}
+    packages = defaultdict(float)
+    total_ms = 0.0
+    for self_us, cumulative_us, indent, name in _LINE.findall(proc.stderr):
+        packages[name.split(".")[0]] += int(self_us) / 1000
+        if name == module:
+            total_ms = int(cumulative_us) / 1000
+    return {"module": module, "total_ms": round(total_ms, 1),
+            "packages": {k: round(v, 1) for k, v in packages.items()}}
+
+def first_render_ms() -> float:
+    code = ("import time; from streamlit.testing.v1 import AppTest; t = time.perf_counter(); "
+            "at = AppTest.from_file('streamlit_app.py', default_timeout=120); at.run(); "
+            "print((time.perf_counter() - t) * 1000)")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    return round(float(proc.stdout.strip().splitlines()[-1]), 1) if proc.returncode == 0 else None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=ENTRY_MODULES)
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level packages to list")
+    parser.add_argument("--no-app", action="store_true", help="skip the Streamlit first-render run")
+    args = parser.parse_args()
+
+    profiles = [import_profile(m) for m in args.modules]
+    slowest = defaultdict(float)
+    for p in profiles:
+        for package, ms in p.pop("packages", {}).items():
+            slowest[package] = max(slowest[package], ms)
+    result = {"entry_modules": profiles,
+              "slowest_packages_ms": dict(sorted(slowest.items(), key=lambda kv: -kv[1])[:args.top])}
+    if not args.no_app:
+        result["streamlit_first_render_ms"] = first_render_ms()
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,194 @@
+"""
+Offline benchmark suite for the RAG and analysis hot paths.
+
+    python -m benchmarks.suite --save-baseline                   # record a baseline (do this first)
+    python -m benchmarks.suite --out bench.json                  # compare with benchmarks/baseline.json
+    python -m benchmarks.suite --llm-latency-ms 400 --threshold 0.15
+
+Timings depend on the machine, so no baseline is committed: record one with --save-baseline
+on the machine (or CI runner) that will run the comparison, from the commit to compare against.
+
+No network is needed: chat and embedding models are replaced by the deterministic fakes in
+benchmarks/fakes.py (with configurable latency) and the vector store is built from
+knowledge_base/ into a temporary directory. Every store the app writes to (Chroma, usage log,
+sessions, caches) is redirected there as well.
+
+Measured: ingestion throughput, ask() stage timings (embed, search, BM25, prompt packing,
+LLM, total), analysis end-to-end for a short and a long (map-reduce) document, session
+history reads/writes per second under concurrency, and PDF report rendering.
+Metrics ending in "_per_s" are better when higher, all others when lower. The process exits
+with status 1 if any metric regresses by more than --threshold against the baseline, and
+with status 2, before running anything, if there is no baseline and --save-baseline is not set.
+"""
+import argparse, glob, json, os, platform, statistics, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import fakes
+from benchmarks.embedding_latency import QUERIES, _percentile
+import config
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+SHORT_CONTRACT = """UMOWA O ROBOTY BUDOWLANE
+§ 1. Wykonawca zobowiązuje się wybudować dom jednorodzinny zgodnie z projektem.
+§ 2. Termin zakończenia robót: 30 września. Wykonawca może przesunąć termin bez kar.
+§ 3. Wynagrodzenie ryczałtowe 650 000 zł płatne z góry w dwóch ratach.
+§ 4. Spory rozstrzyga sąd właściwy dla siedziby Wykonawcy.
+"""
+
+def _timed(fn, runs: int) -> list:
+    """Wall times of `runs` calls, in milliseconds."""
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    return times
+
+def _summary(prefix: str, values_ms: list) -> dict:
+    return {f"{prefix}_p50_ms": round(statistics.median(values_ms), 3),
+            f"{prefix}_p95_ms": round(_percentile(values_ms, 0.95), 3)}
+
+# ── Benchmarks ────────────────────────────────────────────────────────────
+def bench_ingest() -> dict:
+    from ingestion.loader import ingest
+    t = time.perf_counter()
+    summary = ingest(incremental=False)
+    wall_s = time.perf_counter() - t
+    return {"ingest_wall_ms": round(wall_s * 1000, 1),
+            "ingest_pages_per_s": round(summary["pages"] / wall_s, 1),
+            "ingest_chunks_per_s": round(summary["chunks_added"] / wall_s, 1)}
+
+def bench_ask(runs: int) -> dict:
+    from ingestion.loader import load_vector_store
+    from rag.pipeline import ask, build_rag_chain
+    chain_tuple = build_rag_chain(False, vector_store=load_vector_store())
+    ask(chain_tuple, "warm-up", chain_tuple[2])
+    stages = {}
+    for i in range(runs):
+        result = ask(chain_tuple, QUERIES[i % len(QUERIES)], chain_tuple[2])
+        for stage, seconds in result["timings"].items():
+            stages.setdefault(stage.removesuffix("_s"), []).append(seconds * 1000)
+    metrics = {}
+    for stage, values in sorted(stages.items()):
+        metrics.update(_summary(f"ask_{stage}", values))
+    return metrics
+
+def _kb_pages() -> list:
+    from document_analysis.extractor import extract_pages_from_pdf
+    path = sorted(glob.glob(os.path.join(config.KNOWLEDGE_BASE_DIR, "**", "*.pdf"), recursive=True))[0]
+    with open(path, "rb") as f:
+        return extract_pages_from_pdf(f.read())
+
+def bench_analyze(runs: int) -> dict:
+    from document_analysis.analyzer import analyze_document, analyze_pages
+    pages = _kb_pages()
+    metrics = _summary("analyze_short", _timed(lambda: analyze_document(SHORT_CONTRACT, "short.pdf"), runs))
+    metrics.update(_summary("analyze_long", _timed(lambda: analyze_pages(pages, "long.pdf"), max(1, runs // 2))))
+    metrics["analyze_long_pages"] = len(pages)
+    return metrics
+
+def bench_sessions(threads: int, ops: int) -> dict:
+    """`threads` concurrent clients; all write their history first, then all read it back."""
+    from utils import session_manager as sm
+
+    def writer(n):
+        for i in range(ops):
+            sm.save_messages(f"bench-{n}", [("user", f"question {i}"), ("assistant", f"answer {i}")])
+
+    def reader(n):
+        for _ in range(ops):
+            sm.load_history(f"bench-{n}")
+
+    metrics = {}
+    for name, fn in (("writes", writer), ("reads", reader)):
+        t = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(fn, range(threads)))
+        metrics[f"session_{name}_per_s"] = round(threads * ops / (time.perf_counter() - t), 1)
+    return metrics
+
+def bench_pdf_report(runs: int) -> dict:
+    from document_analysis.analyzer import analyze_document
+    from document_analysis.report_generator import generate_pdf_report
+    report = analyze_document(SHORT_CONTRACT, "short.pdf")
+    return _summary("pdf_report", _timed(lambda: generate_pdf_report(report), runs))
+
+# ── Baseline comparison ───────────────────────────────────────────────────
+def compare(metrics: dict, baseline: dict, threshold: float) -> list:
+    """Metrics that got worse than the baseline by more than `threshold` (relative)."""
+    regressions = []
+    for name, base in baseline.items():
+        value = metrics.get(name)
+        if value is None or not base or name.endswith("_pages"):
+            continue
+        change = (base - value) / base if name.endswith("_per_s") else (value - base) / base
+        if change > threshold:
+            regressions.append({"metric": name, "baseline": base, "current": value,
+                                "worse_by": f"{change:.0%}"})
+    return regressions
+
+def run(args) -> dict:
+    work = tempfile.mkdtemp(prefix="buildit-bench-")
+    config.CHROMA_PERSIST_DIR      = os.path.join(work, "chroma_store")
+    config.ANALYSIS_CACHE_DIR      = os.path.join(work, "analysis")
+    config.EMBEDDING_CACHE_ENABLED = False  # every call should pay the (fake) embedding cost
+    config.ANSWER_CACHE_ENABLED    = False
+    from utils import cost_tracker, session_manager
+    cost_tracker.DB_FILE    = os.path.join(work, "usage.db")
+    session_manager.DB_PATH = os.path.join(work, "sessions.db")
+    env = fakes.install(llm_latency_s=args.llm_latency_ms / 1000,
+                        token_latency_s=args.token_latency_ms / 1000,
+                        embed_latency_s=args.embed_latency_ms / 1000)
+
+    metrics = {}
+    steps = [("ingest", bench_ingest),
+             ("ask", lambda: bench_ask(args.runs)),
+             ("analyze", lambda: bench_analyze(max(1, args.runs // 4))),
+             ("sessions", lambda: bench_sessions(args.threads, args.session_ops)),
+             ("pdf_report", lambda: bench_pdf_report(args.runs))]
+    for name, step in steps:
+        print(f"  running {name}...", file=sys.stderr)
+        metrics.update(step())
+    return {"meta": {"python": platform.python_version(), "machine": platform.machine(),
+                     "cpus": os.cpu_count(), "runs": args.runs, "llm_latency_ms": args.llm_latency_ms,
+                     "token_latency_ms": args.token_latency_ms,
+                     "embed_latency_ms": args.embed_latency_ms, **env},
+            "metrics": metrics}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--token-latency-ms", type=float, default=1)
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--threads", type=int, default=8, help="concurrent session_manager clients")
+    parser.add_argument("--session-ops", type=int, default=200, help="write+read pairs per client")
+    parser.add_argument("--out", help="write the results JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        parser.exit(2, f"No baseline at {args.baseline}, so there is nothing to compare against.\n"
+                       f"Record one first with `python -m benchmarks.suite --save-baseline` "
+                       f"(on this machine, from the commit to compare against).\n")
+
+    result = run(args)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = [k for k in ("runs", "llm_latency_ms", "token_latency_ms", "embed_latency_ms", "tokenizer")
+                   if baseline["meta"].get(k) != result["meta"].get(k)]
+        if changed:
+            print(f"Warning: baseline was recorded with different settings: {', '.join(changed)}", file=sys.stderr)
+        result["regressions"] = compare(result["metrics"], baseline["metrics"], args.threshold)
+    print(json.dumps(result, indent=2))
+    if result.get("regressions"):
+        sys.exit(1)
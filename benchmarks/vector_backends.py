@@ -0,0 +1,154 @@
+"""
+Vector search backends: Chroma (HNSW) vs. the memory-mapped NumPy index, float32 and float16.
+
+    python -m benchmarks.vector_backends                       # the repo's store + a 20k synthetic one
+    python -m benchmarks.vector_backends --synthetic 50000 --workers 8 --queries 500
+
+For every store and backend, --workers processes open the store, run the same queries and
+then report memory together, while all of them are still alive:
+  open_ms        time to open the store (client, files, first query)
+  p50_ms/p95_ms  per-query search latency, top --k
+  recall_at_k    overlap with exact float64 search
+  rss_mb         resident memory growth per worker after opening and querying
+  pss_total_mb   growth of the proportional set size, summed over the workers; pages shared
+                 between the processes (the page cache behind a memory map) count once in total
+Queries are stored vectors plus noise, so their neighbourhoods are realistic without an
+embedding API. Synthetic stores are clustered unit vectors with the repo's dimensionality.
+"""
+import argparse, json, os, shutil, statistics, subprocess, sys, tempfile, time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ["chroma", "numpy_float32", "numpy_float16"]
+
+def _proc_mb(field: str, path: str = "/proc/self/status") -> float:
+    try:
+        with open(path) as f:
+            return next(int(l.split()[1]) for l in f if l.startswith(field)) / 1024
+    except (OSError, StopIteration):
+        return float("nan")
+
+# ── Stores ────────────────────────────────────────────────────────────────
+def synthetic_store(path: str, n: int, dim: int = 1536, clusters: int = 64):
+    import chromadb
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((clusters, dim))
+    client = chromadb.PersistentClient(path=path)
+    collection = client.get_or_create_collection("langchain")
+    for start in range(0, n, 4096):
+        m = min(4096, n - start)
+        v = centers[rng.integers(0, clusters, m)] + 0.8 * rng.standard_normal((m, dim))
+        v /= np.linalg.norm(v, axis=1, keepdims=True)
+        collection.add(ids=[f"syn-{i:07d}" for i in range(start, start + m)], embeddings=v.tolist(),
+                       documents=[f"synthetic chunk {i}" for i in range(start, start + m)],
+                       metadatas=[{"source": "synthetic", "page": i} for i in range(start, start + m)])
+
+def prepare(store: str, n_queries: int, k: int):
+    """Export both NumPy dtypes next to the store, write the queries and the exact top-k ids."""
+    import config
+    from benchmarks import fakes
+    from ingestion import numpy_store
+    from ingestion.loader import _open_store
+    fakes.install()
+    config.CHROMA_PERSIST_DIR = store
+    vs = _open_store()
+    for dtype in ("float32", "float16"):
+        numpy_store.export(vs, dtype=dtype, path=os.path.join(store, f"numpy_{dtype}"))
+    data = vs._collection.get(include=["embeddings"])
+    vectors = np.asarray(data["embeddings"], dtype=np.float64)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), n_queries)] + 0.05 * rng.standard_normal((n_queries, vectors.shape[1]))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    dist = (vectors ** 2).sum(1)[None, :] - 2 * queries @ vectors.T
+    truth = [[data["ids"][i] for i in np.argsort(row)[:k]] for row in dist]
+    np.save(os.path.join(store, "bench_queries.npy"), queries.astype(np.float32))
+    with open(os.path.join(store, "bench_truth.json"), "w") as f:
+        json.dump(truth, f)
+    return len(vectors)
+
+# ── Worker (one per process) ──────────────────────────────────────────────
+def worker(backend: str, store: str, k: int) -> dict:
+    import config
+    from benchmarks import fakes
+    from ingestion import numpy_store
+    from ingestion.loader import _open_store
+    fakes.install()
+    config.CHROMA_PERSIST_DIR = store
+    queries = np.load(os.path.join(store, "bench_queries.npy"))
+    with open(os.path.join(store, "bench_truth.json")) as f:
+        truth = json.load(f)
+    base = _proc_mb("VmRSS")
+    base_pss = _proc_mb("Pss", "/proc/self/smaps_rollup")
+
+    t = time.perf_counter()
+    if backend == "chroma":
+        collection = _open_store()._collection
+    else:
+        collection = numpy_store.NumpyVectorStore(None, os.path.join(store, backend))._collection
+    collection.query(query_embeddings=[queries[0].tolist()], n_results=k, include=["distances"])
+    open_ms = (time.perf_counter() - t) * 1000
+
+    times, hits = [], 0
+    for query, expected in zip(queries, truth):
+        t = time.perf_counter()
+        found = collection.query(query_embeddings=[query.tolist()], n_results=k,
+                                 include=["documents", "metadatas", "distances"])["ids"][0]
+        times.append((time.perf_counter() - t) * 1000)
+        hits += len(set(found) & set(expected))
+    times.sort()
+    return {"open_ms": round(open_ms, 1), "p50_ms": round(statistics.median(times), 3),
+            "p95_ms": round(times[int(0.95 * (len(times) - 1))], 3),
+            "recall_at_k": round(hits / (k * len(truth)), 4),
+            "rss_mb": round(_proc_mb("VmRSS") - base, 1), "base_pss_mb": base_pss}
+
+def run(backend: str, store: str, k: int, workers: int) -> dict:
+    """Start `workers` processes; once all have queried, each reports its memory while the rest live."""
+    env = dict(os.environ, PYTHONPATH=ROOT, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-bench"))
+    code = ("import json, sys; from benchmarks.vector_backends import worker, _proc_mb; "
+            "r = worker(sys.argv[1], sys.argv[2], int(sys.argv[3])); print('ready', flush=True); "
+            "sys.stdin.readline(); r['pss_mb'] = _proc_mb('Pss', '/proc/self/smaps_rollup') - r.pop('base_pss_mb'); "
+            "print(json.dumps(r))")
+    procs = [subprocess.Popen([sys.executable, "-c", code, backend, store, str(k)], cwd=ROOT, env=env, text=True,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+             for _ in range(workers)]
+    for p in procs:
+        line = "-"
+        while line and line.strip() != "ready":  # imports may print notices first
+            line = p.stdout.readline()
+        if not line:
+            err = p.communicate()[1].strip().splitlines()
+            return {"backend": backend, "error": err[-1] if err else "worker failed"}
+    results = [json.loads(p.communicate("measure\n")[0].strip().splitlines()[-1]) for p in procs]
+    merged = {"backend": backend}
+    for key in ("open_ms", "p50_ms", "p95_ms", "recall_at_k", "rss_mb"):
+        merged[key] = round(statistics.median(r[key] for r in results), 4 if key == "recall_at_k" else 1)
+    merged["pss_total_mb"] = round(sum(r["pss_mb"] for r in results), 1)
+    return merged
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--store", default=None, help="Chroma store to copy (default: CHROMA_PERSIST_DIR)")
+    parser.add_argument("--synthetic", nargs="*", type=int, default=[20000], help="synthetic store sizes")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4, help="concurrent processes per backend")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    args = parser.parse_args()
+
+    import config
+    work = tempfile.mkdtemp(prefix="buildit-vectors-")
+    stores = {"knowledge_base": os.path.join(work, "knowledge_base")}
+    shutil.copytree(args.store or config.CHROMA_PERSIST_DIR, stores["knowledge_base"])
+    for n in args.synthetic:
+        stores[f"synthetic_{n}"] = os.path.join(work, f"synthetic_{n}")
+        print(f"  building synthetic store with {n} vectors...", file=sys.stderr)
+        synthetic_store(stores[f"synthetic_{n}"], n)
+
+    results = []
+    for name, store in stores.items():
+        chunks = prepare(store, args.queries, args.k)
+        results.append({"store": name, "chunks": chunks,
+                        "runs": [run(b, store, args.k, args.workers) for b in args.backends]})
+    print(json.dumps({"meta": {"queries": args.queries, "k": args.k, "workers": args.workers},
+                      "results": results}, indent=2))
+    shutil.rmtree(work, ignore_errors=True)
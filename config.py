@@ -1,21 +1,113 @@
-import os
+import os, sys
 from dotenv import load_dotenv
 
 load_dotenv()  # Load .env file
 
+_SECRETS_FILES = (os.path.join(os.getcwd(), ".streamlit", "secrets.toml"),
+                  os.path.expanduser("~/.streamlit/secrets.toml"))
+_secrets = None
+
+def _streamlit_secrets() -> dict:
+    """st.secrets, read once. Streamlit is only imported if it is running or a secrets file exists."""
+    global _secrets
+    if _secrets is None:
+        _secrets = {}
+        if "streamlit" in sys.modules or any(os.path.exists(p) for p in _SECRETS_FILES):
+            try:
+                import streamlit as st
+                _secrets = dict(st.secrets)
+            except Exception:
+                pass
+    return _secrets
+
 def get_secret(key, fallback=None):
-    try:
-        import streamlit as st
-        return st.secrets[key]
-    except Exception:
-        return os.getenv(key, fallback)
+    secrets = _streamlit_secrets()
+    return secrets[key] if key in secrets else os.getenv(key, fallback)
 
 OPENAI_API_KEY      = get_secret("OPENAI_API_KEY")
 CHROMA_PERSIST_DIR  = get_secret("CHROMA_PERSIST_DIR", "./chroma_store")
+KB_SNAPSHOT_DIR     = get_secret("KB_SNAPSHOT_DIR", "./snapshots")
+KB_SNAPSHOT_VERSION = get_secret("KB_SNAPSHOT_VERSION", "")  # pinned at startup; empty = use the store as built
 KNOWLEDGE_BASE_DIR  = "./knowledge_base"
 LLM_MODEL_DEFAULT   = "gpt-4o-mini"
 LLM_MODEL_PREMIUM   = "gpt-4o"
 EMBEDDING_MODEL     = "text-embedding-3-small"
+EMBEDDING_BACKEND   = get_secret("EMBEDDING_BACKEND", "openai")  # local | openai
+VECTOR_BACKEND      = get_secret("VECTOR_BACKEND", "chroma")     # chroma | numpy (memory-mapped export)
+VECTOR_INDEX_DTYPE  = get_secret("VECTOR_INDEX_DTYPE", "float32")  # float32 | float16, numpy backend only
 CHUNK_SIZE          = 800
 CHUNK_OVERLAP       = 100
 TOP_K_RESULTS       = 5
+
+# Embedding cache (query + ingestion)
+EMBEDDING_CACHE_ENABLED     = str(get_secret("EMBEDDING_CACHE_ENABLED", "true")).lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_PATH        = "./cache/embeddings.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 50_000
+
+# Semantic answer cache
+ANSWER_CACHE_ENABLED   = str(get_secret("ANSWER_CACHE_ENABLED", "true")).lower() in ("1", "true", "yes")
+ANSWER_CACHE_PATH      = "./cache/answers.sqlite3"
+ANSWER_CACHE_THRESHOLD = float(get_secret("ANSWER_CACHE_THRESHOLD", 0.92))
+ANSWER_CACHE_TTL_HOURS = 24 * 7
+
+# Query router (rag/router.py): nearest centroid on the query embedding, keyword fallback
+ROUTER_ENABLED    = str(get_secret("ROUTER_ENABLED", "true")).lower() in ("1", "true", "yes")
+ROUTER_MODEL_PATH = "./cache/query_router.npz"   # written by `python -m rag.router train`
+ROUTER_LABELS_CSV = "./rag/routing_labels.csv"
+ROUTER_MIN_MARGIN = float(get_secret("ROUTER_MIN_MARGIN", 0.02))  # below this, use keywords
+
+# Document analysis (long-document map-reduce)
+ANALYSIS_CHUNK_TOKENS     = 3000
+ANALYSIS_MAX_CONCURRENCY  = 4
+
+# Ingestion throughput
+INGEST_PARSE_WORKERS = os.cpu_count() or 2
+EMBED_BATCH_SIZE     = 256
+EMBED_CONCURRENCY    = 4
+EMBED_MAX_RETRIES    = 6
+
+# HTTP API (api.py)
+API_MAX_INFLIGHT  = int(get_secret("API_MAX_INFLIGHT", 16))
+API_MAX_UPLOAD_MB = 25
+
+# Bulk question answering (rag/batch.py)
+BATCH_DEDUPE_THRESHOLD = 0.95
+
+# Hybrid retrieval: BM25 fused with vector search by reciprocal rank
+HYBRID_RETRIEVAL = str(get_secret("HYBRID_RETRIEVAL", "true")).lower() in ("1", "true", "yes")
+HYBRID_FETCH_K   = 20   # candidates taken from each retriever before fusion
+RRF_K            = 60
+
+# Local embedding backend (EMBEDDING_BACKEND=local)
+LOCAL_EMBEDDING_MODEL      = get_secret("LOCAL_EMBEDDING_MODEL", "intfloat/multilingual-e5-small")
+LOCAL_EMBEDDING_BATCH_SIZE = 32
+LOCAL_EMBEDDING_THREADS    = int(get_secret("LOCAL_EMBEDDING_THREADS", os.cpu_count() or 1))
+LOCAL_EMBEDDING_QUANTIZE   = str(get_secret("LOCAL_EMBEDDING_QUANTIZE", "false")).lower() in ("1", "true", "yes")
+
+# Context packing (rag/context.py)
+CONTEXT_PACKING      = str(get_secret("CONTEXT_PACKING", "true")).lower() in ("1", "true", "yes")
+CONTEXT_CANDIDATES   = 12     # chunks retrieved before merging / MMR
+CONTEXT_TOKEN_BUDGET = 900    # top-5 verbatim chunks are ~1000 tokens
+MMR_LAMBDA           = 0.7    # 1.0 = pure relevance, 0.0 = pure diversity
+
+# Document analysis cache
+ANALYSIS_CACHE_DIR    = "./cache/analysis"
+ANALYSIS_CACHE_MAX_MB = 200
+
+# Background analysis jobs
+ANALYSIS_JOBS_DB         = "./cache/analysis_jobs.sqlite3"
+ANALYSIS_JOB_WORKERS     = int(get_secret("ANALYSIS_JOB_WORKERS", "2"))
+ANALYSIS_JOB_HEARTBEAT_S = 5.0    # owners touch their active jobs this often
+ANALYSIS_JOB_STALE_S     = 60.0   # an active job silent this long has lost its owner
+ANALYSIS_JOB_TTL_DAYS    = 7      # finished and failed jobs are purged after this
+
+# Hot-path tracing (utils/tracing.py); exposed at /metrics and in the sidebar
+TRACING_ENABLED = str(get_secret("TRACING_ENABLED", "false")).lower() in ("1", "true", "yes")
+
+# PDF extraction (document_analysis/extractor.py)
+EXTRACT_MAX_TOKENS   = int(get_secret("EXTRACT_MAX_TOKENS", 200_000))  # stop walking pages past this
+EXTRACT_SPOOL_MAX_MB = 8      # uploads larger than this are spooled to a temp file, not held in memory
+EXTRACT_PAGE_CACHE   = True   # cache page text by document hash (under ANALYSIS_CACHE_DIR)
+
+# Contract analyzer: "graph" = three parallel LLM calls, "structured" = one JSON-schema call
+ANALYSIS_MODE = get_secret("ANALYSIS_MODE", "graph")
@@ -1,12 +1,32 @@
 """
-LangGraph analysis pipeline with 4 nodes:
-  summarize -> identify_risks -> check_completeness -> compile_report
+LangGraph analysis pipeline with 4 nodes. The three LLM nodes are independent,
+so they fan out in parallel from START and join at compile_report:
+  summarize / identify_risks / check_completeness -> compile_report
+
+Long documents (more than extractor.MAX_CHARS) run in map-reduce mode: risks and
+completeness are extracted per page-tagged chunk on a bounded worker pool, then merged
+and deduplicated before compile_report. One analysis costs 1 + 2 x chunks LLM calls.
+
+With ANALYSIS_MODE=structured, short documents instead take a single JSON-schema call
+(analyze_structured -> compile_report) that returns all three sections at once; a section
+that fails validation is re-requested on its own. Long documents keep map-reduce.
 """
-from typing import TypedDict, List
-from langgraph.graph import StateGraph, END
+import json, re
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Literal, TypedDict, List
+from langgraph.graph import StateGraph, START, END
 from langchain_openai import ChatOpenAI
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from document_analysis.extractor import MAX_CHARS, chunk_pages, pages_to_text
+from document_analysis import cache
+from utils.tracing import count, traced
 import config
 
+# Bump whenever a prompt or the report shape changes; it is part of the analysis cache key
+PROMPT_VERSION = "2"
+
 class AnalysisState(TypedDict):
     document_text: str
     document_name: str
@@ -14,14 +34,34 @@ class AnalysisState(TypedDict):
     risks: List[dict]
     missing_items: List[str]
     report: dict
+    chunks: List[dict]  # page-tagged chunks from extractor.chunk_pages; empty for short documents
+    page_count: int
 
+@lru_cache(maxsize=1)
 def _llm():
     return ChatOpenAI(model=config.LLM_MODEL_PREMIUM,
                       openai_api_key=config.OPENAI_API_KEY,
                       temperature=0.1)
 
+# Shared by the risk and completeness map steps, so the cap holds across both
+_map_pool = ThreadPoolExecutor(max_workers=config.ANALYSIS_MAX_CONCURRENCY,
+                               thread_name_prefix="analysis-map")
+
+SEVERITY_RANK = {"HIGH": 3, "MEDIUM": 2, "LOW": 1}
+
+CONTRACT_CHECKLIST = [
+    "Payment schedule",
+    "Warranty period",
+    "Penalty clauses",
+    "Completion date",
+    "Materials specification",
+    "Dispute resolution",
+    "Contractor license number",
+]
+
 # ── Node 1: Summarize ─────────────────────────────────────────────────────
-def summarize_document(state: AnalysisState) -> AnalysisState:
+@traced("analyze.summarize")
+def summarize_document(state: AnalysisState) -> dict:
     prompt = f"""You are a legal assistant helping a foreigner understand a Polish construction or real estate document.
 
 Summarize this document in plain English (3-5 sentences):
@@ -33,11 +73,71 @@ DOCUMENT:
 {state["document_text"]}
 """
     response = _llm().invoke(prompt)
-    state["summary"] = response.content
-    return state
+    return {"summary": response.content}
 
 # ── Node 2: Identify Risks ────────────────────────────────────────────────
-def identify_risks(state: AnalysisState) -> AnalysisState:
+def _parse_risks(raw: str, default_page: int = None) -> List[dict]:
+    risks = []
+    blocks = [b.strip() for b in raw.split("\n\n") if "RISK:" in b]
+    for block in blocks:
+        lines = {l.split(":")[0].strip(): ":".join(l.split(":")[1:]).strip()
+                 for l in block.split("\n") if ":" in l}
+        risk = {
+            "description": lines.get("RISK", ""),
+            "explanation":  lines.get("WHY", ""),
+            "severity":     lines.get("SEVERITY", "MEDIUM").upper()
+        }
+        page = re.search(r"\d+", lines.get("PAGE", ""))
+        if page or default_page is not None:
+            risk["page"] = int(page.group()) if page else default_page
+        risks.append(risk)
+    return risks
+
+@traced("analyze.risks_chunk")
+def _risks_in_chunk(chunk: dict) -> List[dict]:
+    prompt = f"""You are a legal risk analyst reviewing an excerpt of a long Polish construction/real estate document for a foreign client.
+Each page of the excerpt starts with a "--- Page N ---" marker.
+
+Identify risky, unusual, or unfair clauses in this excerpt. For each risk:
+- Describe the clause briefly
+- Explain why it is risky for the client
+- Rate severity: HIGH / MEDIUM / LOW
+- Give the page number the clause appears on
+
+Format each risk as:
+RISK: <description>
+WHY: <explanation>
+SEVERITY: <HIGH|MEDIUM|LOW>
+PAGE: <page number>
+
+If the excerpt has no risky clauses, reply with NONE.
+
+EXCERPT:
+{chunk["text"]}
+"""
+    return _parse_risks(_llm().invoke(prompt).content, default_page=chunk["pages"][0])
+
+def _normalize_finding(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+def merge_risks(risks: List[dict], similarity: float = 0.85) -> List[dict]:
+    """Drop near-duplicate risks found in overlapping chunks, keeping the most severe copy."""
+    merged = []
+    for risk in sorted(risks, key=lambda r: -SEVERITY_RANK.get(r["severity"], 2)):
+        key = _normalize_finding(risk["description"])
+        if any(SequenceMatcher(None, key, _normalize_finding(m["description"])).ratio() >= similarity
+               for m in merged):
+            continue
+        merged.append(risk)
+    return sorted(merged, key=lambda r: r.get("page") or 0)
+
+@traced("analyze.risks")
+def identify_risks(state: AnalysisState) -> dict:
+    if state.get("chunks"):
+        found = [r for chunk_risks in _map_pool.map(_risks_in_chunk, state["chunks"])
+                 for r in chunk_risks]
+        return {"risks": merge_risks(found)}
+
     prompt = f"""You are a legal risk analyst reviewing a Polish construction/real estate document for a foreign client.
 
 Identify risky, unusual, or unfair clauses. For each risk:
@@ -55,21 +155,51 @@ DOCUMENT:
 """
     response = _llm().invoke(prompt)
     raw = response.content
-    risks = []
-    blocks = [b.strip() for b in raw.split("\n\n") if "RISK:" in b]
-    for block in blocks:
-        lines = {l.split(":")[0].strip(): ":".join(l.split(":")[1:]).strip()
-                 for l in block.split("\n") if ":" in l}
-        risks.append({
-            "description": lines.get("RISK", ""),
-            "explanation":  lines.get("WHY", ""),
-            "severity":     lines.get("SEVERITY", "MEDIUM").upper()
-        })
-    state["risks"] = risks if risks else [{"description": raw, "explanation": "", "severity": "MEDIUM"}]
-    return state
+    risks = _parse_risks(raw)
+    return {"risks": risks if risks else [{"description": raw, "explanation": "", "severity": "MEDIUM"}]}
 
 # ── Node 3: Check Completeness ────────────────────────────────────────────
-def check_completeness(state: AnalysisState) -> AnalysisState:
+@traced("analyze.completeness_chunk")
+def _checklist_in_chunk(chunk: dict) -> dict:
+    checklist = "\n".join(f"{i}. {item}" for i, item in enumerate(CONTRACT_CHECKLIST, 1))
+    prompt = f"""You are reviewing an excerpt of a long Polish construction contract for a foreigner.
+Each page of the excerpt starts with a "--- Page N ---" marker.
+
+Which of these items does the excerpt clearly cover?
+{checklist}
+
+Reply with one line:
+COVERED: <comma-separated item numbers, or NONE>
+
+Then list anything in the excerpt that is ambiguous or unclear, one per line:
+- UNCLEAR: <item> (page <page number>)
+
+EXCERPT:
+{chunk["text"]}
+"""
+    raw = _llm().invoke(prompt).content
+    covered, unclear = set(), []
+    for line in raw.split("\n"):
+        line = line.strip().lstrip("-* ").strip()
+        if line.upper().startswith("COVERED:"):
+            covered |= {int(n) for n in re.findall(r"\d+", line)}
+        elif line.upper().startswith("UNCLEAR:"):
+            unclear.append(line.split(":", 1)[1].strip())
+    return {"covered": covered, "unclear": unclear}
+
+@traced("analyze.completeness")
+def check_completeness(state: AnalysisState) -> dict:
+    if state.get("chunks"):
+        results = list(_map_pool.map(_checklist_in_chunk, state["chunks"]))
+        covered = set().union(*(r["covered"] for r in results))
+        missing = [item for i, item in enumerate(CONTRACT_CHECKLIST, 1) if i not in covered]
+        unclear, seen = [], set()
+        for item in (u for r in results for u in r["unclear"]):
+            if _normalize_finding(item) not in seen:
+                seen.add(_normalize_finding(item))
+                unclear.append(f"Unclear: {item}")
+        return {"missing_items": missing + unclear}
+
     prompt = f"""You are reviewing a Polish construction contract for a foreigner.
 
 List items that are MISSING or UNCLEAR that a proper construction contract should include.
@@ -88,15 +218,15 @@ DOCUMENT:
         for line in raw.split("\n")
         if line.strip() and line.strip()[0].isdigit() or line.strip().startswith("-")
     ]
-    state["missing_items"] = items if items else [raw]
-    return state
+    return {"missing_items": items if items else [raw]}
 
 # ── Node 4: Compile Report ────────────────────────────────────────────────
-def compile_report(state: AnalysisState) -> AnalysisState:
+@traced("analyze.compile")
+def compile_report(state: AnalysisState) -> dict:
     high   = [r for r in state["risks"] if r["severity"] == "HIGH"]
     medium = [r for r in state["risks"] if r["severity"] == "MEDIUM"]
     low    = [r for r in state["risks"] if r["severity"] == "LOW"]
-    state["report"] = {
+    return {"report": {
         "document_name":  state["document_name"],
         "summary":        state["summary"],
         "risks_high":     high,
@@ -105,28 +235,180 @@ def compile_report(state: AnalysisState) -> AnalysisState:
         "missing_items":  state["missing_items"],
         "total_risks":    len(state["risks"]),
         "risk_score":     "HIGH" if high else ("MEDIUM" if medium else "LOW"),
-    }
-    return state
+        "page_count":     state.get("page_count", 0),
+        "chunks_analyzed": len(state.get("chunks") or []),
+    }}
+
+# ── Structured mode: one JSON-schema call for all three sections ──────────
+class Risk(BaseModel):
+    description: str = Field(min_length=1)
+    explanation: str = ""
+    severity: Literal["HIGH", "MEDIUM", "LOW"]
+
+    @field_validator("severity", mode="before")
+    @classmethod
+    def _upper(cls, v):
+        return v.upper() if isinstance(v, str) else v
+
+class SummarySection(BaseModel):
+    summary: str = Field(min_length=1)
+
+class RisksSection(BaseModel):
+    risks: List[Risk]
+
+class MissingItemsSection(BaseModel):
+    missing_items: List[str]
+
+class ContractAnalysis(MissingItemsSection, RisksSection, SummarySection):
+    """Fields come out as summary, risks, missing_items (pydantic orders bases last-first)."""
+
+SECTIONS = {"summary": SummarySection, "risks": RisksSection, "missing_items": MissingItemsSection}
+SECTION_SPECS = {
+    "summary": "a plain-English summary in 3-5 sentences: what type of document it is, who the "
+               "parties are, and the core agreement or obligation",
+    "risks": "risky, unusual or unfair clauses, each as {\"description\": brief description of the "
+             "clause, \"explanation\": why it is risky for the client, \"severity\": \"HIGH\" | \"MEDIUM\" | \"LOW\"}",
+    "missing_items": "items a proper construction contract should include that are MISSING or UNCLEAR "
+                     f"(e.g. {', '.join(CONTRACT_CHECKLIST).lower()})",
+}
+STRUCTURED_RETRIES = 1  # extra calls per section that fails validation
+
+def _json_call(prompt: str, schema: type, name: str) -> dict:
+    """One chat call constrained to `schema` (OpenAI json_schema response format); {} if not JSON."""
+    response_format = {"type": "json_schema",
+                       "json_schema": {"name": name, "schema": schema.model_json_schema()}}
+    raw = _llm().bind(response_format=response_format).invoke(prompt).content
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def _valid_sections(data: dict) -> dict:
+    """The sections of `data` that pass validation, each checked on its own."""
+    valid = {}
+    for name, model in SECTIONS.items():
+        try:
+            valid[name] = getattr(model.model_validate({name: data.get(name)}), name)
+        except ValidationError:
+            pass
+    return valid
+
+@traced("analyze.structured")
+def analyze_structured(state: AnalysisState) -> dict:
+    """Summary, risks and missing items from a single request; only invalid sections are re-asked."""
+    fields = "\n".join(f'- "{name}": {spec}' for name, spec in SECTION_SPECS.items())
+    prompt = f"""You are a legal assistant reviewing a Polish construction or real estate document for a foreign client.
+
+Return a JSON object with:
+{fields}
+
+DOCUMENT:
+{state["document_text"]}
+"""
+    sections = _valid_sections(_json_call(prompt, ContractAnalysis, "contract_analysis"))
+    for name in [n for n in SECTIONS if n not in sections]:
+        for _ in range(STRUCTURED_RETRIES):
+            retry = f"""You are a legal assistant reviewing a Polish construction or real estate document for a foreign client.
+
+Return a JSON object with only:
+- "{name}": {SECTION_SPECS[name]}
+
+DOCUMENT:
+{state["document_text"]}
+"""
+            sections.update(_valid_sections(_json_call(retry, SECTIONS[name], name)))
+            if name in sections:
+                break
+    return {"summary": sections.get("summary", "Summary unavailable."),
+            "risks": [r.model_dump() for r in sections.get("risks", [])],
+            "missing_items": sections.get("missing_items", [])}
 
 # ── Build graph ───────────────────────────────────────────────────────────
-def build_analysis_graph():
+def build_analysis_graph(mode: str = "graph"):
+    """
+    "graph": three LLM nodes in parallel, joined at compile.
+    "structured": one structured-output node (analyze_structured), then compile.
+    """
     graph = StateGraph(AnalysisState)
-    graph.add_node("summarize",    summarize_document)
-    graph.add_node("risks",        identify_risks)
-    graph.add_node("completeness", check_completeness)
-    graph.add_node("compile",      compile_report)
-    graph.set_entry_point("summarize")
-    graph.add_edge("summarize",    "risks")
-    graph.add_edge("risks",        "completeness")
-    graph.add_edge("completeness", "compile")
-    graph.add_edge("compile",      END)
+    graph.add_node("compile", compile_report)
+    if mode == "structured":
+        graph.add_node("analyze", analyze_structured)
+        graph.add_edge(START, "analyze")
+        graph.add_edge("analyze", "compile")
+    elif mode == "graph":
+        graph.add_node("summarize",    summarize_document)
+        graph.add_node("risks",        identify_risks)
+        graph.add_node("completeness", check_completeness)
+        for node in ("summarize", "risks", "completeness"):
+            graph.add_edge(START, node)
+        graph.add_edge(["summarize", "risks", "completeness"], "compile")
+    else:
+        raise ValueError(f"Unknown ANALYSIS_MODE: {mode!r} (use graph|structured)")
+    graph.add_edge("compile", END)
     return graph.compile()
 
-def analyze_document(document_text: str, document_name: str) -> dict:
-    app = build_analysis_graph()
-    result = app.invoke({
+@lru_cache(maxsize=2)
+def get_analysis_graph(mode: str = None):
+    """Compiled once per process and mode, and reused by every analysis."""
+    return build_analysis_graph(mode or config.ANALYSIS_MODE)
+
+def graph_for(state: AnalysisState):
+    """Long (chunked) documents always take the map-reduce graph; structured mode is single-pass."""
+    return get_analysis_graph("graph" if state.get("chunks") else None)
+
+def _initial_state(document_text: str, document_name: str, chunks: List[dict] = None,
+                   page_count: int = 0) -> AnalysisState:
+    return {
         "document_text": document_text,
         "document_name": document_name,
-        "summary": "", "risks": [], "missing_items": [], "report": {}
-    })
+        "summary": "", "risks": [], "missing_items": [], "report": {},
+        "chunks": chunks or [], "page_count": page_count,
+    }
+
+def _pages_state(pages: List[dict], document_name: str) -> AnalysisState:
+    """Short documents go through the single-pass prompts; long ones are chunked for map-reduce."""
+    text = pages_to_text(pages)
+    long_doc = sum(len(p["text"]) for p in pages) > MAX_CHARS
+    return _initial_state(text, document_name,
+                          chunks=chunk_pages(pages) if long_doc else [],
+                          page_count=len(pages))
+
+def analyze_document(document_text: str, document_name: str) -> dict:
+    result = get_analysis_graph().invoke(_initial_state(document_text, document_name))
+    return result["report"]
+
+async def analyze_document_async(document_text: str, document_name: str) -> dict:
+    result = await get_analysis_graph().ainvoke(_initial_state(document_text, document_name))
+    return result["report"]
+
+def analyze_pages(pages: List[dict], document_name: str) -> dict:
+    """Analyze page records from extractor.extract_pages, switching to map-reduce for long documents."""
+    state = _pages_state(pages, document_name)
+    return graph_for(state).invoke(state)["report"]
+
+async def analyze_pages_async(pages: List[dict], document_name: str) -> dict:
+    state = _pages_state(pages, document_name)
+    result = await graph_for(state).ainvoke(state)
     return result["report"]
+
+def plan_pages(pages: List[dict], document_name: str):
+    """(graph, initial state, node names) for callers that stream the graph's progress."""
+    state = _pages_state(pages, document_name)
+    graph = graph_for(state)
+    return graph, state, [n for n in graph.nodes if not n.startswith("__")]
+
+# ── Analysis cache (keyed by the uploaded bytes) ──────────────────────────
+def cached_report(file_bytes: bytes, document_name: str):
+    """Returns (cache key, cached report or None) for an uploaded PDF."""
+    key = cache.analysis_key(cache.document_hash(file_bytes), f"{PROMPT_VERSION}-{config.ANALYSIS_MODE}")
+    report = cache.get_report(key)
+    count("cache_requests", cache="analysis", result="miss" if report is None else "hit")
+    if report is not None:
+        report.update(document_name=document_name, cached=True)
+    return key, report
+
+def store_report(key: str, report: dict) -> dict:
+    report.update(cache_key=key, cached=False)
+    cache.put_report(key, report)
+    return report
@@ -0,0 +1,111 @@
+"""
+Content-addressed disk cache for analysis reports, their rendered PDF reports and the
+page text extracted from uploads.
+Keys combine the SHA-256 of the uploaded bytes with the analyzer prompt version and model,
+so a prompt or model change never serves a stale report. Least-recently-used files are
+evicted once the directory grows past ANALYSIS_CACHE_MAX_MB.
+"""
+import hashlib, json, os, threading
+import config
+
+_lock = threading.Lock()
+
+def document_hash(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def analysis_key(doc_hash: str, prompt_version: str, model: str = None) -> str:
+    model = model or config.LLM_MODEL_PREMIUM
+    return hashlib.sha256(f"{doc_hash}:{prompt_version}:{model}".encode()).hexdigest()
+
+def _path(key: str, ext: str) -> str:
+    return os.path.join(config.ANALYSIS_CACHE_DIR, key[:2], f"{key}.{ext}")
+
+def _read(path: str, mode: str):
+    try:
+        with open(path, mode) as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    os.utime(path)  # mtime doubles as last-used time for eviction
+    return data
+
+def _write(path: str, data, mode: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, mode) as f:
+        f.write(data)
+    os.replace(tmp, path)
+    _evict()
+
+def _evict():
+    limit = config.ANALYSIS_CACHE_MAX_MB * 1024 * 1024
+    with _lock:
+        files = []
+        for root, _, names in os.walk(config.ANALYSIS_CACHE_DIR):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+def get_report(key: str):
+    data = _read(_path(key, "json"), "r")
+    return json.loads(data) if data is not None else None
+
+def put_report(key: str, report: dict):
+    _write(_path(key, "json"), json.dumps(report), "w")
+
+def get_pdf(key: str):
+    return _read(_path(key, "pdf"), "rb")
+
+def put_pdf(key: str, pdf_bytes: bytes):
+    _write(_path(key, "pdf"), pdf_bytes, "wb")
+
+# ── Extracted page text (JSONL, one page record per line) ─────────────────
+def pages_key(doc_hash: str, max_tokens: int) -> str:
+    return hashlib.sha256(f"pages:{doc_hash}:{max_tokens}".encode()).hexdigest()
+
+def read_pages(key: str):
+    """Iterator over cached page records, or None if this document was not extracted yet."""
+    path = _path(key, "pages.jsonl")
+    try:
+        f = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    os.utime(path)
+
+    def records():
+        with f:
+            for line in f:
+                yield json.loads(line)
+    return records()
+
+class PageWriter:
+    """Appends page records as they are extracted; only a completed walk is published."""
+    def __init__(self, key: str):
+        self.path = _path(key, "pages.jsonl")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.tmp = f"{self.path}.{threading.get_ident()}.tmp"
+        self.f = open(self.tmp, "w", encoding="utf-8")
+
+    def write(self, record: dict):
+        self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self, commit: bool):
+        self.f.close()
+        if commit:
+            os.replace(self.tmp, self.path)
+            _evict()
+        else:
+            os.remove(self.tmp)
@@ -1,25 +1,173 @@
 """
 Extracts text from uploaded PDF or DOCX files.
-Cleans and truncates to fit within LLM context window.
+Cleans and truncates to fit within LLM context window, or splits long documents
+into page-tagged, token-sized chunks for map-reduce analysis.
+
+iter_pages() walks a PDF one page at a time: large uploads are spooled to a temp file and
+opened from disk, pages are yielded as they are read, the walk stops once EXTRACT_MAX_TOKENS
+is reached, and the page text is cached by document hash so a re-upload is not re-parsed.
 """
 import fitz  # PyMuPDF
-import io
+import hashlib, os, tempfile
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List
+from document_analysis import cache
+from utils.tracing import traced
+import config
 
 MAX_CHARS = 12000  # ~3000 tokens — safe for gpt-4o context
+_COPY_CHUNK = 1024 * 1024
+_STORE_FLUSH_PAGES = 8  # flushing every page costs ~4x the parse time; every 8 keeps ~15 MB
+
+@contextmanager
+def _spooled(source):
+    """
+    (bytes or file path, sha256) for PDF bytes, a path or a binary file object.
+    File objects are copied to a temp file in chunks once they pass EXTRACT_SPOOL_MAX_MB.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source, hashlib.sha256(source).hexdigest()
+        return
+    if isinstance(source, (str, os.PathLike)):
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(_COPY_CHUNK), b""):
+                digest.update(block)
+        yield os.fspath(source), digest.hexdigest()
+        return
+    source.seek(0)
+    limit = config.EXTRACT_SPOOL_MAX_MB * 1024 * 1024
+    digest, buffer, tmp = hashlib.sha256(), bytearray(), None
+    try:
+        for block in iter(lambda: source.read(_COPY_CHUNK), b""):
+            digest.update(block)
+            if tmp is None and len(buffer) + len(block) > limit:
+                tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+                tmp.write(buffer)
+                buffer = bytearray()
+            if tmp is None:
+                buffer += block
+            else:
+                tmp.write(block)
+        if tmp is None:
+            yield buffer, digest.hexdigest()
+        else:
+            tmp.close()  # MuPDF reads the spooled file lazily by path
+            yield tmp.name, digest.hexdigest()
+    finally:
+        if tmp is not None:
+            tmp.close()
+            os.remove(tmp.name)
+
+def _walk(target, max_tokens: int, writer) -> Iterator[dict]:
+    enc = _encoding()
+    doc = fitz.open(target) if isinstance(target, str) else fitz.open(stream=target, filetype="pdf")
+    offset = used = 0
+    completed = False
+    try:
+        for i in range(doc.page_count):
+            text = doc.load_page(i).get_text()
+            if i % _STORE_FLUSH_PAGES == _STORE_FLUSH_PAGES - 1:
+                fitz.TOOLS.store_shrink(100)  # MuPDF keeps decoded scan images in a process-wide store
+            record = {"page": i + 1, "text": text, "start": offset, "end": offset + len(text)}
+            offset = record["end"] + 1  # pages are joined with "\n"
+            if writer:
+                writer.write(record)
+            yield record
+            used += len(enc.encode(text))
+            if used >= max_tokens:
+                break
+        completed = True
+    finally:
+        doc.close()
+        if writer:
+            writer.close(commit=completed)  # a walk abandoned by the consumer is not cached
+
+def iter_pages(source, max_tokens: int = None) -> Iterator[dict]:
+    """
+    Lazily yield {"page", "text", "start", "end"} records; start/end are char offsets into
+    the pages joined with newlines. Stops after the page that reaches max_tokens.
+    """
+    max_tokens = max_tokens or config.EXTRACT_MAX_TOKENS
+    with _spooled(source) as (target, doc_hash):
+        key = cache.pages_key(doc_hash, max_tokens) if config.EXTRACT_PAGE_CACHE else None
+        cached = cache.read_pages(key) if key else None
+        if cached is not None:
+            yield from cached
+            return
+        yield from _walk(target, max_tokens, cache.PageWriter(key) if key else None)
+
+@traced("extract.pages")
+def extract_pages_from_pdf(source) -> List[dict]:
+    """One record per page: {"page": 1-based number, "text", "start", "end"}; see iter_pages."""
+    return list(iter_pages(source))
+
+def pages_to_text(pages: Iterable[dict]) -> str:
+    """Joined page text cut to MAX_CHARS; stops consuming pages once that is reached."""
+    parts, size, more = [], 0, False
+    for p in pages:
+        if size > MAX_CHARS:
+            more = True
+            break
+        parts.append(p["text"])
+        size += len(p["text"]) + 1
+    raw = "\n".join(parts).strip()
+    truncated = more or len(raw) > MAX_CHARS
+    return raw[:MAX_CHARS] + ("\n\n[Document truncated for analysis...]" if truncated else "")
+
+def extract_text_from_pdf(source) -> str:
+    return pages_to_text(iter_pages(source))
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
-    pages = []
-    for page in doc:
-        pages.append(page.get_text())
-    raw = "\n".join(pages).strip()
-    return raw[:MAX_CHARS] + ("\n\n[Document truncated for analysis...]" if len(raw) > MAX_CHARS else "")
+def _encoding():
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(config.LLM_MODEL_PREMIUM)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def chunk_pages(pages: List[dict], max_tokens: int = None) -> List[dict]:
+    """
+    Pack consecutive pages into chunks of at most max_tokens. Every page starts with a
+    "--- Page N ---" marker so findings can be traced back to their page. Pages longer
+    than max_tokens are split on token boundaries.
+    """
+    max_tokens = max_tokens or config.ANALYSIS_CHUNK_TOKENS
+    enc = _encoding()
+    chunks, parts, chunk_page_nos, used = [], [], [], 0
+
+    def flush():
+        nonlocal parts, chunk_page_nos, used
+        if parts:
+            chunks.append({"text": "\n".join(parts), "pages": chunk_page_nos, "tokens": used})
+        parts, chunk_page_nos, used = [], [], 0
+
+    for page in pages:
+        text = page["text"].strip()
+        if not text:
+            continue
+        tokens = enc.encode(text)
+        pieces = [tokens[i:i + max_tokens] for i in range(0, len(tokens), max_tokens)]
+        for piece in pieces:
+            if used + len(piece) > max_tokens:
+                flush()
+            parts.append(f"--- Page {page['page']} ---\n{enc.decode(piece)}")
+            chunk_page_nos.append(page["page"])
+            used += len(piece)
+    flush()
+    return chunks
+
+def extract_pages(uploaded_file) -> List[dict]:
+    """Page records for a file object from st.file_uploader."""
+    name = uploaded_file.name.lower()
+    if not name.endswith(".pdf"):
+        raise ValueError(f"Unsupported file type: {uploaded_file.name}. Upload a PDF.")
+    return extract_pages_from_pdf(uploaded_file)
 
+@traced("extract.text")
 def extract_text(uploaded_file) -> str:
     """Main entry point — handles file object from st.file_uploader."""
-    file_bytes = uploaded_file.read()
     name = uploaded_file.name.lower()
     if name.endswith(".pdf"):
-        return extract_text_from_pdf(file_bytes)
+        return extract_text_from_pdf(uploaded_file)
     else:
         raise ValueError(f"Unsupported file type: {uploaded_file.name}. Upload a PDF.")
@@ -0,0 +1,208 @@
+"""
+Background document analysis jobs.
+
+submit_analysis() records a job in SQLite and runs it on a small local worker pool, so the
+Streamlit session is never blocked on the LLM calls. The worker streams the LangGraph updates
+and records the real state of every stage (extract, then the graph's nodes, compile last);
+the UI polls get_job(). Because job records outlive the browser session, a refreshed page can
+reattach to a running or finished analysis by its job id.
+
+Identical uploads reuse the analysis cache (finished immediately) or the job already running.
+
+Several processes (Streamlit workers, the API) may share ANALYSIS_JOBS_DB. Every job records
+its owner (host:pid), and the owner touches the heartbeat of its active jobs every
+ANALYSIS_JOB_HEARTBEAT_S. An active job is failed as interrupted only once its owner is gone:
+a dead pid on this host, or no heartbeat for ANALYSIS_JOB_STALE_S. Finished and failed jobs
+are purged ANALYSIS_JOB_TTL_DAYS after their last update.
+"""
+import json, logging, os, socket, sqlite3, tempfile, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from document_analysis.analyzer import cached_report, get_analysis_graph, plan_pages, store_report
+from document_analysis.extractor import extract_pages_from_pdf
+import config
+
+logger = logging.getLogger(__name__)
+
+def stages(nodes) -> list:
+    """Progress stages for a graph's nodes: extract first, compile last, the rest run in parallel."""
+    return ["extract", *sorted(nodes, key=lambda n: n == "compile")]
+
+def _default_stages() -> list:
+    return stages(n for n in get_analysis_graph().nodes if not n.startswith("__"))
+
+_pool = ThreadPoolExecutor(max_workers=config.ANALYSIS_JOB_WORKERS, thread_name_prefix="analysis-job")
+_lock = threading.Lock()
+_initialized = False
+_heartbeat = None
+_last_purge = 0.0
+PURGE_INTERVAL_S = 3600
+HOST  = socket.gethostname()
+OWNER = f"{HOST}:{os.getpid()}"
+
+def _init_db():
+    os.makedirs(os.path.dirname(config.ANALYSIS_JOBS_DB) or ".", exist_ok=True)
+    with closing(sqlite3.connect(config.ANALYSIS_JOBS_DB)) as con:
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                cache_key TEXT,
+                document_name TEXT,
+                status TEXT,
+                progress TEXT,
+                report TEXT,
+                error TEXT,
+                created_at REAL,
+                updated_at REAL,
+                owner TEXT,
+                heartbeat REAL
+            )
+        """)
+        columns = {row[1] for row in con.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if column not in columns:
+                con.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_jobs_cache_key ON jobs(cache_key, status)")
+        _reap(con)
+        con.commit()
+
+def _owner_gone(owner: str, heartbeat: float) -> bool:
+    if heartbeat is None or heartbeat < time.time() - config.ANALYSIS_JOB_STALE_S:
+        return True
+    host, _, pid = (owner or "").rpartition(":")
+    if host != HOST or not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # alive, owned by another user
+    return False
+
+def _reap(con, where: str = "", params=()):
+    """Fail the active jobs (matching `where`) whose owner process is gone; workers die with it."""
+    rows = con.execute(f"SELECT id, owner, heartbeat FROM jobs WHERE status IN ('queued', 'running') {where}",
+                       params).fetchall()
+    gone = [(time.time(), job_id) for job_id, owner, heartbeat in rows if _owner_gone(owner, heartbeat)]
+    con.executemany("UPDATE jobs SET status = 'error', error = 'Interrupted: its worker process stopped', "
+                    "updated_at = ? WHERE id = ? AND status IN ('queued', 'running')", gone)
+    return len(gone)
+
+def _connect():
+    global _initialized
+    with _lock:
+        if not _initialized:
+            _init_db()
+            _initialized = True
+    return closing(sqlite3.connect(config.ANALYSIS_JOBS_DB, timeout=10))
+
+def _update(job_id: str, **fields):
+    fields["updated_at"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with _connect() as con:
+        con.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+        con.commit()
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(config.ANALYSIS_JOB_HEARTBEAT_S)
+        try:
+            with _connect() as con:
+                con.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status IN ('queued', 'running')",
+                            (time.time(), OWNER))
+                con.commit()
+        except sqlite3.Error:
+            logger.exception("analysis job heartbeat failed")
+
+def _ensure_heartbeat():
+    global _heartbeat
+    with _lock:
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_heartbeat_loop, name="analysis-heartbeat", daemon=True)
+            _heartbeat.start()
+
+def purge_finished_jobs(ttl_days: float = None) -> int:
+    """Delete done and failed jobs last updated more than ttl_days ago."""
+    global _last_purge
+    _last_purge = time.time()
+    ttl_days = config.ANALYSIS_JOB_TTL_DAYS if ttl_days is None else ttl_days
+    with _connect() as con:
+        cur = con.execute("DELETE FROM jobs WHERE status IN ('done', 'error') AND updated_at < ?",
+                          (time.time() - ttl_days * 86400,))
+        con.commit()
+    return cur.rowcount
+
+def _run(job_id: str, key: str, pdf_path: str, document_name: str):
+    progress = dict.fromkeys(_default_stages(), "pending")  # every stage shows while extracting
+
+    def mark(**stages):
+        progress.update(stages)
+        _update(job_id, status="running", progress=json.dumps(progress))
+
+    try:
+        mark(extract="running")
+        pages = extract_pages_from_pdf(pdf_path)
+        graph, state, nodes = plan_pages(pages, document_name)
+        parallel = [n for n in nodes if n != "compile"]
+        # A long document may switch graphs, so the stage list is settled only now
+        progress = {stage: "pending" for stage in stages(nodes)}
+        mark(extract="done", **dict.fromkeys(parallel, "running"))
+        report = None
+        for update in graph.stream(state, stream_mode="updates"):
+            for node, partial in update.items():
+                progress[node] = "done"
+                if node == "compile":
+                    report = store_report(key, partial["report"])
+                elif all(progress[s] == "done" for s in parallel):
+                    progress["compile"] = "running"
+            mark()
+        _update(job_id, status="done", report=json.dumps(report))
+    except Exception as e:
+        logger.exception("analysis job %s failed", job_id)
+        progress = {s: "failed" if state == "running" else state for s, state in progress.items()}
+        _update(job_id, status="error", error=str(e), progress=json.dumps(progress))
+    finally:
+        os.remove(pdf_path)
+
+def submit_analysis(file_bytes: bytes, document_name: str) -> str:
+    """Queue an analysis and return its job id (an existing one for a duplicate upload)."""
+    key, report = cached_report(file_bytes, document_name)
+    with _connect() as con:
+        if report is None:
+            _reap(con, "AND cache_key = ?", (key,))
+            row = con.execute("SELECT id FROM jobs WHERE cache_key = ? AND status IN ('queued', 'running')",
+                              (key,)).fetchone()
+            if row:
+                return row[0]
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        progress = dict.fromkeys(_default_stages(), "done" if report else "pending")
+        con.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, key, document_name, "done" if report else "queued", json.dumps(progress),
+                     json.dumps(report) if report else None, None, now, now, OWNER, now))
+        con.commit()
+    if time.time() - _last_purge > PURGE_INTERVAL_S:
+        purge_finished_jobs()
+    if report is None:
+        _ensure_heartbeat()
+        # Queued uploads wait on disk, not in memory
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(file_bytes)
+        _pool.submit(_run, job_id, key, f.name, document_name)
+    return job_id
+
+def get_job(job_id: str):
+    """The job record with progress and report decoded, or None for an unknown id."""
+    with _connect() as con:
+        if _reap(con, "AND id = ?", (job_id,)):
+            con.commit()
+        con.row_factory = sqlite3.Row
+        row = con.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["progress"] = json.loads(job["progress"])
+    job["report"] = json.loads(job["report"]) if job["report"] else None
+    return job
@@ -1,13 +1,14 @@
 """
 Generates a branded PDF report from analysis results using ReportLab.
 """
-import io
+import hashlib, io
 from datetime import datetime
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, HRFlowable
+from utils.tracing import traced
 
 BRAND_ORANGE = colors.HexColor("#E8732A")
 BRAND_DARK   = colors.HexColor("#1A1A1A")
@@ -17,6 +18,7 @@ LOW_GREEN    = colors.HexColor("#388E3C")
 
 SEVERITY_COLOR = {"HIGH": HIGH_RED, "MEDIUM": MED_AMBER, "LOW": LOW_GREEN}
 
+@traced("report.pdf")
 def generate_pdf_report(report: dict) -> bytes:
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4,
@@ -60,8 +62,9 @@ def generate_pdf_report(report: dict) -> bytes:
                          ("LOW", report["risks_low"])]:
         for r in risks:
             c = SEVERITY_COLOR[level]
+            page = f' <i>(p. {r["page"]})</i>' if r.get("page") else ""
             story.append(Paragraph(
-                f'<font color="{c.hexval()}"><b>[{level}]</b></font> {r["description"]}',
+                f'<font color="{c.hexval()}"><b>[{level}]</b></font> {r["description"]}{page}',
                 styles["Normal"]
             ))
             if r.get("explanation"):
@@ -88,3 +91,15 @@ def generate_pdf_report(report: dict) -> bytes:
 
     doc.build(story)
     return buffer.getvalue()
+
+def generate_pdf_report_cached(report: dict) -> bytes:
+    """Rendered PDF memoized next to the cached analysis it was built from."""
+    from document_analysis import cache
+    if not report.get("cache_key"):
+        return generate_pdf_report(report)
+    key = hashlib.sha256(f'{report["cache_key"]}:{report["document_name"]}'.encode()).hexdigest()
+    pdf_bytes = cache.get_pdf(key)
+    if pdf_bytes is None:
+        pdf_bytes = generate_pdf_report(report)
+        cache.put_pdf(key, pdf_bytes)
+    return pdf_bytes
@@ -0,0 +1,81 @@
+"""
+In-memory BM25 index over the same chunks stored in Chroma.
+Built at ingest time, saved next to the vector store and fused with vector hits in
+rag.pipeline.retrieve. Article references ("Art. 29 ust. 2", "§ 5") also become compound
+tokens ("art29", "ust2", "§5"), so exact-identifier lookups hit a handful of postings.
+"""
+import json, math, os, re
+from collections import Counter, defaultdict
+from typing import List, Tuple
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_REFERENCE = re.compile(r"(?<!\w)(art|ust|pkt|lit|rozdz|§)\s*\.?\s*(\d+[a-z]?)", re.IGNORECASE | re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    text = text.lower()
+    tokens = _WORD.findall(text)
+    tokens += [f"{kind}{num}" for kind, num in _REFERENCE.findall(text)]
+    return tokens
+
+class BM25Index:
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[dict],
+                 k1: float = 1.5, b: float = 0.75):
+        self.ids, self.texts, self.metadatas = ids, texts, metadatas
+        self.k1, self.b = k1, b
+        self.postings = defaultdict(list)  # term -> [(doc index, term frequency)]
+        self.doc_len = []
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+        self._finalize()
+
+    def _finalize(self):
+        n = len(self.doc_len)
+        self.avg_len = (sum(self.doc_len) / n) if n else 0.0
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+                    for term, p in self.postings.items()}
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Top-k (doc index, score); only postings of the query's terms are touched."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[i] / self.avg_len)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda kv: -kv[1])[:k]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def save(self, path: str):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "ids": self.ids, "texts": self.texts,
+                       "metadatas": self.metadatas, "doc_len": self.doc_len,
+                       "postings": self.postings}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls.__new__(cls)
+        index.ids, index.texts, index.metadatas = data["ids"], data["texts"], data["metadatas"]
+        index.k1, index.b, index.doc_len = data["k1"], data["b"], data["doc_len"]
+        index.postings = defaultdict(list, {t: [tuple(p) for p in ps] for t, ps in data["postings"].items()})
+        index._finalize()
+        return index
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists; a score of 1.0 means ranked first in every list."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    best = len(rankings) / (k + 1)
+    return sorted(((doc_id, s / best) for doc_id, s in scores.items()), key=lambda kv: -kv[1])
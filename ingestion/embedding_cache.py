@@ -0,0 +1,110 @@
+"""
+Disk-backed cache in front of an embeddings client.
+Entries are keyed on normalized text + embedding model and evicted least-recently-used
+once the table grows past EMBEDDING_CACHE_MAX_ENTRIES. Used for both queries and ingestion.
+"""
+import hashlib, os, sqlite3, threading, time, unicodedata
+from array import array
+from typing import List
+from langchain_core.embeddings import Embeddings
+from utils.tracing import count
+import config
+
+def _normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, base: Embeddings, model_name: str,
+                 path: str = None, max_entries: int = None):
+        self.base        = base
+        self.model_name  = model_name
+        self.path        = path or config.EMBEDDING_CACHE_PATH
+        self.max_entries = max_entries or config.EMBEDDING_CACHE_MAX_ENTRIES
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._con = sqlite3.connect(self.path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB,
+                last_used REAL
+            )
+        """)
+        self._con.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_lru ON embeddings(last_used)")
+        self._con.commit()
+        self._size = self._con.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, kind: str, text: str) -> str:
+        raw = f"{self.model_name}\x00{kind}\x00{_normalize(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> dict:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self._con.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                found.update({k: array("f", v).tolist() for k, v in rows})
+            if found:
+                now = time.time()
+                self._con.executemany("UPDATE embeddings SET last_used=? WHERE key=?",
+                                      [(now, k) for k in found])
+                self._con.commit()
+        return found
+
+    def _store(self, items: dict):
+        now = time.time()
+        with self._lock:
+            before = self._con.total_changes
+            self._con.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?,?,?)",
+                [(k, array("f", v).tobytes(), now) for k, v in items.items()]
+            )
+            self._size += self._con.total_changes - before  # only rows that are new
+            # Keys another process stored meanwhile: same model, same vector; just mark them used
+            self._con.executemany("UPDATE embeddings SET last_used=? WHERE key=?",
+                                  [(now, k) for k in items])
+            if self._size > self.max_entries:
+                # Drop the least recently used entries, plus 10% headroom to avoid evicting on every insert
+                excess = self._size - int(self.max_entries * 0.9)
+                self._con.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self._size = self._con.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._con.commit()
+
+    def _embed(self, kind: str, texts: List[str], embed_fn) -> List[List[float]]:
+        keys = [self._key(kind, t) for t in texts]
+        found = self._lookup(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        misses = sum(1 for k in keys if k in missing)
+        self.hits   += len(texts) - misses
+        self.misses += misses
+        count("cache_requests", len(texts) - misses, cache="embedding", result="hit")
+        count("cache_requests", misses, cache="embedding", result="miss")
+        if missing:
+            vectors = embed_fn(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+        return [found[k] for k in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("doc", texts, self.base.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed("query", [text], lambda t: [self.base.embed_query(t[0])])[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": self._size,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
@@ -1,14 +1,75 @@
-import os
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
+"""
+Knowledge-base ingestion: PDFs in knowledge_base/ -> chunks -> Chroma.
+
+A manifest in CHROMA_PERSIST_DIR records each file's content hash and chunk count.
+Chunk ids are derived from the file's path and content hash, so an (incremental) ingest only
+embeds new or changed files, deletes chunks of removed files, and re-running it never
+duplicates chunks; identical copies of a PDF at two paths get separate chunks.
+
+PDFs are parsed with PyMuPDF on a process pool. Chunks are embedded in concurrent
+batches with exponential backoff on rate limits and upserted batch by batch, so the
+store itself is the checkpoint: a failed run resumes by skipping chunk ids already stored.
+A full rebuild marks the manifest until it finishes, so re-running an interrupted rebuild
+with the same settings resumes it instead of deleting the collection again.
+
+    python -m ingestion.loader          # only what changed (the default, as for ingest())
+    python -m ingestion.loader --full   # drop the collection and rebuild everything
+
+With VECTOR_BACKEND=numpy, every ingest also exports the collection to the memory-mapped
+index in ingestion/numpy_store.py, which load_vector_store() then serves instead of Chroma.
+"""
+import argparse, glob, hashlib, json, os, random, threading, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
+from ingestion.embedding_cache import CachedEmbeddings
+from ingestion.bm25 import BM25Index
 import config
 
+_embeddings = None
+_embeddings_lock = threading.Lock()
+_bm25 = {"path": None, "mtime": None, "index": None}
+
+def embedding_model_id() -> str:
+    """Backend + model that produce the vectors; stores and caches are tagged with it."""
+    if config.EMBEDDING_BACKEND == "local":
+        return f"local:{config.LOCAL_EMBEDDING_MODEL}"
+    return f"openai:{config.EMBEDDING_MODEL}"
+
+def get_embeddings():
+    """Process-wide embeddings client for EMBEDDING_BACKEND, behind the disk cache when enabled."""
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:  # the warm-up thread and a first query may race to load the model
+            if _embeddings is None:
+                if config.EMBEDDING_BACKEND == "local":
+                    from ingestion.local_embeddings import LocalEmbeddings
+                    embeddings = LocalEmbeddings()
+                elif config.EMBEDDING_BACKEND == "openai":
+                    embeddings = OpenAIEmbeddings(model=config.EMBEDDING_MODEL,
+                                                  openai_api_key=config.OPENAI_API_KEY)
+                else:
+                    raise ValueError(f"Unknown EMBEDDING_BACKEND: {config.EMBEDDING_BACKEND!r} (use local|openai)")
+                if config.EMBEDDING_CACHE_ENABLED:
+                    embeddings = CachedEmbeddings(embeddings, embedding_model_id())
+                _embeddings = embeddings
+    return _embeddings
+
+def _open_store():
+    """New collections are tagged with the embedding model that fills them."""
+    return Chroma(persist_directory=config.CHROMA_PERSIST_DIR, embedding_function=get_embeddings(),
+                  collection_metadata={"embedding_model": embedding_model_id()})
+
+def store_embedding_model(vs) -> str:
+    # Untagged stores predate the tag and could only have been built with OpenAI
+    return (vs._collection.metadata or {}).get("embedding_model", f"openai:{config.EMBEDDING_MODEL}")
+
 def load_documents(source_dir):
-    loader = DirectoryLoader(source_dir, glob="**/*.pdf",
-                             loader_cls=PyPDFLoader, show_progress=True)
-    docs = loader.load()
+    paths = sorted(os.path.normpath(p) for p in
+                   glob.glob(os.path.join(source_dir, "**", "*.pdf"), recursive=True))
+    docs = [page for pages in parse_pdfs(paths).values() for page in pages]
     print(f"Loaded {len(docs)} pages.")
     return docs
 
@@ -23,28 +84,284 @@ def chunk_documents(documents):
     return chunks
 
 def build_vector_store(chunks):
-    embeddings = OpenAIEmbeddings(model=config.EMBEDDING_MODEL,
-                                   openai_api_key=config.OPENAI_API_KEY)
-    vs = Chroma.from_documents(documents=chunks, embedding=embeddings,
-                                persist_directory=config.CHROMA_PERSIST_DIR)
+    vs = Chroma.from_documents(documents=chunks, embedding=get_embeddings(),
+                                persist_directory=config.CHROMA_PERSIST_DIR,
+                                collection_metadata={"embedding_model": embedding_model_id()})
     print(f"Vector store saved to: {config.CHROMA_PERSIST_DIR}")
     return vs
 
+def _open_backend():
+    """The store for VECTOR_BACKEND; a stale or missing NumPy index is re-exported from Chroma first."""
+    if config.VECTOR_BACKEND == "chroma":
+        return _open_store()
+    if config.VECTOR_BACKEND == "numpy":
+        from ingestion import numpy_store
+        if numpy_store.is_stale():
+            numpy_store.export(_open_store())
+        return numpy_store.NumpyVectorStore(get_embeddings())
+    raise ValueError(f"Unknown VECTOR_BACKEND: {config.VECTOR_BACKEND!r} (use chroma|numpy)")
+
 def load_vector_store():
-    """Load existing store, or auto-build it from knowledge_base/ PDFs."""
-    embeddings = OpenAIEmbeddings(model=config.EMBEDDING_MODEL,
-                                   openai_api_key=config.OPENAI_API_KEY)
+    """
+    Open the built store, after installing the pinned KB_SNAPSHOT_VERSION if one is set.
+    Never ingests: a missing store is an error, not a reason to embed the corpus mid-request.
+    """
+    if config.KB_SNAPSHOT_VERSION:
+        from ingestion.snapshot import install
+        install(config.KB_SNAPSHOT_VERSION)
     store_exists = os.path.exists(config.CHROMA_PERSIST_DIR) and \
                    len(os.listdir(config.CHROMA_PERSIST_DIR)) > 0
     if not store_exists:
-        print("No vector store found — building from knowledge_base/...")
-        docs   = load_documents(config.KNOWLEDGE_BASE_DIR)
-        chunks = chunk_documents(docs)
-        return build_vector_store(chunks)
-    return Chroma(persist_directory=config.CHROMA_PERSIST_DIR,
-                  embedding_function=embeddings)
+        raise RuntimeError(
+            f"No vector store in {config.CHROMA_PERSIST_DIR}. Build one with `python -m ingestion.loader`, "
+            f"or pin a snapshot from {config.KB_SNAPSHOT_DIR} with KB_SNAPSHOT_VERSION."
+        )
+    vs = _open_backend()
+    if store_embedding_model(vs) != embedding_model_id():
+        raise RuntimeError(
+            f"Vector store in {config.CHROMA_PERSIST_DIR} was built with {store_embedding_model(vs)}, "
+            f"but EMBEDDING_BACKEND is configured for {embedding_model_id()}. "
+            f"Rebuild it with `python -m ingestion.loader` or switch the backend back."
+        )
+    if config.HYBRID_RETRIEVAL:
+        get_bm25_index(vs)
+    return vs
+
+# ── Lexical index ─────────────────────────────────────────────────────────
+def _bm25_path():
+    return os.path.join(config.CHROMA_PERSIST_DIR, "bm25_index.json")
+
+def build_bm25_index(vs) -> BM25Index:
+    """Index exactly the chunks stored in the collection and save it beside the store."""
+    data = vs._collection.get(include=["documents", "metadatas"])
+    index = BM25Index(data["ids"], data["documents"], [m or {} for m in data["metadatas"]])
+    index.save(_bm25_path())
+    print(f"BM25 index: {len(index)} chunks -> {_bm25_path()}")
+    return index
+
+def get_bm25_index(vs=None) -> BM25Index:
+    """Process-wide BM25 index, reloaded when an ingest rewrites it on disk."""
+    path = _bm25_path()
+    if not os.path.exists(path):
+        build_bm25_index(vs or load_vector_store())  # stores built before the lexical index existed
+    mtime = os.stat(path).st_mtime_ns
+    if _bm25["path"] != path or _bm25["mtime"] != mtime:
+        _bm25.update(path=path, mtime=mtime, index=BM25Index.load(path))
+    return _bm25["index"]
+
+def _manifest_path():
+    return os.path.join(config.CHROMA_PERSIST_DIR, "manifest.json")
+
+def store_fingerprint(vector_store) -> str:
+    """Changes whenever the collection is rebuilt or an ingest rewrites the manifest."""
+    collection = vector_store._collection
+    try:
+        manifest_mtime = os.stat(_manifest_path()).st_mtime_ns
+    except OSError:
+        manifest_mtime = 0
+    return f"{collection.id}:{collection.count()}:{manifest_mtime}"
+
+# ── Incremental ingestion ─────────────────────────────────────────────────
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def chunk_ids(rel: str, file_hash: str, count: int) -> list:
+    """`<path hash>-<content hash>-<n>` for the file at `rel` (relative to the knowledge base)."""
+    path_hash = hashlib.sha256(rel.replace(os.sep, "/").encode("utf-8")).hexdigest()[:8]
+    return [f"{path_hash}-{file_hash[:16]}-{i:05d}" for i in range(count)]
+
+def _index_settings() -> dict:
+    """Anything that changes chunk boundaries or vectors invalidates the whole manifest."""
+    return {"embedding_model": embedding_model_id(), "parser": "pymupdf",
+            "chunk_size": config.CHUNK_SIZE, "chunk_overlap": config.CHUNK_OVERLAP,
+            "chunk_ids": "path+content"}
+
+def load_manifest() -> dict:
+    if os.path.exists(_manifest_path()):
+        with open(_manifest_path()) as f:
+            return json.load(f)
+    return {"settings": _index_settings(), "files": {}}
+
+def _save_manifest(manifest: dict):
+    manifest["updated_at"] = time.time()
+    tmp = _manifest_path() + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, _manifest_path())
+
+def count_embedding_tokens(texts) -> int:
+    import tiktoken
+    enc = tiktoken.get_encoding("cl100k_base")  # tokenizer of the text-embedding-3 models
+    return sum(len(enc.encode(t)) for t in texts)
+
+# ── Parsing ───────────────────────────────────────────────────────────────
+def _parse_pdf(path: str) -> list:
+    """Runs in a worker process; returns plain page texts so results pickle cheaply."""
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        return [page.get_text() for page in doc]
+
+def parse_pdfs(paths: list) -> dict:
+    """path -> page Documents (0-based "page" metadata, as PyPDFLoader produced)."""
+    if not paths:
+        return {}
+    workers = min(config.INGEST_PARSE_WORKERS, len(paths))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        texts = dict(zip(paths, pool.map(_parse_pdf, paths)))
+    return {path: [Document(page_content=text,
+                            metadata={"source": path, "page": i, "total_pages": len(pages)})
+                   for i, text in enumerate(pages)]
+            for path, pages in texts.items()}
+
+def _chunk_file(pages: list, rel: str, file_hash: str):
+    chunks = chunk_documents(pages)
+    ids = chunk_ids(rel, file_hash, len(chunks))
+    for chunk, cid in zip(chunks, ids):
+        chunk.metadata["chunk_id"] = cid
+        chunk.metadata["file_hash"] = file_hash
+    return chunks, ids
+
+# ── Embedding ─────────────────────────────────────────────────────────────
+def _is_rate_limit(exc: Exception) -> bool:
+    return type(exc).__name__ == "RateLimitError" or getattr(exc, "status_code", None) == 429
+
+def _embed_with_backoff(texts: list) -> list:
+    for attempt in range(config.EMBED_MAX_RETRIES + 1):
+        try:
+            return get_embeddings().embed_documents(texts)
+        except Exception as e:
+            if not _is_rate_limit(e) or attempt == config.EMBED_MAX_RETRIES:
+                raise
+            delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+            print(f"  Rate limited — retrying batch in {delay:.1f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+
+def _existing_ids(vs, ids: list) -> set:
+    found = set()
+    for i in range(0, len(ids), 1000):
+        found.update(vs._collection.get(ids=ids[i:i + 1000], include=[])["ids"])
+    return found
+
+def embed_and_store(vs, chunks: list, ids: list) -> int:
+    """Embed chunks in concurrent batches and upsert each batch as soon as it is ready."""
+    batches = [(chunks[i:i + config.EMBED_BATCH_SIZE], ids[i:i + config.EMBED_BATCH_SIZE])
+               for i in range(0, len(chunks), config.EMBED_BATCH_SIZE)]
+
+    def run(batch):
+        batch_chunks, batch_ids = batch
+        vectors = _embed_with_backoff([c.page_content for c in batch_chunks])
+        vs._collection.upsert(ids=batch_ids, embeddings=vectors,
+                              documents=[c.page_content for c in batch_chunks],
+                              metadatas=[c.metadata for c in batch_chunks])
+        return len(batch_ids)
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=config.EMBED_CONCURRENCY) as pool:
+        for future in as_completed([pool.submit(run, b) for b in batches]):
+            done += future.result()
+            print(f"  Embedded {done}/{len(chunks)} chunks", end="\r")
+    if batches:
+        print()
+    return done
+
+# ── Ingest ────────────────────────────────────────────────────────────────
+def ingest(incremental: bool = True, source_dir: str = None) -> dict:
+    """Sync the vector store with source_dir and return a summary of what changed."""
+    source_dir = source_dir or config.KNOWLEDGE_BASE_DIR
+    os.makedirs(config.CHROMA_PERSIST_DIR, exist_ok=True)
+    manifest = load_manifest()
+    vs = _open_store()
+
+    untracked = not os.path.exists(_manifest_path()) and vs._collection.count() > 0  # pre-manifest build
+    matching = (not untracked and manifest.get("settings") == _index_settings()
+                and store_embedding_model(vs) == embedding_model_id())
+    if matching and manifest.get("rebuilding"):
+        print("Resuming an interrupted rebuild — chunks already stored are skipped.")
+    elif not incremental or not matching:
+        if incremental:
+            print("Store has no matching manifest (new settings or legacy build) — rebuilding everything.")
+        vs.delete_collection()
+        vs = _open_store()
+        manifest = {"settings": _index_settings(), "files": {}, "rebuilding": True}
+        _save_manifest(manifest)  # a crash from here on resumes instead of rebuilding again
+
+    summary = {key: 0 for key in (
+        "files_added", "files_updated", "files_deleted", "files_skipped",
+        "chunks_added", "chunks_updated", "chunks_deleted", "chunks_skipped", "chunks_resumed",
+        "embedding_tokens", "pages")}
+    current = {os.path.relpath(p, source_dir): os.path.normpath(p)
+               for p in sorted(glob.glob(os.path.join(source_dir, "**", "*.pdf"), recursive=True))}
+
+    for rel in sorted(set(manifest["files"]) - set(current)):
+        old = manifest["files"].pop(rel)
+        if old["chunks"]:
+            vs.delete(ids=chunk_ids(rel, old["sha256"], old["chunks"]))
+        summary["files_deleted"]  += 1
+        summary["chunks_deleted"] += old["chunks"]
+        print(f"  - {rel} ({old['chunks']} chunks removed)")
+
+    pending = {}
+    for rel, path in current.items():
+        file_hash = file_sha256(path)
+        old = manifest["files"].get(rel)
+        if old and old["sha256"] == file_hash:
+            summary["files_skipped"]  += 1
+            summary["chunks_skipped"] += old["chunks"]
+        else:
+            pending[rel] = (path, file_hash)
+
+    t0 = time.perf_counter()
+    parsed = parse_pdfs([path for path, _ in pending.values()])
+    parse_s = time.perf_counter() - t0
+
+    files, to_embed, to_embed_ids = {}, [], []
+    for rel, (path, file_hash) in pending.items():
+        chunks, ids = _chunk_file(parsed[path], rel, file_hash)
+        summary["pages"] += len(parsed[path])
+        stored = _existing_ids(vs, ids)  # left behind by an interrupted run
+        summary["chunks_resumed"] += len(stored)
+        for chunk, cid in zip(chunks, ids):
+            if cid not in stored:
+                to_embed.append(chunk)
+                to_embed_ids.append(cid)
+        files[rel] = (file_hash, len(chunks))
+
+    t0 = time.perf_counter()
+    embed_and_store(vs, to_embed, to_embed_ids)
+    embed_s = time.perf_counter() - t0
+    if config.EMBEDDING_BACKEND == "openai":  # local embedding has no per-token cost
+        summary["embedding_tokens"] = count_embedding_tokens(c.page_content for c in to_embed)
+
+    # Old chunks go only after their replacements are stored
+    for rel, (file_hash, n_chunks) in files.items():
+        old = manifest["files"].get(rel)
+        if old and old["chunks"]:
+            vs.delete(ids=chunk_ids(rel, old["sha256"], old["chunks"]))
+            summary["chunks_deleted"] += old["chunks"]
+        summary["files_updated" if old else "files_added"]   += 1
+        summary["chunks_updated" if old else "chunks_added"] += n_chunks
+        manifest["files"][rel] = {"sha256": file_hash, "chunks": n_chunks}
+        print(f"  {'~' if old else '+'} {rel} ({n_chunks} chunks)")
+
+    manifest.pop("rebuilding", None)
+    _save_manifest(manifest)
+    build_bm25_index(vs)
+    if config.VECTOR_BACKEND == "numpy":
+        from ingestion import numpy_store
+        numpy_store.export(vs)
+    summary["pages_per_s"]  = round(summary["pages"] / parse_s, 1) if parse_s and pending else 0.0
+    summary["chunks_per_s"] = round(len(to_embed) / embed_s, 1) if embed_s and to_embed else 0.0
+    print("Ingest summary: " + ", ".join(f"{k}={v}" for k, v in summary.items()))
+    return summary
 
 if __name__ == "__main__":
-    docs   = load_documents(config.KNOWLEDGE_BASE_DIR)
-    chunks = chunk_documents(docs)
-    build_vector_store(chunks)
+    parser = argparse.ArgumentParser(description="Build or update the BuildIt vector store.")
+    parser.add_argument("--full", action="store_true",
+                        help="drop the collection and re-embed everything (default: only what changed)")
+    parser.add_argument("--incremental", action="store_true", help=argparse.SUPPRESS)  # the default now
+    args = parser.parse_args()
+    ingest(incremental=not args.full)
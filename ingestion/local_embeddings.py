@@ -0,0 +1,37 @@
+"""
+Local CPU embedding backend (EMBEDDING_BACKEND=local) using sentence-transformers.
+The default model is multilingual (Polish included). Inference is batched; thread count
+and dynamic int8 quantization of the Linear layers are configurable.
+"""
+from typing import List
+from langchain_core.embeddings import Embeddings
+import config
+
+class LocalEmbeddings(Embeddings):
+    def __init__(self, model_name: str = None, batch_size: int = None,
+                 threads: int = None, quantize: bool = None):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name or config.LOCAL_EMBEDDING_MODEL
+        self.batch_size = batch_size or config.LOCAL_EMBEDDING_BATCH_SIZE
+        torch.set_num_threads(threads or config.LOCAL_EMBEDDING_THREADS)
+        model = SentenceTransformer(self.model_name, device="cpu")
+        if config.LOCAL_EMBEDDING_QUANTIZE if quantize is None else quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        # E5 models are trained with these prefixes; other models take raw text
+        e5 = "e5" in self.model_name.lower()
+        self.query_prefix   = "query: " if e5 else ""
+        self.passage_prefix = "passage: " if e5 else ""
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                    normalize_embeddings=True, show_progress_bar=False)
+        return vectors.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode([self.passage_prefix + t for t in texts])
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([self.query_prefix + text])[0]
@@ -0,0 +1,159 @@
+"""
+Read-only, memory-mapped NumPy copy of the Chroma collection (VECTOR_BACKEND=numpy).
+
+export() writes the collection into CHROMA_PERSIST_DIR/numpy_index/:
+  vectors.npy   (n, dim) float32 or float16 (VECTOR_INDEX_DTYPE), contiguous
+  norms.npy     (n,) float32 vector norms, for the l2 and cosine distances
+  chunks.bin    one JSON record {id, document, metadata} per chunk, back to back
+  offsets.npy   (n + 1,) int64 byte offsets into chunks.bin
+  meta.json     dim, dtype, distance, embedding model, source collection and manifest mtime
+
+Every process maps the files read-only, so the OS page cache holds one copy shared by all
+Streamlit and API workers, and no Chroma client (SQLite + HNSW) is opened. Search is exact:
+a blocked matrix-vector product followed by argpartition, returning the same distances as
+Chroma for the collection's hnsw:space. Only the top-k records are decoded from chunks.bin.
+
+Chroma stays the source of truth: ingestion writes to it and re-exports, and
+ingestion.loader re-exports on load whenever the manifest changed since the last export.
+"""
+import json, mmap, os, time
+from typing import List
+import numpy as np
+from langchain_core.vectorstores import VectorStore
+import config
+
+BLOCK_ROWS = 1024  # rows per matmul block; bounds the float32 copy of a float16 block (6 MB at 1536 dims)
+
+def index_dir() -> str:
+    return os.path.join(config.CHROMA_PERSIST_DIR, "numpy_index")
+
+def _manifest_mtime() -> int:
+    try:
+        return os.stat(os.path.join(config.CHROMA_PERSIST_DIR, "manifest.json")).st_mtime_ns
+    except OSError:
+        return 0
+
+def is_stale() -> bool:
+    """True if there is no export, or an ingest has rewritten the manifest since the last one."""
+    try:
+        with open(os.path.join(index_dir(), "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return True
+    return (meta.get("manifest_mtime_ns") != _manifest_mtime()
+            or meta.get("dtype") != config.VECTOR_INDEX_DTYPE)
+
+def _replace(path: str, write):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+def export(vs, dtype: str = None, path: str = None) -> dict:
+    """Write the Chroma store `vs` as a memory-mappable index; meta.json is replaced last."""
+    dtype, out = dtype or config.VECTOR_INDEX_DTYPE, path or index_dir()
+    t0 = time.perf_counter()
+    data = vs._collection.get(include=["embeddings", "documents", "metadatas"])
+    vectors = np.asarray(data["embeddings"], dtype=np.float32).reshape(len(data["ids"]), -1)
+    stored = np.ascontiguousarray(vectors, dtype=dtype)
+    records = [json.dumps({"id": cid, "document": doc, "metadata": meta or {}}, ensure_ascii=False).encode("utf-8")
+               for cid, doc, meta in zip(data["ids"], data["documents"], data["metadatas"])]
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(r) for r in records])
+    collection_meta = vs._collection.metadata or {}
+    meta = {"count": len(records), "dim": int(stored.shape[1]), "dtype": dtype,
+            "distance": collection_meta.get("hnsw:space", "l2"),
+            "embedding_model": collection_meta.get("embedding_model"),
+            "collection_id": str(vs._collection.id), "manifest_mtime_ns": _manifest_mtime(),
+            "exported_at": time.time()}
+
+    os.makedirs(out, exist_ok=True)
+    target = lambda name: os.path.join(out, name)
+    _replace(target("vectors.npy"), lambda f: np.save(f, stored))
+    _replace(target("norms.npy"), lambda f: np.save(f, np.linalg.norm(stored.astype(np.float32), axis=1)))
+    _replace(target("offsets.npy"), lambda f: np.save(f, offsets))
+    _replace(target("chunks.bin"), lambda f: f.writelines(records))
+    _replace(target("meta.json"), lambda f: f.write(json.dumps(meta, indent=2).encode()))
+    print(f"NumPy index: {meta['count']} chunks ({dtype}) -> {out} "
+          f"in {time.perf_counter() - t0:.1f}s")
+    return meta
+
+class MmapCollection:
+    """The subset of chromadb's Collection API the app reads: query, get, count, id, metadata."""
+
+    def __init__(self, path: str = None):
+        path = path or index_dir()
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.norms   = np.load(os.path.join(path, "norms.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        with open(os.path.join(path, "chunks.bin"), "rb") as f:
+            self._chunks = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.meta["count"] else b""
+        self._sq_norms = np.square(self.norms, dtype=np.float32)
+        self._positions = None  # id -> row, built on the first get(ids=...)
+        self.id = self.meta["collection_id"]
+        self.metadata = {"hnsw:space": self.meta["distance"]}
+        if self.meta["embedding_model"]:  # untagged (legacy) stores stay untagged
+            self.metadata["embedding_model"] = self.meta["embedding_model"]
+
+    def count(self) -> int:
+        return self.meta["count"]
+
+    def _record(self, i: int) -> dict:
+        return json.loads(self._chunks[self.offsets[i]:self.offsets[i + 1]])
+
+    def _distances(self, query: np.ndarray) -> np.ndarray:
+        dots = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), BLOCK_ROWS):
+            block = self.vectors[start:start + BLOCK_ROWS]
+            dots[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+        distance = self.meta["distance"]
+        if distance == "ip":
+            return 1.0 - dots
+        if distance == "cosine":
+            return 1.0 - dots / np.maximum(self.norms * np.linalg.norm(query), 1e-12)
+        return np.maximum(self._sq_norms + query @ query - 2.0 * dots, 0.0)  # squared l2, as Chroma
+
+    def query(self, query_embeddings, n_results: int = 10, include=("documents", "metadatas", "distances")) -> dict:
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in query_embeddings:
+            dist = self._distances(np.asarray(query, dtype=np.float32))
+            k = min(n_results, len(dist))
+            top = np.argpartition(dist, k - 1)[:k] if k else np.array([], dtype=np.int64)
+            top = top[np.argsort(dist[top], kind="stable")]
+            records = [self._record(i) for i in top]
+            result["ids"].append([r["id"] for r in records])
+            result["documents"].append([r["document"] for r in records])
+            result["metadatas"].append([r["metadata"] for r in records])
+            result["distances"].append(dist[top].tolist())
+        return {key: value for key, value in result.items() if key == "ids" or key in include}
+
+    def get(self, ids: List[str] = None, include=("documents", "metadatas")) -> dict:
+        if ids is None:
+            rows = range(self.count())
+        else:
+            if self._positions is None:
+                self._positions = {self._record(i)["id"]: i for i in range(self.count())}
+            rows = [self._positions[cid] for cid in dict.fromkeys(ids) if cid in self._positions]
+        records = [self._record(i) for i in rows]
+        result = {"ids": [r["id"] for r in records]}
+        if "embeddings" in include:
+            result["embeddings"] = self.vectors[list(rows)].astype(np.float32)
+        if "documents" in include:
+            result["documents"] = [r["document"] for r in records]
+        if "metadatas" in include:
+            result["metadatas"] = [r["metadata"] for r in records]
+        return result
+
+class NumpyVectorStore:
+    """Stands in for the Chroma store in retrieval: .embeddings, ._collection and the relevance function."""
+
+    def __init__(self, embeddings, path: str = None):
+        self.embeddings  = embeddings
+        self._collection = MmapCollection(path)
+
+    def _select_relevance_score_fn(self):
+        return {"cosine": VectorStore._cosine_relevance_score_fn,
+                "l2": VectorStore._euclidean_relevance_score_fn,
+                "ip": VectorStore._max_inner_product_relevance_score_fn}[self._collection.meta["distance"]]
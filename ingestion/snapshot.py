@@ -0,0 +1,170 @@
+"""
+Versioned, checksummed snapshots of the knowledge-base index.
+
+A snapshot is KB_SNAPSHOT_DIR/kb-<version>.tar.gz (the Chroma store with its ingest manifest
+and BM25 index) plus kb-<version>.json: the embedding model and chunk settings it was built
+with, the sha256 and chunk count of every source PDF, the sha256 of every file in the
+archive and of the archive itself.
+
+    python -m ingestion.snapshot build                # incremental ingest, then pack
+    python -m ingestion.snapshot build 2026.10-rc1 --no-ingest
+    python -m ingestion.snapshot list
+    python -m ingestion.snapshot install <version>    # what startup does for KB_SNAPSHOT_VERSION
+
+With KB_SNAPSHOT_VERSION set, load_vector_store() installs that version into
+CHROMA_PERSIST_DIR before opening it (a no-op once installed). Installation checks the
+embedding model before unpacking anything, verifies every checksum, and swaps the directory
+in atomically under a file lock, so concurrent workers starting together install it once.
+"""
+import argparse, fcntl, hashlib, json, os, shutil, tarfile, tempfile, time
+from contextlib import contextmanager
+import config
+
+INSTALLED = "snapshot.json"                 # written into the installed store
+EXCLUDE   = {INSTALLED, "numpy_index"}      # derived per deployment, never archived
+
+def _paths(version: str, snapshot_dir: str = None):
+    base = os.path.join(snapshot_dir or config.KB_SNAPSHOT_DIR, f"kb-{version}")
+    return base + ".tar.gz", base + ".json"
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _store_files(store_dir: str) -> list:
+    files = []
+    for root, dirs, names in os.walk(store_dir):
+        dirs[:] = sorted(d for d in dirs if d not in EXCLUDE)
+        files += [os.path.relpath(os.path.join(root, n), store_dir) for n in sorted(names)
+                  if n not in EXCLUDE and not n.endswith(".tmp")]
+    return files
+
+# ── Build ─────────────────────────────────────────────────────────────────
+def build(version: str = None, ingest_first: bool = True, snapshot_dir: str = None) -> dict:
+    """Pack CHROMA_PERSIST_DIR (after an incremental ingest) as snapshot `version`."""
+    from ingestion.loader import embedding_model_id, ingest, load_manifest
+    if ingest_first:
+        ingest(incremental=True)
+    manifest = load_manifest()
+    if not manifest["files"]:
+        raise RuntimeError(f"No ingested sources in {config.CHROMA_PERSIST_DIR}; run `python -m ingestion.loader`")
+    content = hashlib.sha256(json.dumps([manifest["settings"], manifest["files"]], sort_keys=True).encode())
+    version = version or f"{time.strftime('%Y.%m.%d')}-{content.hexdigest()[:8]}"
+    archive, sidecar = _paths(version, snapshot_dir)
+    if os.path.exists(sidecar):
+        raise FileExistsError(f"Snapshot {version} already exists: {sidecar}")
+
+    store = config.CHROMA_PERSIST_DIR
+    files = _store_files(store)
+    os.makedirs(os.path.dirname(archive) or ".", exist_ok=True)
+    with tarfile.open(archive + ".tmp", "w:gz") as tar:
+        for rel in files:
+            tar.add(os.path.join(store, rel), arcname=rel)
+    os.replace(archive + ".tmp", archive)
+    meta = {
+        "version":         version,
+        "created_at":      time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "embedding_model": embedding_model_id(),
+        "settings":        manifest["settings"],  # embedding model, parser, chunk size/overlap
+        "sources":         manifest["files"],     # source path -> {sha256, chunks}
+        "chunks":          sum(f["chunks"] for f in manifest["files"].values()),
+        "files":           {rel: _sha256(os.path.join(store, rel)) for rel in files},
+        "archive_sha256":  _sha256(archive),
+    }
+    with open(sidecar, "w") as f:
+        json.dump(meta, f, indent=2, sort_keys=True)
+    print(f"Snapshot {version}: {meta['chunks']} chunks from {len(meta['sources'])} sources -> {archive}")
+    return meta
+
+def list_snapshots(snapshot_dir: str = None) -> list:
+    snapshot_dir = snapshot_dir or config.KB_SNAPSHOT_DIR
+    if not os.path.isdir(snapshot_dir):
+        return []
+    metas = []
+    for name in sorted(os.listdir(snapshot_dir)):
+        if name.startswith("kb-") and name.endswith(".json"):
+            with open(os.path.join(snapshot_dir, name)) as f:
+                meta = json.load(f)
+            metas.append({k: meta[k] for k in ("version", "created_at", "embedding_model", "chunks")})
+    return metas
+
+# ── Install ───────────────────────────────────────────────────────────────
+def installed(store_dir: str = None) -> dict:
+    """The sidecar of the snapshot installed in the store, or None for a locally built store."""
+    try:
+        with open(os.path.join(store_dir or config.CHROMA_PERSIST_DIR, INSTALLED)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+@contextmanager
+def _locked(store_dir: str):
+    os.makedirs(os.path.dirname(os.path.abspath(store_dir)), exist_ok=True)
+    with open(os.path.abspath(store_dir) + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def install(version: str, store_dir: str = None, snapshot_dir: str = None) -> dict:
+    """Make snapshot `version` the store in `store_dir`; raises before touching it on any mismatch."""
+    from ingestion.loader import embedding_model_id
+    store_dir = os.path.abspath(store_dir or config.CHROMA_PERSIST_DIR)
+    archive, sidecar = _paths(version, snapshot_dir)
+    if not os.path.exists(sidecar) or not os.path.exists(archive):
+        raise FileNotFoundError(f"KB snapshot {version} not found in {os.path.dirname(archive)} "
+                                f"(build it with `python -m ingestion.snapshot build`)")
+    with open(sidecar) as f:
+        meta = json.load(f)
+    if meta["embedding_model"] != embedding_model_id():
+        raise RuntimeError(f"KB snapshot {version} was built with {meta['embedding_model']}, but "
+                           f"EMBEDDING_BACKEND is configured for {embedding_model_id()}")
+
+    with _locked(store_dir):
+        current = installed(store_dir)
+        if current and current["version"] == version and current["archive_sha256"] == meta["archive_sha256"]:
+            return meta  # another worker, or an earlier start, got here first
+        if _sha256(archive) != meta["archive_sha256"]:
+            raise RuntimeError(f"KB snapshot {version}: archive checksum mismatch ({archive})")
+        staging = tempfile.mkdtemp(prefix=".kb-", dir=os.path.dirname(store_dir))
+        retired = None
+        try:
+            with tarfile.open(archive, "r:gz") as tar:
+                tar.extractall(staging, filter="data")
+            for rel, digest in meta["files"].items():
+                if _sha256(os.path.join(staging, rel)) != digest:
+                    raise RuntimeError(f"KB snapshot {version}: checksum mismatch for {rel}")
+            with open(os.path.join(staging, INSTALLED), "w") as f:
+                json.dump(meta, f, indent=2, sort_keys=True)
+            if os.path.exists(store_dir):
+                retired = staging + ".old"
+                os.replace(store_dir, retired)
+            os.replace(staging, store_dir)
+            if retired:
+                shutil.rmtree(retired, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            if retired and not os.path.exists(store_dir):
+                os.replace(retired, store_dir)
+            raise
+    print(f"Installed KB snapshot {version} ({meta['chunks']} chunks) into {store_dir}")
+    return meta
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build, list or install knowledge-base snapshots.")
+    parser.add_argument("command", choices=["build", "list", "install"])
+    parser.add_argument("version", nargs="?", help="required for install; build defaults to date-contenthash")
+    parser.add_argument("--no-ingest", action="store_true", help="pack the store as it is")
+    args = parser.parse_args()
+    if args.command == "build":
+        build(args.version, ingest_first=not args.no_ingest)
+    elif args.command == "list":
+        print(json.dumps(list_snapshots(), indent=2))
+    elif not args.version:
+        parser.error("install needs a version")
+    else:
+        install(args.version)
@@ -40,4 +40,4 @@ if __name__ == "__main__":
     print("BuildIt PL - Knowledge Base Seeder")
     for source in SOURCES:
         download_source(source)
-    print("Done. Now run: python ingestion/loader.py")
+    print("Done. Now run: python -m ingestion.loader")
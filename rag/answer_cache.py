@@ -0,0 +1,129 @@
+"""
+Semantic answer cache in front of the RAG chain.
+A question is served from cache when its query embedding is within ANSWER_CACHE_THRESHOLD
+cosine similarity of a previous question answered by the same model. Entries expire after
+ANSWER_CACHE_TTL_HOURS and are dropped whenever the vector store fingerprint changes.
+
+Every worker process shares the SQLite file. Each keeps an in-memory matrix per model and,
+on every lookup, appends the rows added since its last one (by any process) and drops
+everything when another process has cleared the table (the meta "generation" changed).
+"""
+import json, os, sqlite3, threading, time
+import numpy as np
+import config
+
+class AnswerCache:
+    def __init__(self, path: str = None, threshold: float = None, ttl_s: float = None):
+        self.path      = path or config.ANSWER_CACHE_PATH
+        self.threshold = threshold if threshold is not None else config.ANSWER_CACHE_THRESHOLD
+        self.ttl_s     = ttl_s if ttl_s is not None else config.ANSWER_CACHE_TTL_HOURS * 3600
+        self._lock  = threading.Lock()
+        self._index = {}  # model -> (ids ascending, unit-norm matrix, created timestamps)
+        self._generation = None
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._con = sqlite3.connect(self.path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                model TEXT,
+                question TEXT,
+                vector BLOB,
+                answer TEXT,
+                sources TEXT,
+                cost_usd REAL,
+                created REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_answers_model ON answers(model, created);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._con.commit()
+
+    # ── Store invalidation ────────────────────────────────────────────────
+    def sync(self, fingerprint: str):
+        """Clear every entry if the vector store was rebuilt since they were cached."""
+        with self._lock:
+            row = self._con.execute("SELECT value FROM meta WHERE key='store'").fetchone()
+            if row and row[0] == fingerprint:
+                return
+            self._con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('store', ?)",
+                              (fingerprint,))
+            self._clear_locked()
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def _clear_locked(self):
+        self._con.execute("DELETE FROM answers")
+        self._con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)",
+                          (str(time.time_ns()),))
+        self._con.commit()
+        self._index.clear()
+
+    # ── Lookup / store ────────────────────────────────────────────────────
+    def _model_index(self, model: str):
+        """The model's entries, caught up with rows any process added since the last call."""
+        row = self._con.execute("SELECT value FROM meta WHERE key='generation'").fetchone()
+        generation = row[0] if row else None
+        if generation != self._generation:  # cleared, here or in another process
+            self._index.clear()
+            self._generation = generation
+        ids, matrix, created = self._index.get(model, ([], None, np.empty(0)))
+        cutoff = time.time() - self.ttl_s
+        rows = self._con.execute(
+            "SELECT id, vector, created FROM answers WHERE id>? AND model=? AND created>? ORDER BY id",
+            (ids[-1] if ids else 0, model, cutoff)
+        ).fetchall()
+        if rows:
+            fresh = created > cutoff  # expired entries are dropped while appending
+            new = np.vstack([np.frombuffer(v, dtype=np.float32) for _, v, _ in rows])
+            ids = [i for i, keep in zip(ids, fresh) if keep] + [r[0] for r in rows]
+            matrix = new if matrix is None else np.vstack([matrix[fresh], new])
+            created = np.concatenate([created[fresh], [r[2] for r in rows]])
+            self._index[model] = (ids, matrix, created)
+        return ids, matrix, created
+
+    def lookup(self, model: str, embedding) -> dict:
+        """Return the closest unexpired cached answer for this model, or None."""
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            ids, matrix, created = self._model_index(model)
+            if not ids:
+                return None
+            sims = matrix @ query
+            sims[created < time.time() - self.ttl_s] = -1.0
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            row = self._con.execute(
+                "SELECT question, answer, sources, cost_usd FROM answers WHERE id=?", (ids[best],)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"question": row[0], "answer": row[1], "sources": json.loads(row[2]),
+                "cost_usd": row[3], "similarity": round(float(sims[best]), 4)}
+
+    def store(self, model: str, question: str, embedding, answer: str, sources: list, cost_usd: float):
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        now = time.time()
+        with self._lock:
+            self._con.execute("DELETE FROM answers WHERE created<?", (now - self.ttl_s,))
+            self._con.execute(
+                "INSERT INTO answers (model, question, vector, answer, sources, cost_usd, created) "
+                "VALUES (?,?,?,?,?,?,?)",
+                (model, question, vector.tobytes(), answer, json.dumps(sources), cost_usd, now)
+            )
+            self._con.commit()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+    return _cache
@@ -0,0 +1,149 @@
+"""
+Bulk question answering for regression runs and FAQ generation.
+
+    python -m rag.batch questions.txt --out results.jsonl --concurrency 8
+
+Input is .txt (one question per line), .csv (a "question" column) or .jsonl ("question" key).
+Exact duplicates (after normalization) and near-duplicates (query-embedding cosine similarity
+>= BATCH_DEDUPE_THRESHOLD) are answered once. Each result is appended to the JSONL output as
+soon as it finishes; re-running with the same --out skips questions already answered.
+"""
+import argparse, csv, json, os, re, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from ingestion.loader import load_vector_store
+from rag.pipeline import ask, build_rag_chain
+from rag.router import route_query
+import config
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"[\s?!.]+$", "", " ".join(question.casefold().split()))
+
+def read_questions(path: str) -> list:
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            return [row["question"] for row in csv.DictReader(f) if row.get("question", "").strip()]
+        if path.endswith(".jsonl"):
+            return [json.loads(line)["question"] for line in f if line.strip()]
+        return [line.strip() for line in f if line.strip()]
+
+def _answered(out_path: str) -> set:
+    """Normalized questions with a successful result already in the output file."""
+    done = set()
+    if out_path and os.path.exists(out_path):
+        with open(out_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # partial line from an interrupted run
+                if "error" not in row:
+                    done.add(normalize_question(row["question"]))
+    return done
+
+def _near_duplicate_groups(questions: list, embeddings: list, threshold: float) -> list:
+    """Greedy clustering: each question joins the first earlier representative it matches."""
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+    reps, groups = [], []
+    for i in range(len(questions)):
+        if reps:
+            sims = matrix[reps] @ matrix[i]
+            best = int(np.argmax(sims))
+            if sims[best] >= threshold:
+                groups[best].append(i)
+                continue
+        reps.append(i)
+        groups.append([i])
+    return groups
+
+def ask_many(questions, concurrency: int = 4, out_path: str = None,
+             vector_store=None, dedupe_threshold: float = None) -> dict:
+    """Answer questions concurrently and return a throughput / cost summary."""
+    t_start = time.perf_counter()
+    threshold = dedupe_threshold if dedupe_threshold is not None else config.BATCH_DEDUPE_THRESHOLD
+    vector_store = vector_store or load_vector_store()
+    chains = {premium: build_rag_chain(premium, vector_store=vector_store) for premium in (False, True)}
+
+    # Exact duplicates and already-answered questions
+    done = _answered(out_path)
+    unique, seen, resumed, exact = [], set(), 0, 0
+    for q in questions:
+        key = normalize_question(q)
+        if key in done:
+            resumed += 1
+        elif key in seen:
+            exact += 1
+        else:
+            seen.add(key)
+            unique.append(q)
+
+    # Near duplicates, on the query embeddings (cached for the ask() calls that follow)
+    embed = vector_store.embeddings.embed_query
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        vectors = list(pool.map(embed, unique))
+    groups = _near_duplicate_groups(unique, vectors, threshold) if unique else []
+
+    summary = {"questions": len(questions), "unique": len(groups), "answered": 0,
+               "exact_duplicates": exact, "near_duplicates": len(unique) - len(groups),
+               "resumed": resumed, "errors": 0, "by_model": {}}
+    write_lock = threading.Lock()
+    out = open(out_path, "a", encoding="utf-8") if out_path else None
+
+    def run(group):
+        rep = unique[group[0]]
+        route = route_query(rep, embedding=vectors[group[0]])
+        chain_tuple = chains[route.premium]
+        t0 = time.perf_counter()
+        try:
+            result = ask(chain_tuple, rep, chain_tuple[2], embedding=route.embedding)
+            result["latency_s"] = round(time.perf_counter() - t0, 3)
+        except Exception as e:
+            result = {"error": repr(e), "model_used": chain_tuple[2]}
+        rows = [{"question": rep, **result}]
+        rows += [{"question": unique[i], "duplicate_of": rep, **result} for i in group[1:]]
+        with write_lock:
+            if out:
+                out.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+                out.flush()
+            stats = summary["by_model"].setdefault(result["model_used"], {
+                "requests": 0, "cost_usd": 0.0, "cost_saved_usd": 0.0,
+                "input_tokens": 0, "output_tokens": 0, "latency_s": 0.0})
+            if "error" in result:
+                summary["errors"] += len(rows)
+                return
+            summary["answered"] += len(rows)
+            stats["requests"]       += 1
+            stats["cost_usd"]       += result["query_cost_usd"]
+            stats["cost_saved_usd"] += result.get("cost_saved_usd", 0.0)
+            stats["input_tokens"]   += result.get("input_tokens", 0)
+            stats["output_tokens"]  += result.get("output_tokens", 0)
+            stats["latency_s"]      += result["latency_s"]
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in as_completed([pool.submit(run, g) for g in groups]):
+                future.result()
+    finally:
+        if out:
+            out.close()
+
+    wall_s = time.perf_counter() - t_start
+    for stats in summary["by_model"].values():
+        stats["mean_latency_s"] = round(stats.pop("latency_s") / stats["requests"], 3) if stats["requests"] else 0.0
+        stats["cost_usd"] = round(stats["cost_usd"], 6)
+    summary["wall_s"] = round(wall_s, 2)
+    summary["questions_per_s"] = round(summary["answered"] / wall_s, 2) if wall_s else 0.0
+    summary["total_cost_usd"] = round(sum(s["cost_usd"] for s in summary["by_model"].values()), 6)
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a file of questions in bulk.")
+    parser.add_argument("questions", help=".txt, .csv or .jsonl file of questions")
+    parser.add_argument("--out", default="results.jsonl", help="JSONL output; re-run to resume")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--dedupe-threshold", type=float, default=None)
+    args = parser.parse_args()
+    result = ask_many(read_questions(args.questions), concurrency=args.concurrency,
+                      out_path=args.out, dedupe_threshold=args.dedupe_threshold)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,112 @@
+"""
+Token-budgeted context packing, replacing a verbatim join of the top-k chunks.
+
+  1. merge chunks from the same source page whose text overlaps (CHUNK_OVERLAP repeats)
+  2. drop near-duplicate passages
+  3. order by maximal marginal relevance (relevance vs. overlap with passages already chosen)
+  4. add passages in that order while they fit in CONTEXT_TOKEN_BUDGET (tiktoken)
+
+A merged span longer than the budget is trimmed to it before ordering, so the most relevant
+passage is always packed, never skipped in favour of smaller, less relevant ones.
+"""
+import re
+from typing import List, Tuple
+from langchain_core.documents import Document
+from utils.cost_tracker import count_tokens, truncate_tokens
+import config
+
+MIN_OVERLAP_CHARS = 20
+DUPLICATE_JACCARD = 0.8
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is a prefix of b."""
+    longest = min(len(a), len(b), 2 * config.CHUNK_OVERLAP)
+    for k in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+def merge_overlapping(passages: List[dict]) -> List[dict]:
+    """Join same-page passages where one continues the other."""
+    merged = []
+    for p in passages:
+        for m in merged:
+            if m["key"] != p["key"]:
+                continue
+            if p["text"] in m["text"]:
+                k, joined = len(p["text"]), m["text"]
+            elif m["text"] in p["text"]:
+                k, joined = len(m["text"]), p["text"]
+            elif _overlap(m["text"], p["text"]):
+                k = _overlap(m["text"], p["text"])
+                joined = m["text"] + p["text"][k:]
+            elif _overlap(p["text"], m["text"]):
+                k = _overlap(p["text"], m["text"])
+                joined = p["text"] + m["text"][k:]
+            else:
+                continue
+            m.update(text=joined, score=max(m["score"], p["score"]), ids=m["ids"] + p["ids"])
+            break
+        else:
+            merged.append(dict(p))
+    return merged
+
+def drop_near_duplicates(passages: List[dict]) -> List[dict]:
+    kept = []
+    for p in sorted(passages, key=lambda p: -p["score"]):
+        shingles = _shingles(p["text"])
+        if all(_jaccard(shingles, _shingles(k["text"])) < DUPLICATE_JACCARD for k in kept):
+            kept.append(p)
+    return kept
+
+def mmr_order(passages: List[dict], lam: float = None) -> List[dict]:
+    lam = config.MMR_LAMBDA if lam is None else lam
+    if not passages:
+        return []
+    top = max(p["score"] for p in passages) or 1.0
+    words = [_words(p["text"]) for p in passages]
+    remaining, order = list(range(len(passages))), []
+    while remaining:
+        def mmr(i):
+            redundancy = max((_jaccard(words[i], words[j]) for j in order), default=0.0)
+            return lam * passages[i]["score"] / top - (1 - lam) * redundancy
+        best = max(remaining, key=mmr)
+        order.append(best)
+        remaining.remove(best)
+    return [passages[i] for i in order]
+
+def pack_context(docs: List[Document], scores: List[float], chunk_ids: List[str],
+                 model: str, budget_tokens: int = None) -> Tuple[List[Tuple[Document, float, str]], dict]:
+    """
+    Returns the packed (document, score, chunk ids) triples in prompt order, plus token stats.
+    `saved_tokens` is measured against the verbatim join of the top TOP_K_RESULTS chunks.
+    """
+    budget = budget_tokens or config.CONTEXT_TOKEN_BUDGET
+    passages = [{"key": (d.metadata.get("source"), d.metadata.get("page")), "text": d.page_content,
+                 "score": s, "ids": [cid], "metadata": d.metadata}
+                for d, s, cid in zip(docs, scores, chunk_ids)]
+    baseline = count_tokens(model, "\n\n".join(d.page_content for d in docs[:config.TOP_K_RESULTS]))
+
+    merged = merge_overlapping(passages)
+    for p in merged:
+        p["text"] = truncate_tokens(model, p["text"], budget - 1)  # + 1 separator token below
+
+    packed, used = [], 0
+    for p in mmr_order(drop_near_duplicates(merged)):
+        cost = count_tokens(model, p["text"]) + 1
+        if used + cost > budget and packed:  # the first (most relevant) pick is always kept
+            continue
+        used += cost
+        packed.append((Document(page_content=p["text"], metadata=p["metadata"]), p["score"], ",".join(p["ids"])))
+    return packed, {"candidates": len(docs), "passages": len(packed),
+                    "packed_tokens": used, "saved_tokens": max(0, baseline - used)}
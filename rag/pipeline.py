@@ -1,12 +1,21 @@
+import logging, time
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Iterator, List, Union
 from langchain_openai import ChatOpenAI
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from ingestion.loader import load_vector_store
+from ingestion.loader import load_vector_store, store_fingerprint, get_bm25_index
+from ingestion.bm25 import reciprocal_rank_fusion
+from rag.answer_cache import get_answer_cache
+from rag.context import pack_context
 from rag.prompts import SYSTEM_PROMPT, USER_TEMPLATE
-from utils.cost_tracker import log_usage, get_total_cost
+from utils.cost_tracker import log_usage, get_total_cost, usage_from_message, count_tokens
+from utils.tracing import count, observe
 import config
 
+logger = logging.getLogger(__name__)
+
 COMPLEX_KEYWORDS = ["permit", "legal", "law", "regulation", "article", "penalty", "fine", "court"]
 
 def is_complex_query(question):
@@ -15,39 +24,194 @@ def is_complex_query(question):
 def format_docs(docs):
     return "\n\n".join(doc.page_content for doc in docs)
 
-def build_rag_chain(premium=False):
-    vector_store = load_vector_store()
-    retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": config.TOP_K_RESULTS})
+# ── Retrieval ─────────────────────────────────────────────────────────────
+@dataclass
+class RetrievalResult:
+    """One embedding + one vector search, shared by the prompt and the source list."""
+    question: str
+    docs: List[Document]
+    scores: List[float]
+    chunk_ids: List[str]
+    timings: dict = field(default_factory=dict)
+    packing: dict = field(default_factory=dict)
+
+    def pack(self, model: str):
+        """Replace the raw candidates with the token-budgeted context from rag.context."""
+        t0 = time.perf_counter()
+        packed, self.packing = pack_context(self.docs, self.scores, self.chunk_ids, model)
+        self.docs      = [d for d, _, _ in packed]
+        self.scores    = [s for _, s, _ in packed]
+        self.chunk_ids = [c for _, _, c in packed]
+        self.timings["pack_s"] = round(time.perf_counter() - t0, 4)
+
+    @property
+    def context(self) -> str:
+        return format_docs(self.docs)
+
+    def sources(self) -> List[dict]:
+        """Unique (source, page) pairs, best relevance score first."""
+        best = {}
+        for doc, score, chunk_id in zip(self.docs, self.scores, self.chunk_ids):
+            key = (doc.metadata.get("source", "Unknown"), doc.metadata.get("page"))
+            if key not in best or score > best[key]["score"]:
+                best[key] = {"source": key[0], "page": key[1],
+                             "score": round(score, 3), "chunk_id": chunk_id}
+        return sorted(best.values(), key=lambda s: -s["score"])
+
+def _distances(vector_store, embedding, ids) -> dict:
+    """Stored chunks' distances to the query in the collection's space, as the search reports them."""
+    stored = vector_store._collection.get(ids=list(ids), include=["embeddings"])
+    vectors = np.asarray(stored["embeddings"], dtype=np.float32).reshape(len(stored["ids"]), -1)
+    query = np.asarray(embedding, dtype=np.float32)
+    dots = vectors @ query
+    space = (vector_store._collection.metadata or {}).get("hnsw:space", "l2")
+    if space == "ip":
+        dist = 1.0 - dots
+    elif space == "cosine":
+        dist = 1.0 - dots / np.maximum(np.linalg.norm(vectors, axis=1) * np.linalg.norm(query), 1e-12)
+    else:
+        dist = np.square(vectors - query).sum(axis=1)  # squared l2, as Chroma
+    return dict(zip(stored["ids"], dist.tolist()))
+
+def retrieve(vector_store, question, k=None, embedding=None) -> RetrievalResult:
+    """
+    Vector search, fused with BM25 hits by reciprocal rank when HYBRID_RETRIEVAL is on.
+    Fusion only orders the results: scores are always embedding relevance, computed from the
+    stored vector for chunks that only BM25 found. Pass a precomputed query embedding to skip
+    the embed stage.
+    """
+    k = k or config.TOP_K_RESULTS
+    fetch_k = max(k, config.HYBRID_FETCH_K) if config.HYBRID_RETRIEVAL else k
+    t0 = time.perf_counter()
+    if embedding is None:
+        embedding = vector_store.embeddings.embed_query(question)
+    t1 = time.perf_counter()
+    hits = vector_store._collection.query(query_embeddings=[embedding], n_results=fetch_k,
+                                          include=["documents", "metadatas", "distances"])
+    t2 = time.perf_counter()
+    observe("retrieve.search", t2 - t1)
+
+    relevance = vector_store._select_relevance_score_fn()
+    chunks = {cid: (Document(page_content=text, metadata=meta or {}), relevance(dist))
+              for cid, text, meta, dist in zip(hits["ids"][0], hits["documents"][0],
+                                                hits["metadatas"][0], hits["distances"][0])}
+    ranked = [(cid, score) for cid, (_, score) in chunks.items()][:k]
+    timings = {"embed_s": round(t1 - t0, 4), "search_s": round(t2 - t1, 4)}
+
+    if config.HYBRID_RETRIEVAL:
+        t3 = time.perf_counter()
+        bm25 = get_bm25_index(vector_store)
+        lexical = bm25.search(question, fetch_k)
+        fused = reciprocal_rank_fusion([list(hits["ids"][0]), [bm25.ids[i] for i, _ in lexical]],
+                                       k=config.RRF_K)[:k]
+        lexical_only = {bm25.ids[i]: i for i, _ in lexical if bm25.ids[i] not in chunks}
+        missing = [cid for cid, _ in fused if cid in lexical_only]
+        if missing:
+            dist = _distances(vector_store, embedding, missing)
+            for cid in missing:
+                i = lexical_only[cid]
+                chunks[cid] = (Document(page_content=bm25.texts[i], metadata=bm25.metadatas[i]),
+                               relevance(dist[cid]) if cid in dist else 0.0)
+        ranked = [(cid, chunks[cid][1]) for cid, _ in fused]
+        timings["bm25_s"] = round(time.perf_counter() - t3, 5)
+        observe("retrieve.bm25", time.perf_counter() - t3)
+
+    return RetrievalResult(
+        question=question,
+        docs=[chunks[cid][0] for cid, _ in ranked],
+        scores=[score for _, score in ranked],
+        chunk_ids=[cid for cid, _ in ranked],
+        timings=timings,
+    )
+
+# ── Chain ─────────────────────────────────────────────────────────────────
+def build_rag_chain(premium=False, vector_store=None):
+    vector_store = vector_store or load_vector_store()
     model = config.LLM_MODEL_PREMIUM if premium else config.LLM_MODEL_DEFAULT
-    llm = ChatOpenAI(model=model, openai_api_key=config.OPENAI_API_KEY, temperature=0.2)
-    
+    llm = ChatOpenAI(model=model, openai_api_key=config.OPENAI_API_KEY, temperature=0.2,
+                     stream_usage=True)
+
     prompt = ChatPromptTemplate.from_messages([
         ("system", SYSTEM_PROMPT),
         ("human", USER_TEMPLATE)
     ])
-    
-    # Modern LCEL chain
-    chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-    
-    return (chain, retriever, model)
-
-def ask(chain_tuple, question, model):
-    chain, retriever, _ = chain_tuple
-    
-    # Get the answer
-    answer = chain.invoke(question)
-    
-    # Get source documents separately using invoke
-    source_docs = retriever.invoke(question)
-    sources = list({doc.metadata.get("source", "Unknown") for doc in source_docs})
-    
-    input_est = len(question) // 4
-    output_est = len(answer) // 4
-    cost = log_usage(model, input_est, output_est, question)
-    return {"answer": answer, "sources": sources, "model_used": model,
-            "query_cost_usd": round(cost, 5), "total_cost_usd": get_total_cost()}
+
+    # Retrieval happens once in ask(); the chain only sees its result.
+    # Message chunks (not strings) come out, so the final one's usage metadata is kept.
+    chain = prompt | llm
+
+    return (chain, vector_store, model)
+
+def ask_stream(chain_tuple, question, model, session_id=None, embedding=None) -> Iterator[Union[str, dict]]:
+    """Yield answer tokens as they arrive, then one final metadata dict. Pass `embedding` if already computed."""
+    chain, vector_store, _ = chain_tuple
+    t_start = time.perf_counter()
+
+    if embedding is None:
+        embedding = vector_store.embeddings.embed_query(question)
+    embed_s = round(time.perf_counter() - t_start, 4)
+    observe("ask.embed", embed_s)
+
+    cache = None
+    if config.ANSWER_CACHE_ENABLED:
+        cache = get_answer_cache()
+        cache.sync(store_fingerprint(vector_store))
+        hit = cache.lookup(model, embedding)
+        count("cache_requests", cache="answer", result="hit" if hit else "miss")
+        if hit:
+            yield hit["answer"]
+            total_s = round(time.perf_counter() - t_start, 4)
+            observe("ask.total", total_s)
+            logger.info("ask model=%s cache_hit=True ttft=%.3fs total=%.3fs", model, total_s, total_s)
+            yield {"sources": hit["sources"], "model_used": model,
+                   "query_cost_usd": 0.0, "total_cost_usd": get_total_cost(),
+                   "timings": {"embed_s": embed_s, "ttft_s": total_s, "total_s": total_s},
+                   "cache_hit": True, "cost_saved_usd": round(hit["cost_usd"], 5),
+                   "cache_similarity": hit["similarity"]}
+            return
+
+    if config.CONTEXT_PACKING:
+        retrieval = retrieve(vector_store, question, k=config.CONTEXT_CANDIDATES, embedding=embedding)
+        retrieval.pack(model)
+    else:
+        retrieval = retrieve(vector_store, question, embedding=embedding)
+    retrieval.timings["embed_s"] = embed_s
+    t_llm = time.perf_counter()
+    ttft_s = None
+    parts, usage = [], None
+    for chunk in chain.stream({"context": retrieval.context, "question": question}):
+        usage = usage_from_message(chunk) or usage
+        token = chunk.content
+        if not token:
+            continue
+        if ttft_s is None:
+            ttft_s = round(time.perf_counter() - t_start, 4)
+        parts.append(token)
+        yield token
+    answer = "".join(parts)
+    retrieval.timings["llm_s"] = round(time.perf_counter() - t_llm, 4)
+    retrieval.timings["ttft_s"] = ttft_s
+    retrieval.timings["total_s"] = round(time.perf_counter() - t_start, 4)
+    for stage in ("pack", "llm", "ttft", "total"):
+        observe(f"ask.{stage}", retrieval.timings.get(f"{stage}_s"))
+    logger.info("ask model=%s cache_hit=False ttft=%.3fs total=%.3fs context_tokens=%s saved=%s", model,
+                ttft_s or 0.0, retrieval.timings["total_s"],
+                retrieval.packing.get("packed_tokens"), retrieval.packing.get("saved_tokens"))
+
+    if usage is None:  # provider sent no usage; count the full prompt, context included
+        user_text = USER_TEMPLATE.format(context=retrieval.context, question=question)
+        usage = (count_tokens(model, SYSTEM_PROMPT, user_text), count_tokens(model, answer))
+    cost = log_usage(model, usage[0], usage[1], question, session_id=session_id)
+    sources = retrieval.sources()
+    if cache:
+        cache.store(model, question, embedding, answer, sources, cost)
+    yield {"sources": sources, "model_used": model,
+           "query_cost_usd": round(cost, 5), "total_cost_usd": get_total_cost(),
+           "input_tokens": usage[0], "output_tokens": usage[1],
+           "context_tokens": retrieval.packing.get("packed_tokens"),
+           "context_tokens_saved": retrieval.packing.get("saved_tokens"),
+           "timings": retrieval.timings, "cache_hit": False, "cost_saved_usd": 0.0}
+
+def ask(chain_tuple, question, model, session_id=None, embedding=None):
+    *tokens, meta = ask_stream(chain_tuple, question, model, session_id=session_id, embedding=embedding)
+    return {"answer": "".join(tokens), **meta}
@@ -0,0 +1,153 @@
+"""
+Query router: picks the premium or the default chat model for a question.
+
+A nearest-centroid classifier on the query embedding, the same vector ask_stream needs for
+retrieval. Training (from a CSV of question,label rows, label "premium" or "default") stores
+the unit-norm mean embedding of each class; a question's score is its cosine similarity to
+the premium centroid minus that to the default one, and a positive score routes premium.
+When |score| is below ROUTER_MIN_MARGIN, when no model has been trained, or when the model
+was trained with another embedding model, the decision falls back to is_complex_query's
+keyword list. Every decision is logged through utils.cost_tracker.log_route.
+
+    python -m rag.router train                 # ROUTER_LABELS_CSV -> ROUTER_MODEL_PATH
+    python -m rag.router eval --folds 5        # cross-validated accuracy and premium rate
+"""
+import argparse, csv, json, logging, os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional
+import numpy as np
+from rag.pipeline import is_complex_query
+from utils.cost_tracker import log_route
+import config
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Route:
+    premium: bool
+    method: str                       # "embedding" | "keywords"
+    score: Optional[float] = None     # cos(premium centroid) - cos(default centroid)
+    embedding: Optional[List[float]] = None  # pass on to ask_stream so it is not recomputed
+
+# ── Training ──────────────────────────────────────────────────────────────
+def read_labels(path: str = None):
+    """(questions, labels) from a question,label CSV; label True means premium."""
+    with open(path or config.ROUTER_LABELS_CSV, newline="", encoding="utf-8") as f:
+        rows = [r for r in csv.DictReader(f) if r.get("question", "").strip()]
+    return ([r["question"].strip() for r in rows],
+            [r["label"].strip().lower() in ("premium", "1", "true", "yes") for r in rows])
+
+def _unit(m: np.ndarray) -> np.ndarray:
+    return m / np.maximum(np.linalg.norm(m, axis=-1, keepdims=True), 1e-12)
+
+def fit(vectors, labels) -> np.ndarray:
+    """Centroids as a (2, dim) matrix: row 0 default, row 1 premium."""
+    vectors, labels = _unit(np.asarray(vectors, dtype=np.float32)), np.asarray(labels, dtype=bool)
+    if labels.all() or not labels.any():
+        raise ValueError("Router training data needs both premium and default questions")
+    return _unit(np.stack([vectors[~labels].mean(axis=0), vectors[labels].mean(axis=0)]))
+
+def scores(centroids: np.ndarray, vectors) -> np.ndarray:
+    sims = _unit(np.asarray(vectors, dtype=np.float32)) @ centroids.T
+    return sims[:, 1] - sims[:, 0]
+
+def _embed(questions: List[str]) -> np.ndarray:
+    """Embedded as queries, the way route_query sees them (E5 "query: " prefix, query cache)."""
+    from ingestion.loader import get_embeddings
+    embed = get_embeddings().embed_query
+    with ThreadPoolExecutor(max_workers=config.EMBED_CONCURRENCY) as pool:
+        return np.asarray(list(pool.map(embed, questions)), dtype=np.float32)
+
+def train(csv_path: str = None, out_path: str = None) -> dict:
+    from ingestion.loader import embedding_model_id
+    questions, labels = read_labels(csv_path)
+    centroids = fit(_embed(questions), labels)
+    out_path = out_path or config.ROUTER_MODEL_PATH
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "wb") as f:
+        np.savez(f, centroids=centroids, embedding_model=np.array(embedding_model_id()),
+                 embedded_as=np.array("query"))
+    get_router.cache_clear()
+    return {"model": out_path, "embedding_model": embedding_model_id(),
+            "questions": len(questions), "premium": int(sum(labels))}
+
+# ── Routing ───────────────────────────────────────────────────────────────
+@lru_cache(maxsize=1)
+def get_router() -> Optional[np.ndarray]:
+    """The trained centroids, or None (keyword routing) if unusable."""
+    if not config.ROUTER_ENABLED or not os.path.exists(config.ROUTER_MODEL_PATH):
+        return None
+    from ingestion.loader import embedding_model_id
+    with np.load(config.ROUTER_MODEL_PATH) as model:
+        trained_with = str(model["embedding_model"])
+        centroids = model["centroids"]
+        as_queries = "embedded_as" in model.files
+    if not as_queries:  # older models embedded the training questions as documents
+        logger.warning("Query router model predates query embeddings; using keyword routing "
+                       "until `python -m rag.router train` is re-run")
+        return None
+    if trained_with != embedding_model_id():
+        logger.warning("Query router was trained with %s, but queries are embedded with %s; "
+                       "using keyword routing until `python -m rag.router train` is re-run",
+                       trained_with, embedding_model_id())
+        return None
+    return centroids
+
+def route_query(question: str, embedding: List[float] = None, session_id: str = None) -> Route:
+    """Premium or default model for `question`; reuses `embedding` when the caller has it."""
+    centroids = get_router()
+    if centroids is None:
+        route = Route(is_complex_query(question), "keywords", embedding=embedding)
+    else:
+        if embedding is None:
+            from ingestion.loader import get_embeddings
+            embedding = get_embeddings().embed_query(question)
+        score = float(scores(centroids, [embedding])[0])
+        if abs(score) < config.ROUTER_MIN_MARGIN:
+            route = Route(is_complex_query(question), "keywords", score, embedding)
+        else:
+            route = Route(score > 0, "embedding", score, embedding)
+    log_route(route.premium, route.method, route.score, question, session_id=session_id)
+    return route
+
+# ── Offline evaluation ────────────────────────────────────────────────────
+def evaluate(csv_path: str = None, folds: int = 5, margins=None) -> dict:
+    """
+    k-fold cross-validated premium-routing rate and accuracy of the embedding router at each
+    fallback margin (ROUTER_MIN_MARGIN among them), next to the keyword list alone.
+    """
+    margins = margins or sorted({0.0, 0.01, config.ROUTER_MIN_MARGIN, 0.05})
+    questions, labels = read_labels(csv_path)
+    labels = np.asarray(labels)
+    vectors = _embed(questions)
+    fold = np.random.default_rng(0).permutation(len(questions)) % folds
+    held_out = np.zeros(len(questions), dtype=np.float32)
+    for k in range(folds):
+        held_out[fold == k] = scores(fit(vectors[fold != k], labels[fold != k]), vectors[fold == k])
+    keywords = np.array([is_complex_query(q) for q in questions])
+
+    def summary(predicted, **extra):
+        return {"accuracy": round(float((predicted == labels).mean()), 3),
+                "premium_rate": round(float(predicted.mean()), 3), **extra}
+
+    report = {"questions": len(questions), "labeled_premium_rate": round(float(labels.mean()), 3),
+              "folds": folds, "keywords": summary(keywords), "router": {}}
+    for margin in margins:
+        confident = np.abs(held_out) >= margin
+        predicted = np.where(confident, held_out > 0, keywords)
+        report["router"][f"margin_{margin:g}"] = summary(
+            predicted, fallback_rate=round(float(1 - confident.mean()), 3))
+    report["misrouted_by_keywords"] = [q for q, p, l in zip(questions, keywords, labels) if p != l]
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or evaluate the embedding query router.")
+    parser.add_argument("command", choices=["train", "eval"])
+    parser.add_argument("--csv", default=config.ROUTER_LABELS_CSV, help="question,label training data")
+    parser.add_argument("--out", default=config.ROUTER_MODEL_PATH)
+    parser.add_argument("--folds", type=int, default=5)
+    args = parser.parse_args()
+    result = train(args.csv, args.out) if args.command == "train" else evaluate(args.csv, args.folds)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -1,52 +1,55 @@
 import streamlit as st
-import sys, os
+import sys, os, logging, threading
 sys.path.insert(0, os.path.dirname(__file__))
 
-from rag.pipeline import is_complex_query, ask
-from ingestion.loader import load_vector_store
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from rag.prompts import SYSTEM_PROMPT, USER_TEMPLATE
+# Only light modules at the top. LangChain/Chroma load in the background warm-up below,
+# LangGraph/PyMuPDF when the Docs tab opens and ReportLab when a PDF report is requested.
 from utils.cost_tracker import get_total_cost
-from utils.session_manager import get_session_id, load_history, save_message, clear_session
-from document_analysis.extractor import extract_text
-from document_analysis.analyzer import analyze_document
-from document_analysis.report_generator import generate_pdf_report
+from utils.session_manager import (get_session_id, load_history, save_messages, clear_session,
+                                   HISTORY_PAGE_SIZE)
+from utils import tracing
 import config
 
 st.set_page_config(page_title="BuildIt PL", page_icon="🏗️", layout="centered")
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
 
 # ── Cache the vector store and chain ─────────────────────────────────────────
 @st.cache_resource
-def get_retriever():
-    vs = load_vector_store()
-    return vs.as_retriever(search_type="similarity", search_kwargs={"k": config.TOP_K_RESULTS})
-
-def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
+def _warmup() -> dict:
+    """Started once per process: loads the vector store off the script thread."""
+    state = {}
+    def run():
+        try:
+            from ingestion.loader import load_vector_store
+            state["vector_store"] = load_vector_store()
+        except Exception as e:
+            state["error"] = e
+    state["thread"] = threading.Thread(target=run, name="vector-store-warmup", daemon=True)
+    state["thread"].start()
+    return state
+
+def _warmup_or_retry() -> dict:
+    """The warm-up state; a failed warm-up is dropped from the cache and started again."""
+    state = _warmup()
+    if "error" in state and not state["thread"].is_alive():
+        _warmup.clear()
+        state = _warmup()
+    return state
+
+def get_vector_store():
+    state = _warmup()
+    state["thread"].join()
+    if "error" in state:
+        _warmup.clear()  # the next run retries instead of re-raising a cached failure
+        raise state["error"]
+    return state["vector_store"]
 
 @st.cache_resource
 def get_chain(premium: bool):
-    retriever = get_retriever()
-    model = config.LLM_MODEL_PREMIUM if premium else config.LLM_MODEL_DEFAULT
-    llm = ChatOpenAI(model=model, openai_api_key=config.OPENAI_API_KEY, temperature=0.2)
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", SYSTEM_PROMPT),
-        ("human", USER_TEMPLATE)
-    ])
-    
-    # Modern LCEL chain
-    chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-    
-    return (chain, retriever, model)
+    from rag.pipeline import build_rag_chain
+    return build_rag_chain(premium, vector_store=get_vector_store())
+
+_warmup_or_retry()
 
 # ── Header ─────────────────────────────────────────────────────────────────
 col1, col2 = st.columns([4, 1])
@@ -62,10 +65,12 @@ st.markdown("---")
 session_id = get_session_id()
 if "messages" not in st.session_state:
     st.session_state.messages = load_history(session_id)
+    st.session_state.history_exhausted = len(st.session_state.messages) < HISTORY_PAGE_SIZE
 
 # ── FIX 2: Active tab tracked in session state (not Streamlit tabs) ─────────
 if "active_tab" not in st.session_state:
-    st.session_state.active_tab = "chat"
+    # A refreshed page with an analysis job in the URL reattaches to it
+    st.session_state.active_tab = "docs" if "job" in st.query_params else "chat"
 
 col_t1, col_t2 = st.columns(2)
 if col_t1.button("💬 Chat Assistant",  use_container_width=True,
@@ -97,7 +102,16 @@ if st.session_state.active_tab == "chat":
                 st.session_state.pending_input = q
                 st.rerun()
 
-    # Display full chat history
+    # Older history is paged in on demand
+    oldest_id = st.session_state.messages[0].get("id") if st.session_state.messages else None
+    if oldest_id and not st.session_state.get("history_exhausted"):
+        if st.button("⬆️ Load earlier messages", use_container_width=True):
+            page = load_history(session_id, before=oldest_id)
+            st.session_state.history_exhausted = len(page) < HISTORY_PAGE_SIZE
+            st.session_state.messages = page + st.session_state.messages
+            st.rerun()
+
+    # Display chat history
     for msg in st.session_state.messages:
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
@@ -110,39 +124,56 @@ if st.session_state.active_tab == "chat":
         user_input = st.session_state.pop("pending_input")
 
     if user_input:
-        # Save & display user message
+        from rag.pipeline import ask_stream
+        from rag.router import route_query
+
+        # Save & display user message; saved now so a failed answer does not lose the question
         st.session_state.messages.append({"role": "user", "content": user_input})
-        save_message(session_id, "user", user_input)
+        save_messages(session_id, [("user", user_input)])
         with st.chat_message("user"):
             st.markdown(user_input)
 
         # Generate & display assistant response
         with st.chat_message("assistant"):
-            premium     = is_complex_query(user_input)
+            route       = route_query(user_input, session_id=session_id)
+            premium     = route.premium
             model_label = "gpt-4o" if premium else "gpt-4o-mini"
             with st.spinner(f"[{model_label}] Checking Polish construction law..."):
                 chain_tuple = get_chain(premium)
-                response     = ask(chain_tuple, user_input, chain_tuple[2])
-                answer       = response["answer"]
-
-                st.markdown(answer)
-
-                col_a, col_b = st.columns([3, 1])
-                with col_a:
-                    if response["sources"]:
-                        with st.expander("📄 Sources"):
-                            for s in response["sources"]:
-                                st.markdown(f"- {s}")
-                with col_b:
+
+            # Tokens are rendered as they arrive; the last item is the metadata record
+            response = {}
+            def _tokens():
+                for part in ask_stream(chain_tuple, user_input, chain_tuple[2], session_id=session_id,
+                                       embedding=route.embedding):
+                    if isinstance(part, dict):
+                        response.update(part)
+                    else:
+                        yield part
+            answer = st.write_stream(_tokens())
+
+            col_a, col_b = st.columns([3, 1])
+            with col_a:
+                if response["sources"]:
+                    with st.expander("📄 Sources"):
+                        for s in response["sources"]:
+                            page = f" · p. {s['page'] + 1}" if s.get("page") is not None else ""
+                            st.markdown(f"- {s['source']}{page} — relevance `{s['score']:.2f}`")
+            with col_b:
+                if response.get("cache_hit"):
+                    st.caption(f"♻️ cached `{model_label}` answer · saved ${response['cost_saved_usd']:.5f}")
+                else:
                     st.caption(f"🤖 `{model_label}` 💰 ${response['query_cost_usd']:.5f}")
 
-                st.session_state.messages.append({"role": "assistant", "content": answer})
-                save_message(session_id, "assistant", answer)
+            st.session_state.messages.append({"role": "assistant", "content": answer})
+            save_messages(session_id, [("assistant", answer)])
 
 # ════════════════════════════════════════════════════════════════════════════
 # DOCUMENT ANALYZER VIEW
 # ════════════════════════════════════════════════════════════════════════════
 elif st.session_state.active_tab == "docs":
+    from document_analysis.jobs import get_job, submit_analysis
+
     st.subheader("📄 Contract & Document Analyzer")
     st.caption("Upload a Polish construction contract, purchase agreement, or permit letter.")
     st.markdown("---")
@@ -151,48 +182,71 @@ elif st.session_state.active_tab == "docs":
 
     if uploaded_file:
         st.success(f"✅ Uploaded: **{uploaded_file.name}**")
-
         if st.button("🔍 Analyze Document", type="primary", use_container_width=True):
-            with st.spinner("Extracting text..."):
-                try:
-                    doc_text = extract_text(uploaded_file)
-                except Exception as e:
-                    st.error(f"Could not read file: {e}")
-                    st.stop()
-
-            bar = st.progress(0)
-            with st.spinner("Summarizing..."):        bar.progress(25)
-            with st.spinner("Identifying risks..."):  bar.progress(50)
-            with st.spinner("Checking completeness..."):
-                report = analyze_document(doc_text, uploaded_file.name)
-                bar.progress(100)
-
-            st.markdown("---")
-            score = report["risk_score"]
-            emoji = {"HIGH": "🔴", "MEDIUM": "🟡", "LOW": "🟢"}.get(score, "🟡")
-            st.markdown(f"### Overall Risk: {emoji} **{score}** — {report['total_risks']} issue(s) found")
-
-            with st.expander("📋 Document Summary", expanded=True):
-                st.markdown(report["summary"])
-
-            with st.expander(f"⚠️ Risks ({report['total_risks']})", expanded=True):
-                for level, risks, e in [("HIGH", report["risks_high"], "🔴"),
-                                         ("MEDIUM", report["risks_medium"], "🟡"),
-                                         ("LOW", report["risks_low"], "🟢")]:
-                    for r in risks:
-                        st.markdown(f"{e} **[{level}]** {r['description']}")
-                        if r.get("explanation"):
-                            st.caption(f"→ {r['explanation']}")
-
-            with st.expander(f"📝 Missing Items ({len(report['missing_items'])})", expanded=True):
-                for i, item in enumerate(report["missing_items"], 1):
-                    st.markdown(f"{i}. {item}")
-
-            pdf_bytes = generate_pdf_report(report)
-            st.download_button("⬇️ Download PDF Report", data=pdf_bytes,
-                file_name=f"buildit_{uploaded_file.name}", mime="application/pdf",
+            st.query_params["job"] = submit_analysis(uploaded_file.getvalue(), uploaded_file.name)
+
+    STAGE_LABELS = {"extract": "Extracting text", "analyze": "Analyzing", "summarize": "Summarizing",
+                    "risks": "Identifying risks", "completeness": "Checking completeness",
+                    "compile": "Compiling report"}
+    STATE_ICONS  = {"pending": "⏳", "running": "🔄", "done": "✅", "failed": "❌"}
+
+    @st.fragment(run_every=1.0)
+    def job_progress(job_id: str):
+        """Polls the job record; a full rerun renders the report once the job has finished."""
+        job = get_job(job_id)
+        if job["status"] not in ("queued", "running"):
+            st.rerun()
+        done = sum(state == "done" for state in job["progress"].values())
+        st.progress(done / len(job["progress"]), text=f"Analyzing **{job['document_name']}**...")
+        for stage, state in job["progress"].items():
+            st.markdown(f"{STATE_ICONS[state]} {STAGE_LABELS.get(stage, stage)}")
+
+    job_id = st.query_params.get("job")
+    job = get_job(job_id) if job_id else None
+    if job_id and job is None:
+        del st.query_params["job"]  # stale link
+    elif job and job["status"] in ("queued", "running"):
+        job_progress(job_id)
+    elif job and job["status"] == "error":
+        st.error(f"Analysis failed: {job['error']}")
+    elif job:
+        report = job["report"]
+        st.markdown("---")
+        score = report["risk_score"]
+        emoji = {"HIGH": "🔴", "MEDIUM": "🟡", "LOW": "🟢"}.get(score, "🟡")
+        st.markdown(f"### Overall Risk: {emoji} **{score}** — {report['total_risks']} issue(s) found")
+        if report.get("cached"):
+            st.caption("♻️ Reused the cached analysis of this exact file.")
+        if report.get("chunks_analyzed"):
+            st.caption(f"Long document: {report['page_count']} pages analyzed in "
+                       f"{report['chunks_analyzed']} sections.")
+
+        with st.expander("📋 Document Summary", expanded=True):
+            st.markdown(report["summary"])
+
+        with st.expander(f"⚠️ Risks ({report['total_risks']})", expanded=True):
+            for level, risks, e in [("HIGH", report["risks_high"], "🔴"),
+                                     ("MEDIUM", report["risks_medium"], "🟡"),
+                                     ("LOW", report["risks_low"], "🟢")]:
+                for r in risks:
+                    page = f" _(p. {r['page']})_" if r.get("page") else ""
+                    st.markdown(f"{e} **[{level}]** {r['description']}{page}")
+                    if r.get("explanation"):
+                        st.caption(f"→ {r['explanation']}")
+
+        with st.expander(f"📝 Missing Items ({len(report['missing_items'])})", expanded=True):
+            for i, item in enumerate(report["missing_items"], 1):
+                st.markdown(f"{i}. {item}")
+
+        # Rendered on request only, so ReportLab is not loaded just to view a report
+        pdf_key = f"pdf_{report.get('cache_key')}"
+        if st.button("📄 Create PDF Report", use_container_width=True) or st.session_state.get(pdf_key):
+            from document_analysis.report_generator import generate_pdf_report_cached
+            st.session_state[pdf_key] = True
+            st.download_button("⬇️ Download PDF Report", data=generate_pdf_report_cached(report),
+                file_name=f"buildit_{report['document_name']}", mime="application/pdf",
                 use_container_width=True, type="primary")
-            st.caption("⚠️ AI-generated for informational purposes only. Consult a licensed Polish attorney before signing.")
+        st.caption("⚠️ AI-generated for informational purposes only. Consult a licensed Polish attorney before signing.")
 
 # ── Sidebar ────────────────────────────────────────────────────────────────
 with st.sidebar:
@@ -200,9 +254,31 @@ with st.sidebar:
     st.markdown("---")
     st.caption(f"Session: `{session_id[:8]}...`")
     st.caption(f"Messages: {len(st.session_state.get('messages', []))}")
+    warm = _warmup()
+    if warm["thread"].is_alive():
+        st.caption("⏳ Loading knowledge base...")
+    elif "error" in warm:
+        st.caption(f"⚠️ Knowledge base unavailable: {warm['error']}")
+    elif "vector_store" in warm and hasattr(warm["vector_store"].embeddings, "stats"):
+        emb = warm["vector_store"].embeddings.stats()
+        st.caption(f"Embedding cache: {emb['hits']} hits / {emb['misses']} misses")
+    with st.expander("🩺 Diagnostics"):
+        if not tracing.enabled():
+            st.caption("Tracing is off — set TRACING_ENABLED=true to collect latencies.")
+        else:
+            stats = tracing.snapshot()
+            if stats["spans"]:
+                st.dataframe([{"span": name, **s} for name, s in stats["spans"].items()],
+                             hide_index=True, use_container_width=True)
+            for cache, c in stats["caches"].items():
+                st.caption(f"{cache.title()} cache: {c['hit_rate']:.0%} hit rate ({c['hit']}/{c['hit'] + c['miss']})")
+            for name, value in stats["counters"].items():
+                if name.startswith("llm_tokens"):
+                    st.caption(f"`{name}`: {value:,.0f}")
     if st.button("🗑️ Clear chat", use_container_width=True):
         clear_session(session_id)
         st.session_state.messages = []
+        st.session_state.history_exhausted = True
         st.rerun()
     st.markdown("---")
     st.caption("Built with LangChain · LangGraph · ChromaDB · GPT-4o · Streamlit")
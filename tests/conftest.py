@@ -0,0 +1,53 @@
+import pytest
+
+class CharEncoding:
+    """Test tokenizer: one token per 4 characters, decode() round-trips; no tiktoken download."""
+    name = "test"
+    def encode(self, text, **kwargs):
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+@pytest.fixture
+def offline_tokenizer(monkeypatch):
+    from utils import cost_tracker
+    monkeypatch.setattr(cost_tracker, "_encoding", lambda model: CharEncoding())
+
+import hashlib
+from langchain_core.embeddings import Embeddings
+import config
+
+class HashEmbeddings(Embeddings):
+    """8-dimensional vectors derived from the text's sha256: deterministic, offline."""
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        return [b / 255 for b in hashlib.sha256(text.encode("utf-8")).digest()[:8]]
+
+@pytest.fixture
+def chroma_store(monkeypatch, tmp_path):
+    """An empty Chroma store in CHROMA_PERSIST_DIR=tmp_path/store, embedded with HashEmbeddings."""
+    from ingestion import loader
+    monkeypatch.setattr(config, "CHROMA_PERSIST_DIR", str(tmp_path / "store"))
+    monkeypatch.setattr(config, "VECTOR_BACKEND", "chroma")
+    monkeypatch.setattr(loader, "_embeddings", HashEmbeddings())
+    return loader._open_store()
+
+@pytest.fixture
+def knowledge_base(monkeypatch, tmp_path, chroma_store):
+    """Three one-page PDFs in tmp_path/kb, parsed without reading them; returns the directory."""
+    from langchain_core.documents import Document
+    from ingestion import loader
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        (kb / name).write_bytes(name.encode())
+    monkeypatch.setattr(config, "EMBED_BATCH_SIZE", 1)
+    monkeypatch.setattr(config, "EMBED_CONCURRENCY", 1)
+    monkeypatch.setattr(loader, "count_embedding_tokens", lambda texts: 0)
+    monkeypatch.setattr(loader, "parse_pdfs", lambda paths: {
+        p: [Document(page_content=f"Page of {p}: " + "przepis " * 20, metadata={"source": p, "page": 0})]
+        for p in paths})
+    return str(kb)
@@ -0,0 +1,43 @@
+import time
+import numpy as np
+from rag.answer_cache import AnswerCache
+
+def _cache(tmp_path, **kwargs):
+    return AnswerCache(str(tmp_path / "answers.sqlite3"), **{"threshold": 0.9, "ttl_s": 3600, **kwargs})
+
+def _vector(angle):
+    return [np.cos(angle), np.sin(angle), 0.0]  # cosine similarity to _vector(0) is cos(angle)
+
+def test_similar_questions_hit_and_others_miss(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("gpt-4o-mini", "Czy altana wymaga pozwolenia?", _vector(0), "Nie.", [{"source": "a.pdf"}], 0.001)
+    hit = cache.lookup("gpt-4o-mini", _vector(0.3))  # cos 0.955
+    assert hit["answer"] == "Nie." and hit["sources"] == [{"source": "a.pdf"}]
+    assert cache.lookup("gpt-4o-mini", _vector(0.6)) is None  # cos 0.825 is below the threshold
+    assert cache.lookup("gpt-4o", _vector(0)) is None         # answers are per model
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = _cache(tmp_path, ttl_s=0.05)
+    cache.store("gpt-4o-mini", "q", _vector(0), "a", [], 0.0)
+    assert cache.lookup("gpt-4o-mini", _vector(0)) is not None
+    time.sleep(0.1)
+    assert cache.lookup("gpt-4o-mini", _vector(0)) is None
+
+def test_a_new_store_fingerprint_drops_every_entry(tmp_path):
+    cache = _cache(tmp_path)
+    cache.sync("store-v1")
+    cache.store("gpt-4o-mini", "q", _vector(0), "a", [], 0.0)
+    cache.sync("store-v1")
+    assert cache.lookup("gpt-4o-mini", _vector(0)) is not None
+    cache.sync("store-v2")
+    assert cache.lookup("gpt-4o-mini", _vector(0)) is None
+
+def test_workers_see_each_others_entries_and_clears(tmp_path):
+    ours, theirs = _cache(tmp_path), _cache(tmp_path)  # two processes sharing the file
+    ours.sync("store-v1")
+    assert ours.lookup("gpt-4o-mini", _vector(0)) is None  # index built while empty
+    theirs.store("gpt-4o-mini", "q", _vector(0), "from the other worker", [], 0.0)
+    assert ours.lookup("gpt-4o-mini", _vector(0))["answer"] == "from the other worker"
+    theirs.sync("store-v2")  # the other worker saw the rebuilt store first
+    ours.sync("store-v2")    # fingerprint already matches here, nothing to clear
+    assert ours.lookup("gpt-4o-mini", _vector(0)) is None
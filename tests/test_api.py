@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+import api
+import config
+
+@pytest.fixture
+def ready(monkeypatch):
+    monkeypatch.setitem(api._state, "ready", True)
+    monkeypatch.setitem(api._state, "in_flight", 0)
+    monkeypatch.setattr(api, "_inflight", asyncio.Semaphore(1))
+
+def test_stream_slot_is_released_when_the_client_is_gone(ready):
+    async def run():
+        await api._acquire_slot()
+        async def body():
+            yield "never sent"
+        async def receive():
+            return {"type": "http.disconnect"}
+        async def send(message):
+            raise OSError("client disconnected")
+        response = api._SlotStreamingResponse(body(), media_type="application/x-ndjson")
+        with pytest.raises(Exception):  # OSError, or an ExceptionGroup around it
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+    asyncio.run(run())
+    assert api._state["in_flight"] == 0
+    assert not api._inflight.locked()
+
+def test_oversized_upload_is_refused_from_content_length(monkeypatch):
+    monkeypatch.setattr(config, "API_MAX_UPLOAD_MB", 0.01)
+    client = TestClient(api.app)  # no lifespan: the limit applies before the endpoint runs
+    response = client.post("/analyze", files={"file": ("big.pdf", b"%PDF" + b"0" * 100_000)})
+    assert response.status_code == 413
+
+def test_oversized_chunked_upload_is_refused_while_streaming(monkeypatch):
+    monkeypatch.setattr(config, "API_MAX_UPLOAD_MB", 0.01)
+    def body():  # no Content-Length: the request is sent chunked
+        for _ in range(100):
+            yield b"0" * 10_000
+    client = TestClient(api.app)
+    response = client.post("/analyze", content=body(),
+                           headers={"content-type": "multipart/form-data; boundary=x"})
+    assert response.status_code == 413
+    assert response.json() == {"detail": "PDF larger than 0.01 MB"}
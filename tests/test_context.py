@@ -0,0 +1,35 @@
+from langchain_core.documents import Document
+import pytest
+from rag import context
+
+pytestmark = pytest.mark.usefixtures("offline_tokenizer")  # ~4 characters per token
+
+def _overlapping_chunks(n=14, size=400, step=300):
+    page = " ".join(f"clause{i:04d}" for i in range(600))
+    return [page[i * step:i * step + size] for i in range(n)]
+
+def test_top_passage_larger_than_budget_is_trimmed_not_dropped():
+    chunks = _overlapping_chunks()
+    docs = [Document(page_content=c, metadata={"source": "umowa.pdf", "page": 3}) for c in chunks]
+    docs.append(Document(page_content="Unrelated note about parking spaces.",
+                         metadata={"source": "other.pdf", "page": 1}))
+    scores = [0.9] * len(chunks) + [0.2]
+    ids = [f"c{i}" for i in range(len(docs))]
+
+    packed, stats = context.pack_context(docs, scores, ids, "gpt-4o-mini", budget_tokens=900)
+
+    first_doc, first_score, first_ids = packed[0]
+    assert first_score == 0.9
+    assert first_doc.metadata["source"] == "umowa.pdf"
+    assert first_doc.page_content.startswith(chunks[0][:50])
+    assert len(first_ids.split(",")) == len(chunks)  # the whole merged span, trimmed
+    assert stats["packed_tokens"] <= 900
+    assert stats["packed_tokens"] > 800
+
+def test_merged_span_within_budget_is_kept_whole():
+    chunks = _overlapping_chunks(n=3)
+    docs = [Document(page_content=c, metadata={"source": "umowa.pdf", "page": 3}) for c in chunks]
+    packed, stats = context.pack_context(docs, [0.9, 0.8, 0.7], ["a", "b", "c"], "gpt-4o-mini",
+                                         budget_tokens=900)
+    assert len(packed) == 1
+    assert packed[0][0].page_content == chunks[0] + chunks[1][100:] + chunks[2][100:]
@@ -0,0 +1,81 @@
+import queue, sqlite3
+import pytest
+from utils import cost_tracker
+
+@pytest.fixture(autouse=True)
+def fresh_tracker(monkeypatch, tmp_path):
+    monkeypatch.setattr(cost_tracker, "DB_FILE", str(tmp_path / "usage.db"))
+    monkeypatch.setattr(cost_tracker, "LEGACY_CSV", str(tmp_path / "usage_log.csv"))
+    monkeypatch.setattr(cost_tracker, "FLUSH_INTERVAL_S", 0.01)
+    monkeypatch.setattr(cost_tracker, "_totals", {})
+    monkeypatch.setattr(cost_tracker, "_initialized", False)
+    monkeypatch.setattr(cost_tracker, "_pending", {})
+    monkeypatch.setattr(cost_tracker, "_queue", queue.Queue())
+    monkeypatch.setattr(cost_tracker, "_writer", None)
+
+def test_failed_batches_are_dropped_and_the_writer_keeps_running(monkeypatch):
+    write_batch = cost_tracker._write_batch
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(cost_tracker, "_write_batch", locked)
+    cost_tracker.log_usage("gpt-4o-mini", 1000, 100)
+    assert cost_tracker.get_usage()["requests"] == 1  # queued, not yet written
+
+    assert cost_tracker.flush(timeout=5)
+    assert cost_tracker._writer.is_alive()
+    assert cost_tracker.get_usage()["requests"] == 0  # dropped
+
+    monkeypatch.setattr(cost_tracker, "_write_batch", write_batch)
+    cost_tracker.log_usage("gpt-4o-mini", 1000, 100)
+    assert cost_tracker.flush(timeout=5)
+    assert cost_tracker.get_usage()["requests"] == 1
+    assert cost_tracker.get_usage("model", "gpt-4o-mini")["input_tokens"] == 1000
+
+def test_flush_returns_when_the_writer_is_gone(monkeypatch):
+    monkeypatch.setattr(cost_tracker, "_ensure_writer", lambda: None)
+    cost_tracker.log_usage("gpt-4o-mini", 10, 10)
+    assert cost_tracker.flush(timeout=5) is False  # no writer: the event can no longer be written
+
+def test_totals_include_other_processes_after_a_refresh(monkeypatch):
+    monkeypatch.setattr(cost_tracker, "TOTALS_REFRESH_S", 0.0)
+    cost_tracker.log_usage("gpt-4o", 100, 10)
+    assert cost_tracker.flush(timeout=5)
+    con = cost_tracker._connect()  # another process writing to the same database
+    cost_tracker._write_batch(con, [("2026-10-17T00:00:00", "gpt-4o", None, 200, 20, 0.5, "")])
+    con.close()
+    assert cost_tracker.get_usage()["requests"] == 2
+    assert cost_tracker.get_usage("model", "gpt-4o")["input_tokens"] == 300
+
+def test_a_refresh_between_commit_and_fold_is_not_counted_twice(monkeypatch):
+    monkeypatch.setattr(cost_tracker, "TOTALS_REFRESH_S", 0.0)
+    write_batch = cost_tracker._write_batch
+    def write_then_read(*args):
+        rowid = write_batch(*args)
+        cost_tracker.get_usage()  # a dashboard refresh that already sees the committed rows
+        return rowid
+    monkeypatch.setattr(cost_tracker, "_write_batch", write_then_read)
+    cost_tracker.log_usage("gpt-4o", 100, 10)
+    assert cost_tracker.flush(timeout=5)
+    monkeypatch.setattr(cost_tracker, "TOTALS_REFRESH_S", 3600.0)  # serve the cached row
+    assert cost_tracker.get_usage()["requests"] == 1
+
+def test_logging_never_reads_the_database(monkeypatch):
+    monkeypatch.setattr(cost_tracker, "_ensure_writer", lambda: None)
+    def no_database():
+        raise AssertionError("log_usage opened the database")
+    monkeypatch.setattr(cost_tracker, "_connect", no_database)
+    cost_tracker.log_usage("gpt-4o-mini", 10, 10, session_id="s1")
+
+def test_legacy_csv_is_folded_in_once(tmp_path):
+    (tmp_path / "usage_log.csv").write_text(
+        "timestamp,model,input_tokens,output_tokens,cost_usd\n"
+        "2025-01-02T10:00:00,gpt-4o,100,10,0.5\n2025-01-03T10:00:00,gpt-4o,50,5,0.25\n")
+    assert cost_tracker.get_usage()["requests"] == 2
+    assert cost_tracker.get_usage_by("day") == {
+        "2025-01-02": {"requests": 1, "input_tokens": 100, "output_tokens": 10, "cost_usd": 0.5},
+        "2025-01-03": {"requests": 1, "input_tokens": 50, "output_tokens": 5, "cost_usd": 0.25}}
+    cost_tracker._initialized = False  # another process starting up
+    cost_tracker.get_usage_by("day")
+    con = cost_tracker._connect()
+    assert con.execute("SELECT requests FROM usage_totals WHERE scope = 'all'").fetchone() == (2,)
+    con.close()
@@ -0,0 +1,45 @@
+import time
+from ingestion.embedding_cache import CachedEmbeddings
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def _cache(tmp_path, max_entries):
+    return CachedEmbeddings(CountingEmbeddings(), "test-model", str(tmp_path / "emb.sqlite3"), max_entries)
+
+def _rows(cache):
+    return cache._con.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+def test_the_table_stays_within_max_entries(tmp_path):
+    cache = _cache(tmp_path, 10)
+    cache.embed_documents([f"chunk {i}" for i in range(25)])
+    assert _rows(cache) <= 10
+    assert cache.stats()["entries"] == _rows(cache)
+
+def test_replacing_existing_rows_does_not_count_towards_the_bound(tmp_path):
+    cache = _cache(tmp_path, 10)
+    texts = [f"chunk {i}" for i in range(8)]
+    cache.embed_documents(texts)
+    for _ in range(5):
+        cache._store({cache._key("doc", t): [0.0, 1.0] for t in texts})  # e.g. another worker's race
+    assert cache.stats()["entries"] == _rows(cache) == 8  # nothing evicted early
+
+def test_least_recently_used_entries_go_first(tmp_path):
+    cache = _cache(tmp_path, 10)
+    for i in range(10):
+        cache.embed_documents([f"old {i}"])
+        time.sleep(0.002)  # distinct last_used stamps
+    cache.embed_documents(["old 0"])  # used again: now the most recent
+    time.sleep(0.002)
+    cache.embed_documents(["new 0"])  # over the bound: evicts the 2 oldest, down to 90%
+    base = cache.base.calls
+    cache.embed_documents(["old 0", "new 0"])
+    assert cache.base.calls == base  # both still cached
+    cache.embed_documents(["old 1"])
+    assert cache.base.calls == base + 1  # the least recently used one was evicted
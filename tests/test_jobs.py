@@ -0,0 +1,57 @@
+import json, os, subprocess, sys, time
+import pytest
+from document_analysis import jobs
+import config
+
+@pytest.fixture(autouse=True)
+def jobs_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "ANALYSIS_JOBS_DB", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(jobs, "_initialized", False)
+
+def _insert(job_id, owner, heartbeat):
+    with jobs._connect() as con:
+        con.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, "key-" + job_id, "doc.pdf", "running", json.dumps({}), None, None,
+                     time.time(), time.time(), owner, heartbeat))
+        con.commit()
+
+def test_only_jobs_whose_owner_is_gone_are_interrupted(monkeypatch):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    now = time.time()
+    _insert("live", f"{jobs.HOST}:{os.getppid()}", now)        # another worker, still running
+    _insert("remote", "other-host:1234", now)                   # another host, heartbeat fresh
+    _insert("dead", f"{jobs.HOST}:{dead.pid}", now)             # its process has exited
+    _insert("silent", "other-host:1234", now - 10 * config.ANALYSIS_JOB_STALE_S)
+
+    monkeypatch.setattr(jobs, "_initialized", False)  # a new process starting up
+    status = {job_id: jobs.get_job(job_id)["status"] for job_id in ("live", "remote", "dead", "silent")}
+    assert status == {"live": "running", "remote": "running", "dead": "error", "silent": "error"}
+
+def test_all_stages_show_while_the_text_is_extracted(monkeypatch, tmp_path):
+    class Graph:
+        nodes = {"__start__": None, "summarize": None, "risks": None, "compile": None}
+    monkeypatch.setattr(jobs, "get_analysis_graph", lambda: Graph())
+    _insert("job", jobs.OWNER, time.time())
+    seen = {}
+    def extract(path):
+        seen.update(jobs.get_job("job")["progress"])
+        raise ValueError("not a PDF")
+    monkeypatch.setattr(jobs, "extract_pages_from_pdf", extract)
+    pdf = tmp_path / "upload.pdf"
+    pdf.write_bytes(b"%PDF")
+    jobs._run("job", "key-job", str(pdf), "doc.pdf")
+    assert seen == {"extract": "running", "summarize": "pending", "risks": "pending", "compile": "pending"}
+    assert jobs.get_job("job")["progress"]["extract"] == "failed"
+
+def test_purge_drops_only_old_finished_jobs():
+    _insert("running", jobs.OWNER, time.time())
+    _insert("old-done", jobs.OWNER, time.time())
+    _insert("new-done", jobs.OWNER, time.time())
+    with jobs._connect() as con:
+        con.execute("UPDATE jobs SET status = 'done', updated_at = ? WHERE id = 'old-done'", (time.time() - 10 * 86400,))
+        con.execute("UPDATE jobs SET status = 'done' WHERE id = 'new-done'")
+        con.commit()
+    assert jobs.purge_finished_jobs(ttl_days=7) == 1
+    assert jobs.get_job("old-done") is None
+    assert jobs.get_job("new-done") and jobs.get_job("running")
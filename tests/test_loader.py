@@ -0,0 +1,50 @@
+import pytest
+from ingestion import loader
+from ingestion.loader import chunk_ids
+import config
+
+def test_identical_files_at_different_paths_get_distinct_chunk_ids():
+    digest = "ab" * 32
+    original, copy = chunk_ids("law.pdf", digest, 3), chunk_ids("archive/law.pdf", digest, 3)
+    assert not set(original) & set(copy)
+    assert chunk_ids("law.pdf", digest, 3) == original  # stable across runs
+
+def test_an_interrupted_rebuild_resumes_instead_of_starting_over(monkeypatch, knowledge_base):
+    embed, calls = loader._embed_with_backoff, []
+    def flaky(texts):
+        calls.append(texts)
+        if len(calls) == 2:
+            raise RuntimeError("connection reset")
+        return embed(texts)
+    monkeypatch.setattr(loader, "_embed_with_backoff", flaky)
+    with pytest.raises(RuntimeError):
+        loader.ingest(incremental=False, source_dir=knowledge_base)
+    assert loader.load_manifest()["rebuilding"]
+
+    first_run = len(calls)
+    summary = loader.ingest(incremental=False, source_dir=knowledge_base)
+    assert summary["chunks_resumed"] == 2
+    assert len(calls) - first_run == 1  # only the chunk that failed is embedded again
+    assert "rebuilding" not in loader.load_manifest()
+    assert loader._open_store()._collection.count() == 3
+
+def test_concurrent_first_calls_load_the_embedding_model_once(monkeypatch):
+    import threading, time
+    from ingestion import local_embeddings
+    loads = []
+    class SlowModel:
+        def __init__(self):
+            loads.append(1)
+            time.sleep(0.05)  # long enough for every thread to miss the global
+    monkeypatch.setattr(local_embeddings, "LocalEmbeddings", SlowModel)
+    monkeypatch.setattr(config, "EMBEDDING_BACKEND", "local")
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr(loader, "_embeddings", None)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(loader.get_embeddings())) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(loads) == 1
+    assert all(r is results[0] for r in results)
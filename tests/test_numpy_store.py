@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from langchain_community.vectorstores import Chroma
+from ingestion import numpy_store
+
+@pytest.mark.parametrize("space", ["l2", "cosine"])
+def test_mmap_search_returns_what_chroma_returns(tmp_path, chroma_store, space):
+    vs = Chroma(client=chroma_store._client, collection_name=f"kb-{space}",
+                embedding_function=chroma_store.embeddings, collection_metadata={"hnsw:space": space})
+    texts = [f"art. {i} ustawy o ochronie danych" for i in range(40)]
+    vs.add_texts(texts, metadatas=[{"source": "law.pdf", "page": i} for i in range(40)],
+                 ids=[f"c{i}" for i in range(40)])
+    numpy_store.export(vs, dtype="float32", path=str(tmp_path / "index"))
+    mmap = numpy_store.MmapCollection(str(tmp_path / "index"))
+
+    queries = [vs.embeddings.embed_query(q) for q in ("dane osobowe", "art. 7")]
+    expected = vs._collection.query(query_embeddings=queries, n_results=5,
+                                    include=["documents", "metadatas", "distances"])
+    got = mmap.query(queries, n_results=5)
+    assert got["ids"] == expected["ids"]
+    assert got["documents"] == expected["documents"]
+    assert got["metadatas"] == expected["metadatas"]
+    np.testing.assert_allclose(got["distances"], expected["distances"], rtol=1e-4, atol=1e-6)
+
+    ids = ["c3", "c17", "missing"]
+    stored = vs._collection.get(ids=ids, include=["embeddings", "documents"])
+    mapped = mmap.get(ids=ids, include=["embeddings", "documents"])
+    order = [stored["ids"].index(cid) for cid in mapped["ids"]]  # Chroma does not keep the order asked for
+    assert sorted(mapped["ids"]) == sorted(stored["ids"])
+    assert mapped["documents"] == [stored["documents"][i] for i in order]
+    np.testing.assert_allclose(mapped["embeddings"], np.asarray(stored["embeddings"])[order], rtol=1e-6)
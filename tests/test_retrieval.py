@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from ingestion.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from ingestion.loader import build_bm25_index
+from rag.pipeline import retrieve
+import config
+
+def test_article_references_become_compound_tokens():
+    tokens = tokenize("Zgodnie z Art. 29 ust. 2 pkt 1 oraz § 5a")
+    assert {"art29", "ust2", "pkt1", "§5a"} <= set(tokens)
+    assert "zgodnie" in tokens  # lower-cased words stay
+
+def test_bm25_ranks_the_exact_reference_first():
+    index = BM25Index(["a", "b", "c"], ["Art. 28 pozwolenie na budowę", "Art. 29 ust. 2 zwolnienie",
+                                         "kara umowna za zwłokę"], [{}, {}, {}])
+    assert [index.ids[i] for i, _ in index.search("art. 29 ust. 2", 2)] == ["b", "a"]
+    assert index.search("dach", 5) == []
+
+def test_rrf_rewards_agreement_and_normalises_to_one():
+    fused = dict(reciprocal_rank_fusion([["a", "b", "c"], ["a", "c"]], k=60))
+    assert fused["a"] == pytest.approx(1.0)  # first in every list
+    assert fused["c"] > fused["b"]           # found by both retrievers beats one higher rank
+
+@pytest.fixture
+def hybrid_store(monkeypatch, chroma_store):
+    monkeypatch.setattr(config, "HYBRID_RETRIEVAL", True)
+    monkeypatch.setattr(config, "HYBRID_FETCH_K", 2)
+    unit = np.eye(8)
+    chroma_store._collection.add(
+        ids=["permit", "exemption", "penalty"],
+        embeddings=[unit[0].tolist(), unit[1].tolist(), unit[2].tolist()],
+        documents=["Pozwolenie na budowę domu", "Art. 29 ust. 2 zwalnia z pozwolenia altany",
+                   "Kara umowna za zwłokę wykonawcy"],
+        metadatas=[{"source": "prawo.pdf", "page": p} for p in (1, 2, 3)])
+    build_bm25_index(chroma_store)
+    return chroma_store
+
+def test_hybrid_scores_are_embedding_relevance_even_for_bm25_only_hits(hybrid_store):
+    query = [0.9, 0.1, 0.4, 0, 0, 0, 0, 0]  # vector ranking: permit, penalty, exemption
+    result = retrieve(hybrid_store, "art. 29 ust. 2", k=3, embedding=query)
+
+    assert result.chunk_ids[-1] == "penalty"  # the fused order: found once, at rank 2
+    assert set(result.chunk_ids[:2]) == {"permit", "exemption"}  # "exemption" only via BM25
+    relevance = hybrid_store._select_relevance_score_fn()
+    vectors = dict(zip(["permit", "exemption", "penalty"], np.eye(8)[:3]))
+    for cid, score in zip(result.chunk_ids, result.scores):
+        distance = float(np.square(vectors[cid] - query).sum())  # Chroma's squared l2
+        assert score == pytest.approx(relevance(distance), abs=1e-5)
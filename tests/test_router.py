@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from ingestion.loader import embedding_model_id
+from rag import router
+import config
+
+@pytest.fixture
+def routes(monkeypatch):
+    logged = []
+    monkeypatch.setattr(router, "log_route", lambda premium, method, score, question, session_id=None:
+                        logged.append((premium, method)))
+    monkeypatch.setattr(router, "get_router", lambda: np.eye(2, dtype=np.float32))  # default x, premium y
+    monkeypatch.setattr(config, "ROUTER_MIN_MARGIN", 0.1)
+    return logged
+
+def test_fit_scores_premium_questions_above_zero():
+    vectors = [[1, 0.1], [2, 0.3], [0.1, 1], [0.2, 3]]
+    centroids = router.fit(vectors, [False, False, True, True])
+    np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0, rtol=1e-6)
+    assert list(router.scores(centroids, [[5, 1], [1, 5]]) > 0) == [False, True]
+    with pytest.raises(ValueError):
+        router.fit(vectors, [True] * 4)
+
+def test_close_calls_fall_back_to_the_keyword_list(routes):
+    assert router.route_query("What is the parking fee?", embedding=[0.1, 1.0]).premium  # clear margin
+    close = router.route_query("What is the court fee?", embedding=[1.0, 1.02])
+    assert (close.premium, close.method) == (True, "keywords")
+    assert router.route_query("Opening hours?", embedding=[1.0, 1.02]).premium is False
+    assert routes == [(True, "embedding"), (True, "keywords"), (False, "keywords")]
+
+def test_only_a_model_trained_on_query_embeddings_is_loaded(monkeypatch, tmp_path):
+    path = str(tmp_path / "router.npz")
+    monkeypatch.setattr(config, "ROUTER_ENABLED", True)
+    monkeypatch.setattr(config, "ROUTER_MODEL_PATH", path)
+    monkeypatch.setattr(router, "_embed", lambda questions: np.array(
+        [[0.1, 1.0] if "court" in q else [1.0, 0.1] for q in questions], dtype=np.float32))
+    labels = tmp_path / "labels.csv"
+    labels.write_text("question,label\nWhich court?,premium\nOpening hours?,default\n")
+    router.get_router.cache_clear()
+    try:
+        assert router.train(str(labels), path)["premium"] == 1
+        assert router.get_router() is not None
+        with open(path, "wb") as f:  # a model from before queries were embedded as queries
+            np.savez(f, centroids=np.eye(2), embedding_model=np.array(embedding_model_id()))
+        router.get_router.cache_clear()
+        assert router.get_router() is None
+    finally:
+        router.get_router.cache_clear()
@@ -0,0 +1,35 @@
+import queue
+import pytest
+from utils import session_manager as sm
+
+@pytest.fixture(autouse=True)
+def fresh_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(sm, "DB_PATH", str(tmp_path / "sessions.db"))
+    monkeypatch.setattr(sm, "_pool", queue.LifoQueue())
+    monkeypatch.setattr(sm, "_pool_created", 0)
+    monkeypatch.setattr(sm, "_initialized", False)
+    monkeypatch.setattr(sm, "_last_purge", float("inf"))  # purge only when a test asks for it
+
+def test_history_pages_back_until_it_runs_out():
+    sm.save_messages("s1", [("user" if i % 2 == 0 else "assistant", f"m{i}") for i in range(7)])
+    latest = sm.load_history("s1", limit=3)
+    assert [m["content"] for m in latest] == ["m4", "m5", "m6"]  # oldest first
+    earlier = sm.load_history("s1", limit=3, before=latest[0]["id"])
+    assert [m["content"] for m in earlier] == ["m1", "m2", "m3"]
+    rest = sm.load_history("s1", limit=3, before=earlier[0]["id"])
+    assert [m["content"] for m in rest] == ["m0"]  # a short page: history exhausted
+    assert sm.load_history("s1", limit=3, before=rest[0]["id"]) == []
+
+def test_a_new_session_starts_with_the_greeting():
+    assert sm.load_history("new") == [{"role": "assistant", "content": sm.GREETING}]
+
+def test_purge_drops_only_sessions_idle_past_the_ttl():
+    sm.save_messages("active", [("user", "hi")])
+    with sm._connection() as con, con:
+        con.executemany("INSERT INTO messages (session_id, role, content, ts) VALUES (?,?,?,datetime('now', ?))",
+                        [("stale", "user", "old", "-40 days"), ("mixed", "user", "old", "-40 days"),
+                         ("mixed", "user", "recent", "-1 days")])
+    assert sm.purge_expired_sessions(ttl_days=30) == 1
+    assert sm.load_history("stale") == [{"role": "assistant", "content": sm.GREETING}]
+    assert [m["content"] for m in sm.load_history("mixed")] == ["old", "recent"]
+    assert [m["content"] for m in sm.load_history("active")] == ["hi"]
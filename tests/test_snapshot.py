@@ -0,0 +1,53 @@
+import json, os
+import pytest
+from ingestion import loader, snapshot
+import config
+
+@pytest.fixture
+def built(monkeypatch, tmp_path, knowledge_base):
+    monkeypatch.setattr(config, "KB_SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    loader.ingest(incremental=True, source_dir=knowledge_base)
+    return snapshot.build("v1", ingest_first=False)
+
+def _tamper(version, **changes):
+    _, sidecar = snapshot._paths(version)
+    with open(sidecar) as f:
+        meta = json.load(f)
+    meta.update(changes)
+    with open(sidecar, "w") as f:
+        json.dump(meta, f)
+
+def test_an_installed_snapshot_matches_the_built_store(monkeypatch, tmp_path, built):
+    target = str(tmp_path / "deployed")
+    assert snapshot.install("v1", store_dir=target)["chunks"] == 3
+    assert snapshot.installed(target)["version"] == "v1"
+    for rel, digest in built["files"].items():
+        assert snapshot._sha256(os.path.join(target, rel)) == digest
+
+    def unpack(*args, **kwargs):
+        raise AssertionError("installed twice")
+    monkeypatch.setattr(snapshot.tarfile, "open", unpack)
+    assert snapshot.install("v1", store_dir=target)["version"] == "v1"  # a second worker: no-op
+
+def test_a_checksum_mismatch_leaves_the_installed_store_in_place(tmp_path, built):
+    target = str(tmp_path / "deployed")
+    snapshot.install("v1", store_dir=target)
+    snapshot.build("v2", ingest_first=False)
+    _tamper("v2", files={rel: "0" * 64 for rel in built["files"]})
+    with pytest.raises(RuntimeError, match="checksum mismatch for"):
+        snapshot.install("v2", store_dir=target)
+    assert snapshot.installed(target)["version"] == "v1"
+    assert not [n for n in os.listdir(tmp_path) if n.startswith(".kb-")]  # staging cleaned up
+
+    archive, _ = snapshot._paths("v2")
+    with open(archive, "ab") as f:
+        f.write(b"\0")
+    with pytest.raises(RuntimeError, match="archive checksum mismatch"):
+        snapshot.install("v2", store_dir=target)
+    assert snapshot.installed(target)["version"] == "v1"
+
+def test_a_snapshot_from_another_embedding_model_is_refused(tmp_path, built):
+    _tamper("v1", embedding_model="local:some-other-model")
+    with pytest.raises(RuntimeError, match="was built with"):
+        snapshot.install("v1", store_dir=str(tmp_path / "deployed"))
+    assert not os.path.exists(tmp_path / "deployed")
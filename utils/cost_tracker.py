@@ -1,9 +1,31 @@
-"""Lightweight cost tracker - logs token usage per query to a local CSV."""
-import csv, os
+"""
+Lightweight cost tracker - aggregated token usage per model, session and day.
+
+Every log_usage() call is queued and a background thread writes the raw events and the
+aggregate rows to SQLite in batches, so logging never blocks a request. A failed batch is
+retried WRITE_RETRIES times, then logged and dropped; the writer keeps running.
+
+get_usage() and get_total_cost() read the one aggregate row they need from the table shared
+by every process writing to DB_FILE, cached for TOTALS_REFRESH_S, plus this process's events
+that are still queued. They are O(1) no matter how long the history is, and log_usage()
+never touches the database; another process's usage shows up within TOTALS_REFRESH_S.
+Token counts should come from the LLM response (usage_from_message); count_tokens() is the
+tiktoken fallback. Query-router decisions (log_route) go through the same queue.
+"""
+import atexit, csv, logging, os, queue, sqlite3, threading, time
 from datetime import datetime
+from utils.tracing import count, traced
 
-LOG_FILE = "./logs/usage_log.csv"
-os.makedirs("./logs", exist_ok=True)
+LOG_DIR    = "./logs"
+DB_FILE    = os.path.join(LOG_DIR, "usage.db")
+LEGACY_CSV = os.path.join(LOG_DIR, "usage_log.csv")
+os.makedirs(LOG_DIR, exist_ok=True)
+
+FLUSH_INTERVAL_S = 1.0
+FLUSH_BATCH      = 200
+FLUSH_TIMEOUT_S  = 10.0
+WRITE_RETRIES    = 3
+TOTALS_REFRESH_S = 2.0
 
 PRICING = {
     "gpt-4o-mini": {"input": 0.15, "output": 0.60},
@@ -11,32 +33,274 @@ PRICING = {
     "text-embedding-3-small": {"input": 0.02, "output": 0.0},
 }
 
-def log_usage(model, input_tokens, output_tokens, query_preview=""):
+logger = logging.getLogger(__name__)
+
+_lock      = threading.Lock()
+_totals    = {}    # (scope, key) -> [[requests, input_tokens, output_tokens, cost_usd], rowid, read_at]
+_pending   = {}    # (scope, key) -> [requests, ...]: this process's events queued but not yet written
+_db_lock   = threading.Lock()
+_initialized = False
+_queue     = queue.Queue()
+_writer    = None
+
+# ── Token counting ────────────────────────────────────────────────────────
+def usage_from_message(message):
+    """(input_tokens, output_tokens) reported by the provider, or None if absent."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+def _encoding(model: str):
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(model: str, *texts: str) -> int:
+    enc = _encoding(model)
+    return sum(len(enc.encode(t)) for t in texts if t)
+
+def truncate_tokens(model: str, text: str, max_tokens: int) -> str:
+    """`text` cut to its first `max_tokens` tokens."""
+    enc = _encoding(model)
+    tokens = enc.encode(text)
+    return text if len(tokens) <= max_tokens else enc.decode(tokens[:max_tokens])
+
+# ── Storage ───────────────────────────────────────────────────────────────
+def _init_db():
+    con = sqlite3.connect(DB_FILE, timeout=10)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS usage_events (
+            timestamp TEXT, model TEXT, session_id TEXT,
+            input_tokens INTEGER, output_tokens INTEGER, cost_usd REAL, query_preview TEXT
+        );
+        CREATE TABLE IF NOT EXISTS usage_totals (
+            scope TEXT, key TEXT,
+            requests INTEGER, input_tokens INTEGER, output_tokens INTEGER, cost_usd REAL,
+            PRIMARY KEY (scope, key)
+        );
+        CREATE TABLE IF NOT EXISTS route_events (
+            timestamp TEXT, session_id TEXT, method TEXT, premium INTEGER, score REAL, query_preview TEXT
+        );
+    """)
+    if os.path.exists(LEGACY_CSV) and not con.execute("SELECT 1 FROM usage_totals LIMIT 1").fetchone():
+        _import_legacy_csv(con)
+    con.close()
+
+def _connect():
+    global _initialized
+    with _db_lock:
+        if not _initialized:
+            _init_db()
+            _initialized = True
+    return sqlite3.connect(DB_FILE, timeout=10)
+
+def _scopes(model, session_id, day):
+    keys = [("all", "all"), ("model", model), ("day", day)]
+    if session_id:
+        keys.append(("session", session_id))
+    return keys
+
+def _import_legacy_csv(con):
+    """One-time fold of the old CSV log into the aggregate table."""
+    totals = {}
+    with open(LEGACY_CSV, newline="") as f:
+        for row in csv.DictReader(f):
+            model, day = row.get("model", ""), row.get("timestamp", "")[:10]
+            delta = (1, int(row.get("input_tokens") or 0), int(row.get("output_tokens") or 0),
+                     float(row.get("cost_usd") or 0))
+            for key in _scopes(model, None, day):
+                totals[key] = [a + b for a, b in zip(totals.get(key, [0, 0, 0, 0.0]), delta)]
+    con.executemany("INSERT OR REPLACE INTO usage_totals VALUES (?,?,?,?,?,?)",
+                    [(s, k, *v) for (s, k), v in totals.items()])
+    con.commit()
+
+def _read_totals(where: str, params) -> tuple:
+    """({(scope, key): row} matching `where`, the last usage_events rowid they include)."""
+    con = _connect()
+    try:
+        con.execute("BEGIN")  # one read snapshot for both queries
+        rows = {(s, k): [r, i, o, c] for s, k, r, i, o, c in
+                con.execute(f"SELECT * FROM usage_totals WHERE {where}", params).fetchall()}
+        rowid = con.execute("SELECT COALESCE(MAX(rowid), 0) FROM usage_events").fetchone()[0]
+        con.rollback()
+    finally:
+        con.close()
+    return rows, rowid
+
+def _cache(rows: dict, keys, rowid: int):
+    """Keep freshly read rows unless a newer write was already folded into the cache. Hold _lock."""
+    now = time.monotonic()
+    for key in keys:
+        entry = _totals.get(key)
+        if entry is None or entry[1] <= rowid:
+            _totals[key] = [rows.get(key, [0, 0, 0, 0.0]), rowid, now]
+
+def _add(totals, events, sign=1):
+    for timestamp, model, session_id, input_tokens, output_tokens, cost, _ in events:
+        for key in _scopes(model, session_id, timestamp[:10]):
+            row = totals.setdefault(key, [0, 0, 0, 0.0])
+            row[0] += sign
+            row[1] += sign * input_tokens
+            row[2] += sign * output_tokens
+            row[3] += sign * cost
+            if sign < 0 and not row[0]:
+                del totals[key]
+
+def _with_pending(key):
+    """Cached row plus this process's unwritten events. Hold _lock."""
+    return [a + b for a, b in zip(_totals[key][0], _pending.get(key, [0, 0, 0, 0.0]))]
+
+def _current(key):
+    with _lock:
+        entry = _totals.get(key)
+        if entry and time.monotonic() - entry[2] < TOTALS_REFRESH_S:
+            return _with_pending(key)
+    rows, rowid = _read_totals("scope = ? AND key = ?", key)
+    with _lock:
+        _cache(rows, [key], rowid)
+        return _with_pending(key)
+
+@traced("usage.write_batch")
+def _write_batch(con, events, routes=()):
+    con.executemany("INSERT INTO route_events VALUES (?,?,?,?,?,?)", routes)
+    con.executemany("INSERT INTO usage_events VALUES (?,?,?,?,?,?,?)", events)
+    con.executemany("""
+        INSERT INTO usage_totals VALUES (?,?,1,?,?,?)
+        ON CONFLICT(scope, key) DO UPDATE SET
+            requests = requests + 1,
+            input_tokens = input_tokens + excluded.input_tokens,
+            output_tokens = output_tokens + excluded.output_tokens,
+            cost_usd = cost_usd + excluded.cost_usd
+    """, [(scope, key, e[3], e[4], e[5])
+          for e in events for scope, key in _scopes(e[1], e[2], e[0][:10])])
+    rowid = con.execute("SELECT COALESCE(MAX(rowid), 0) FROM usage_events").fetchone()[0]
+    con.commit()
+    return rowid
+
+def _write(con, batch, routes):
+    """Write one batch, retrying WRITE_RETRIES times; a batch that still fails is dropped."""
+    for attempt in range(1, WRITE_RETRIES + 1):
+        try:
+            rowid = _write_batch(con, batch, routes)
+            written = True
+            break
+        except Exception as e:
+            try:
+                con.rollback()
+            except sqlite3.Error:
+                pass
+            if attempt == WRITE_RETRIES:
+                logger.error("Dropping %d usage and %d route events after %d failed writes to %s: %s",
+                             len(batch), len(routes), attempt, DB_FILE, e)
+                written = False
+            else:
+                logger.warning("Usage write to %s failed (attempt %d/%d): %s", DB_FILE, attempt, WRITE_RETRIES, e)
+                time.sleep(FLUSH_INTERVAL_S * attempt)
+    deltas = {}
+    _add(deltas, batch)
+    with _lock:
+        _add(_pending, batch, sign=-1)
+        for key, delta in deltas.items() if written else ():
+            entry = _totals.get(key)
+            if entry and entry[1] < rowid:  # the cached row was read before this commit
+                entry[0] = [a + b for a, b in zip(entry[0], delta)]
+                entry[1] = rowid
+
+def _writer_loop():
+    con = _connect()
+    while True:
+        events = [_queue.get()]
+        try:
+            while len(events) < FLUSH_BATCH:
+                events.append(_queue.get(timeout=FLUSH_INTERVAL_S))
+        except queue.Empty:
+            pass
+        try:
+            batch  = [row for kind, row in filter(None, events) if kind == "usage"]
+            routes = [row for kind, row in filter(None, events) if kind == "route"]
+            if batch or routes:
+                _write(con, batch, routes)
+        finally:
+            for _ in events:
+                _queue.task_done()
+
+def _ensure_writer():
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        with _lock:
+            if _writer is None or not _writer.is_alive():
+                _writer = threading.Thread(target=_writer_loop, name="usage-writer", daemon=True)
+                _writer.start()
+
+def flush(timeout: float = FLUSH_TIMEOUT_S) -> bool:
+    """Wait until every queued event is written or dropped; False on timeout or with no live writer."""
+    if _writer is None or not _writer.is_alive():
+        return not _queue.unfinished_tasks
+    _queue.put(None)
+    deadline = time.monotonic() + timeout
+    with _queue.all_tasks_done:
+        while _queue.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _queue.all_tasks_done.wait(remaining)
+    return True
+
+atexit.register(flush)
+
+# ── Public API ────────────────────────────────────────────────────────────
+def log_usage(model, input_tokens, output_tokens, query_preview="", session_id=None):
     cost = (
         (input_tokens / 1_000_000) * PRICING.get(model, {}).get("input", 0) +
         (output_tokens / 1_000_000) * PRICING.get(model, {}).get("output", 0)
     )
-    row = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "model": model,
-        "input_tokens": input_tokens,
-        "output_tokens": output_tokens,
-        "cost_usd": round(cost, 6),
-        "query_preview": query_preview[:80]
-    }
-    file_exists = os.path.exists(LOG_FILE)
-    with open(LOG_FILE, "a", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=row.keys())
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(row)
+    event = (datetime.utcnow().isoformat(), model, session_id, input_tokens, output_tokens,
+             round(cost, 6), query_preview[:80])
+    with _lock:
+        _add(_pending, [event])
+    count("llm_tokens", input_tokens, model=model, kind="input")
+    count("llm_tokens", output_tokens, model=model, kind="output")
+    _ensure_writer()
+    _queue.put(("usage", event))
     return cost
 
+def log_route(premium, method, score=None, query_preview="", session_id=None):
+    """Record one routing decision: premium or default model, by "embedding" or "keywords"."""
+    count("route_decisions", method=method, model="premium" if premium else "default")
+    _ensure_writer()
+    _queue.put(("route", (datetime.utcnow().isoformat(), session_id, method, int(premium),
+                          None if score is None else round(score, 4), query_preview[:80])))
+
+def get_routing() -> dict:
+    """Decisions so far per method: count, premium share and mean score."""
+    flush()
+    con = _connect()
+    rows = con.execute("SELECT method, COUNT(*), AVG(premium), AVG(score) FROM route_events "
+                       "GROUP BY method").fetchall()
+    con.close()
+    return {method: {"requests": n, "premium_rate": round(rate, 3),
+                     "mean_score": None if score is None else round(score, 4)}
+            for method, n, rate, score in rows}
+
+def get_usage(scope="all", key="all") -> dict:
+    """Running totals for one model / session / day (YYYY-MM-DD), or overall."""
+    requests, input_tokens, output_tokens, cost = _current((scope, key))
+    return {"requests": requests, "input_tokens": input_tokens,
+            "output_tokens": output_tokens, "cost_usd": round(cost, 6)}
+
+def get_usage_by(scope) -> dict:
+    """Totals for every key of one scope; reads that scope's rows, so it grows with them."""
+    rows, rowid = _read_totals("scope = ?", (scope,))
+    with _lock:
+        keys = sorted({key for s, key in [*rows, *_pending] if s == scope})
+        _cache(rows, [(scope, key) for key in keys], rowid)
+        totals = {key: _with_pending((scope, key)) for key in keys}
+    return {key: {"requests": r, "input_tokens": i, "output_tokens": o, "cost_usd": round(c, 6)}
+            for key, (r, i, o, c) in totals.items()}
+
 def get_total_cost():
-    if not os.path.exists(LOG_FILE):
-        return 0.0
-    total = 0.0
-    with open(LOG_FILE, "r") as f:
-        for row in csv.DictReader(f):
-            total += float(row.get("cost_usd", 0))
-    return round(total, 4)
+    return round(get_usage()["cost_usd"], 4)
@@ -2,14 +2,38 @@
 Per-user session manager.
 Uses st.session_state for runtime isolation (each browser tab = unique state).
 Persists chat history to SQLite in /tmp (survives page refreshes within a deployment).
+
+The schema is created once per process. Connections come from a small thread-safe pool,
+run in WAL mode so readers never block the writer, and history is read through an index
+on (session_id, ts). Sessions idle for longer than SESSION_TTL_DAYS are purged.
 """
-import sqlite3, uuid, os
+import queue, sqlite3, threading, time, uuid, os
+from contextlib import contextmanager
+from typing import List, Tuple
 import streamlit as st
+from utils.tracing import traced
+
+DB_PATH           = "/tmp/buildit_sessions.db"
+POOL_SIZE         = 4
+HISTORY_PAGE_SIZE = 50
+SESSION_TTL_DAYS  = 30
+PURGE_INTERVAL_S  = 3600
 
-DB_PATH = "/tmp/buildit_sessions.db"
+GREETING = (
+    "Hi! I am **BuildIt**, your AI assistant for construction "
+    "and renovation in Poland.\n\n"
+    "Ask me anything — permits, timelines, contractor tips, renovation steps."
+)
+
+_pool = queue.LifoQueue()
+_pool_lock = threading.Lock()
+_pool_created = 0
+_initialized = False
+_last_purge = 0.0
 
 def _init_db():
     con = sqlite3.connect(DB_PATH)
+    con.execute("PRAGMA journal_mode=WAL")
     con.execute("""
         CREATE TABLE IF NOT EXISTS messages (
             session_id TEXT,
@@ -18,46 +42,91 @@ def _init_db():
             ts DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_ts ON messages(session_id, ts)")
     con.commit()
     con.close()
 
+@contextmanager
+def _connection():
+    """Borrow a pooled connection; the schema is initialised by the first caller only."""
+    global _pool_created, _initialized
+    try:
+        con = _pool.get_nowait()
+    except queue.Empty:
+        with _pool_lock:
+            if not _initialized:
+                _init_db()
+                _initialized = True
+            if _pool_created < POOL_SIZE:
+                _pool_created += 1
+                con = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
+                con.execute("PRAGMA synchronous=NORMAL")
+            else:
+                con = None
+        if con is None:
+            con = _pool.get()
+    try:
+        yield con
+    finally:
+        _pool.put(con)
+
 def get_session_id() -> str:
     if "session_id" not in st.session_state:
         st.session_state["session_id"] = str(uuid.uuid4())
     return st.session_state["session_id"]
 
-def load_history(session_id: str) -> list:
-    _init_db()
-    con = sqlite3.connect(DB_PATH)
-    rows = con.execute(
-        "SELECT role, content FROM messages WHERE session_id=? ORDER BY ts",
-        (session_id,)
-    ).fetchall()
-    con.close()
-    if not rows:
-        return [{
-            "role": "assistant",
-            "content": (
-                "Hi! I am **BuildIt**, your AI assistant for construction "
-                "and renovation in Poland.\n\n"
-                "Ask me anything — permits, timelines, contractor tips, renovation steps."
+@traced("session.load")
+def load_history(session_id: str, limit: int = HISTORY_PAGE_SIZE, before: int = None) -> list:
+    """
+    The `limit` most recent messages (oldest first), each with its row "id".
+    Pass the smallest id already shown as `before` to page further back.
+    """
+    query = "SELECT rowid, role, content FROM messages WHERE session_id=?"
+    params = [session_id]
+    if before is not None:
+        query += " AND rowid<?"
+        params.append(before)
+    query += " ORDER BY ts DESC, rowid DESC"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    with _connection() as con:
+        rows = con.execute(query, params).fetchall()
+    if not rows and before is None:
+        return [{"role": "assistant", "content": GREETING}]
+    return [{"id": i, "role": r, "content": c} for i, r, c in reversed(rows)]
+
+@traced("session.save")
+def save_messages(session_id: str, messages: List[Tuple[str, str]]):
+    """Write several (role, content) messages in one transaction."""
+    with _connection() as con:
+        with con:
+            con.executemany(
+                "INSERT INTO messages (session_id, role, content) VALUES (?,?,?)",
+                [(session_id, role, content) for role, content in messages]
             )
-        }]
-    return [{"role": r, "content": c} for r, c in rows]
+    if time.time() - _last_purge > PURGE_INTERVAL_S:
+        purge_expired_sessions()
 
 def save_message(session_id: str, role: str, content: str):
-    _init_db()
-    con = sqlite3.connect(DB_PATH)
-    con.execute(
-        "INSERT INTO messages (session_id, role, content) VALUES (?,?,?)",
-        (session_id, role, content)
-    )
-    con.commit()
-    con.close()
+    save_messages(session_id, [(role, content)])
 
+@traced("session.clear")
 def clear_session(session_id: str):
-    _init_db()
-    con = sqlite3.connect(DB_PATH)
-    con.execute("DELETE FROM messages WHERE session_id=?", (session_id,))
-    con.commit()
-    con.close()
+    with _connection() as con:
+        with con:
+            con.execute("DELETE FROM messages WHERE session_id=?", (session_id,))
+
+def purge_expired_sessions(ttl_days: int = SESSION_TTL_DAYS) -> int:
+    """Delete every session whose latest message is older than ttl_days."""
+    global _last_purge
+    _last_purge = time.time()
+    with _connection() as con:
+        with con:
+            cur = con.execute("""
+                DELETE FROM messages WHERE session_id IN (
+                    SELECT session_id FROM messages
+                    GROUP BY session_id HAVING MAX(ts) < datetime('now', ?)
+                )
+            """, (f"-{int(ttl_days)} days",))
+    return cur.rowcount
@@ -0,0 +1,133 @@
+"""
+Lightweight in-process tracing for the hot paths.
+
+    with span("session.save"): ...          # time a block
+    @traced("analyze.summarize")            # time every call
+    observe("ask.llm", seconds)             # record a duration measured elsewhere
+    count("cache_requests", cache="answer", result="hit")
+
+Durations go into a bounded reservoir per span (the most recent RESERVOIR samples), from
+which snapshot() computes p50/p95/p99; counters carry token counts and cache hits/misses.
+prometheus_text() renders both in the Prometheus text format for api.py's /metrics.
+
+With TRACING_ENABLED off, span() returns a shared no-op context manager and every other
+call returns after a single flag check.
+"""
+import threading, time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+import config
+
+RESERVOIR = 2048
+
+_enabled  = config.TRACING_ENABLED
+_lock     = threading.Lock()
+_samples  = defaultdict(lambda: deque(maxlen=RESERVOIR))  # span -> recent durations (s)
+_totals   = defaultdict(lambda: [0, 0.0])                 # span -> [count, sum seconds]
+_counters = defaultdict(float)                            # (name, labels) -> value
+_NOOP     = nullcontext()
+
+def enabled() -> bool:
+    return _enabled
+
+def set_enabled(on: bool):
+    global _enabled
+    _enabled = on
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _counters.clear()
+
+# ── Recording ─────────────────────────────────────────────────────────────
+def observe(name: str, seconds: float):
+    if not _enabled or seconds is None:
+        return
+    with _lock:
+        _samples[name].append(seconds)
+        total = _totals[name]
+        total[0] += 1
+        total[1] += seconds
+
+@contextmanager
+def _timed(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0)
+
+def span(name: str):
+    return _timed(name) if _enabled else _NOOP
+
+def traced(name: str):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - t0)
+        return wrapper
+    return decorator
+
+def count(name: str, value: float = 1, **labels):
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] += value
+
+# ── Reporting ─────────────────────────────────────────────────────────────
+def _quantile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def snapshot() -> dict:
+    """Span percentiles (ms), counters and derived cache hit rates."""
+    with _lock:
+        samples  = {name: sorted(values) for name, values in _samples.items()}
+        totals   = {name: tuple(t) for name, t in _totals.items()}
+        counters = dict(_counters)
+    spans = {name: {"count": totals[name][0],
+                    "mean_ms": round(totals[name][1] / totals[name][0] * 1000, 2),
+                    **{f"p{int(q * 100)}_ms": round(_quantile(values, q) * 1000, 2)
+                       for q in (0.5, 0.95, 0.99)}}
+             for name, values in sorted(samples.items()) if values}
+    caches = defaultdict(lambda: {"hit": 0, "miss": 0})
+    for (name, labels), value in counters.items():
+        labels = dict(labels)
+        if name == "cache_requests":
+            caches[labels["cache"]][labels["result"]] += int(value)
+    hit_rates = {cache: {**c, "hit_rate": round(c["hit"] / (c["hit"] + c["miss"]), 3)}
+                 for cache, c in sorted(caches.items()) if c["hit"] + c["miss"]}
+    return {"enabled": _enabled, "spans": spans, "caches": hit_rates,
+            "counters": {name + "".join(f"{{{k}={v}}}" for k, v in labels): value
+                         for (name, labels), value in sorted(counters.items())}}
+
+def _labels(pairs) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+def prometheus_text() -> str:
+    with _lock:
+        samples  = {name: sorted(values) for name, values in _samples.items()}
+        totals   = {name: tuple(t) for name, t in _totals.items()}
+        counters = dict(_counters)
+    lines = ["# HELP buildit_span_seconds Latency of instrumented operations (recent samples).",
+             "# TYPE buildit_span_seconds summary"]
+    for name, values in sorted(samples.items()):
+        for q in (0.5, 0.95, 0.99):
+            lines.append(f"buildit_span_seconds{_labels([('span', name), ('quantile', q)])} "
+                         f"{_quantile(values, q):.6f}")
+        lines.append(f"buildit_span_seconds_count{_labels([('span', name)])} {totals[name][0]}")
+        lines.append(f"buildit_span_seconds_sum{_labels([('span', name)])} {totals[name][1]:.6f}")
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE buildit_{name}_total counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"buildit_{name}_total{_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"